@@ -1,10 +1,11 @@
 import app.features.backtesting.models  # noqa: F401
+import app.features.blobs.models  # noqa: F401
 import app.features.datasources.models  # noqa: F401
 import app.features.strategies.models  # noqa: F401
 
-from .base import Base
+from .migrations import migrate
 from .session import engine
 
 
 def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+    migrate(engine)
@@ -0,0 +1,50 @@
+import enum
+import logging
+
+from sqlalchemy import Column, Engine, inspect, literal, text
+
+from .base import Base
+
+logger = logging.getLogger(__name__)
+
+
+def _default_literal(engine: Engine, column: Column) -> str | None:
+    # 既存の行を埋めるため、Python 側の固定の既定値を DDL の DEFAULT に変換する
+    default = column.default
+    if default is None or not default.is_scalar:
+        return None
+    value = default.arg
+    if isinstance(value, enum.Enum):
+        value = value.name
+    return str(
+        literal(value, type_=column.type).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    )
+
+
+def _add_column_ddl(engine: Engine, table_name: str, column: Column) -> str:
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+    default = _default_literal(engine, column)
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def migrate(engine: Engine) -> None:
+    # 新しいテーブルを作成し、既存のテーブルには不足している列とインデックスを追加する
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    logger.info(f"[Migration] Adding column {table.name}.{column.name}")
+                    conn.execute(text(_add_column_ddl(engine, table.name, column)))
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    logger.info(f"[Migration] Creating index {index.name}")
+                    index.create(bind=conn)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.features.datasources.models import DataChunk
+from app.features.strategies.models import StrategyVersion
+from app.services.market_data import to_utc_naive
+
+from .models import BacktestCacheStats, BacktestResultCache, BacktestRun
+
+STATS_ID = 1
+
+
+def get_cache_max_entries() -> int:
+    # 0 でキャッシュを無効化
+    return int(os.getenv("BACKTEST_CACHE_MAX_ENTRIES", "1000"))
+
+
+def chunk_versions(db: Session, data_source_id: UUID, start: datetime, end: datetime) -> list[list[str | int]]:
+    rows = (
+        db.query(DataChunk.id, DataChunk.version)
+        .filter(
+            DataChunk.data_source_id == data_source_id,
+            DataChunk.is_active.is_(True),
+            DataChunk.start_time <= to_utc_naive(end),
+            DataChunk.end_time >= to_utc_naive(start),
+        )
+        .order_by(DataChunk.start_time, DataChunk.id)
+        .all()
+    )
+    return [[str(chunk_id), version] for chunk_id, version in rows]
+
+
+def strategy_source(strategy_version: StrategyVersion) -> str:
+    # テンプレートだけの戦略（ベクトル化エンジンで実行）も区別できるよう両方を含める
+    return json.dumps(
+        {"code": strategy_version.generated_code, "template": strategy_version.template_json},
+        sort_keys=True,
+    )
+
+
+def compute_cache_key(
+    db: Session,
+    code: str,
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    parameters: dict,
+) -> str:
+    # チャンクが再バージョンされるとキーが変わり、古い結果は参照されなくなる
+    payload = {
+        "code": hashlib.sha256(code.encode()).hexdigest(),
+        "data_source_id": str(data_source_id),
+        "timeframe": timeframe,
+        "start": to_utc_naive(start).isoformat(),
+        "end": to_utc_naive(end).isoformat(),
+        "parameters": parameters,
+        "chunks": chunk_versions(db, data_source_id, start, end),
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _increment(db: Session, field: str, n: int) -> int:
+    column = getattr(BacktestCacheStats, field)
+    return (
+        db.query(BacktestCacheStats)
+        .filter(BacktestCacheStats.id == STATS_ID)
+        .update({column: column + n}, synchronize_session=False)
+    )
+
+
+def _count(db: Session, field: str, n: int = 1) -> None:
+    # 加算は UPDATE 1回で行い、行がないときだけセーブポイント内で作成する
+    # （別のワーカーが先に作成して一意制約違反になったら、セーブポイントだけ戻して加算し直す）
+    if _increment(db, field, n):
+        return
+    try:
+        with db.begin_nested():
+            counts = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, field: n}
+            db.add(BacktestCacheStats(id=STATS_ID, **counts))
+    except IntegrityError:
+        _increment(db, field, n)
+
+
+def lookup_result(db: Session, cache_key: str) -> BacktestResultCache | None:
+    if get_cache_max_entries() <= 0:
+        return None
+    entry = db.get(BacktestResultCache, cache_key)
+    if entry is not None and db.get(BacktestRun, entry.backtest_id) is None:
+        # 出力を持つ元の実行が削除されている場合は使えない
+        db.delete(entry)
+        entry = None
+    if entry is None:
+        _count(db, "misses")
+        return None
+    entry.hit_count += 1
+    entry.last_accessed_at = datetime.now()
+    _count(db, "hits")
+    return entry
+
+
+def store_result(
+    db: Session,
+    cache_key: str,
+    data_source_id: UUID,
+    result_summary: dict | None,
+    backtest_id: UUID,
+) -> None:
+    max_entries = get_cache_max_entries()
+    if max_entries <= 0:
+        return
+    entry = db.get(BacktestResultCache, cache_key)
+    if entry is None:
+        entry = BacktestResultCache(cache_key=cache_key, data_source_id=data_source_id, hit_count=0)
+        db.add(entry)
+    entry.result_summary = result_summary
+    entry.backtest_id = backtest_id
+    entry.last_accessed_at = datetime.now()
+    db.flush()
+    evict(db, max_entries)
+
+
+def evict(db: Session, max_entries: int) -> int:
+    # 最終参照日時が古いものから上限を超えた分を削除（LRU）
+    overflow = db.query(BacktestResultCache).count() - max_entries
+    if overflow <= 0:
+        return 0
+    stale = (
+        db.query(BacktestResultCache.cache_key)
+        .order_by(BacktestResultCache.last_accessed_at)
+        .limit(overflow)
+        .subquery()
+    )
+    deleted = (
+        db.query(BacktestResultCache)
+        .filter(BacktestResultCache.cache_key.in_(db.query(stale.c.cache_key)))
+        .delete(synchronize_session=False)
+    )
+    _count(db, "evictions", deleted)
+    return deleted
+
+
+def invalidate_data_source(db: Session, data_source_id: UUID) -> int:
+    # チャンクの追加・差し替え時に呼び出し、該当データソースの結果を破棄する
+    deleted = (
+        db.query(BacktestResultCache)
+        .filter(BacktestResultCache.data_source_id == data_source_id)
+        .delete(synchronize_session=False)
+    )
+    if deleted:
+        _count(db, "invalidations", deleted)
+    return deleted
+
+
+def get_cache_stats(db: Session) -> dict:
+    stats = db.get(BacktestCacheStats, STATS_ID)
+    hits = stats.hits if stats else 0
+    misses = stats.misses if stats else 0
+    return {
+        "entries": db.query(BacktestResultCache).count(),
+        "max_entries": get_cache_max_entries(),
+        "hits": hits,
+        "misses": misses,
+        "evictions": stats.evictions if stats else 0,
+        "invalidations": stats.invalidations if stats else 0,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+    }
@@ -1,13 +1,16 @@
+from collections.abc import Iterator
 from datetime import datetime
 from uuid import UUID
 
 from sqlalchemy.orm import Session
 
 from app.features.strategies.models import StrategyVersion
-from app.workers.task_queue import enqueue_backtest
+from app.workers.datasets import remove_shared_dataset
+from app.workers.task_queue import enqueue_backtest, enqueue_backtests
 
-from .models import BacktestRun
-from .schemas import BacktestRequest, BacktestStatus
+from . import cache, logic
+from .models import BacktestChartPoint, BacktestRun, BacktestTrade, OptimizationRun, WalkForwardRun
+from .schemas import BacktestRequest, BacktestStatus, OptimizationRequest, WalkForwardRequest
 
 
 def create_backtest_run(request_data: BacktestRequest, db: Session) -> BacktestRun:
@@ -29,14 +32,36 @@ def create_backtest_run(request_data: BacktestRequest, db: Session) -> BacktestR
         timeframe=request_data.timeframe,
         start_time=request_data.startTime,
         end_time=request_data.endTime,
+        cache_key=cache.compute_cache_key(
+            db,
+            cache.strategy_source(strategy_version),
+            request_data.dataSourceId,
+            request_data.timeframe,
+            request_data.startTime,
+            request_data.endTime,
+            logic.with_default_parameters(request_data.parameters),
+        ),
     )
 
+    # 同一条件の結果がキャッシュにあれば実行せずに完了とする
+    cached = cache.lookup_result(db, bt.cache_key)
+    if cached:
+        bt.status = BacktestStatus.success
+        bt.completed_at = datetime.now()
+        bt.result_summary = cached.result_summary
+        # 取引・チャートはコピーせず元の実行の出力を参照する
+        source = db.get(BacktestRun, cached.backtest_id)
+        bt.output_run_id = source.output_id
+        bt.trade_count = source.trade_count
+        bt.chart_point_count = source.chart_point_count
+
     db.add(bt)
     db.commit()
     db.refresh(bt)
 
-    # 非同期処理を実行するならここでキューに追加する処理（Celery / Azure Queue など）
-    enqueue_backtest(bt.id)
+    # DBのタスクキューに登録し、待機中のワーカーに通知する
+    if not cached:
+        enqueue_backtest(bt.id, request_data.priority, db)
 
     return bt
 
@@ -45,6 +70,35 @@ def get_backtest_run(backtest_id: UUID, db: Session) -> BacktestRun | None:
     return db.query(BacktestRun).filter(BacktestRun.id == backtest_id).first()
 
 
+def get_backtest_outputs(bt: BacktestRun, kind: str, offset: int, limit: int, db: Session) -> tuple[int, list]:
+    # 旧形式（JSON列に全件保存）の実行はそのまま切り出す
+    legacy = bt.log if kind == "trades" else bt.chart_data
+    if legacy is not None:
+        return len(legacy), list(legacy[offset : offset + limit])
+
+    table = BacktestTrade if kind == "trades" else BacktestChartPoint
+    total = bt.trade_count if kind == "trades" else bt.chart_point_count
+    rows = (
+        db.query(table.data)
+        .filter(table.backtest_id == bt.output_id, table.seq >= offset, table.seq < offset + limit)
+        .order_by(table.seq)
+        .all()
+    )
+    return total, [row.data for row in rows]
+
+
+def iter_backtest_chart(bt: BacktestRun, db: Session) -> Iterator[dict]:
+    if bt.chart_data is not None:
+        return iter(bt.chart_data)
+    return (
+        row.data
+        for row in db.query(BacktestChartPoint.data)
+        .filter(BacktestChartPoint.backtest_id == bt.output_id)
+        .order_by(BacktestChartPoint.seq)
+        .yield_per(1000)
+    )
+
+
 def get_backtest_status(backtest_id: UUID, db: Session):
     bt = db.query(BacktestRun).filter(BacktestRun.id == backtest_id).first()
     if not bt:
@@ -78,3 +132,179 @@ def update_backtest_result(
     db.commit()
     db.refresh(bt)
     return bt
+
+
+def create_optimization_run(request_data: OptimizationRequest, db: Session) -> OptimizationRun:
+    strategy_version = (
+        db.query(StrategyVersion)
+        .filter(StrategyVersion.id == request_data.strategyVersionId)
+        .first()
+    )
+    if not strategy_version:
+        raise ValueError("Strategy version not found")
+
+    combinations = logic.build_combinations(request_data)
+
+    opt = OptimizationRun(
+        strategy_version_id=request_data.strategyVersionId,
+        status=BacktestStatus.pending,
+        data_source_id=request_data.dataSourceId,
+        timeframe=request_data.timeframe,
+        start_time=request_data.startTime,
+        end_time=request_data.endTime,
+        parameter_space=request_data.model_dump(
+            mode="json", include={"parameters", "parameterRanges", "combinations"}
+        ),
+        combination_count=len(combinations),
+        objective=request_data.objective,
+        maximize=request_data.maximize,
+    )
+    db.add(opt)
+    db.flush()
+
+    # 組み合わせごとに BacktestRun を作成（データはワーカー側で1度だけ準備して共有する）
+    runs = [
+        BacktestRun(
+            strategy_version_id=request_data.strategyVersionId,
+            status=BacktestStatus.pending,
+            started_at=datetime.now(),
+            parameters=params,
+            data_source_id=request_data.dataSourceId,
+            timeframe=request_data.timeframe,
+            start_time=request_data.startTime,
+            end_time=request_data.endTime,
+            optimization_id=opt.id,
+        )
+        for params in combinations
+    ]
+    db.add_all(runs)
+    db.commit()
+    db.refresh(opt)
+
+    enqueue_backtests([run.id for run in runs], request_data.priority, db)
+
+    return opt
+
+
+def get_optimization_run(optimization_id: UUID, db: Session) -> OptimizationRun | None:
+    return db.query(OptimizationRun).filter(OptimizationRun.id == optimization_id).first()
+
+
+def refresh_optimization_status(opt: OptimizationRun, db: Session) -> OptimizationRun:
+    if opt.status in (BacktestStatus.success, BacktestStatus.failed):
+        return opt
+
+    opt.status, opt.completed_at = logic.derive_group_status(opt.runs)
+    if opt.completed_at is not None:
+        remove_shared_dataset(f"opt_{opt.id}")
+    db.commit()
+    db.refresh(opt)
+    return opt
+
+
+def create_walk_forward_run(request_data: WalkForwardRequest, db: Session) -> WalkForwardRun:
+    strategy_version = (
+        db.query(StrategyVersion)
+        .filter(StrategyVersion.id == request_data.strategyVersionId)
+        .first()
+    )
+    if not strategy_version:
+        raise ValueError("Strategy version not found")
+
+    step = request_data.stepPeriod or request_data.outOfSamplePeriod
+    windows = logic.build_walk_forward_windows(
+        request_data.startTime,
+        request_data.endTime,
+        request_data.inSamplePeriod,
+        request_data.outOfSamplePeriod,
+        step,
+        request_data.anchored,
+    )
+
+    wf = WalkForwardRun(
+        strategy_version_id=request_data.strategyVersionId,
+        status=BacktestStatus.pending,
+        parameters=request_data.parameters,
+        data_source_id=request_data.dataSourceId,
+        timeframe=request_data.timeframe,
+        start_time=request_data.startTime,
+        end_time=request_data.endTime,
+        in_sample_period=request_data.inSamplePeriod,
+        out_of_sample_period=request_data.outOfSamplePeriod,
+        step_period=step,
+        anchored=request_data.anchored,
+        window_count=len(windows),
+    )
+    db.add(wf)
+    db.flush()
+
+    # ウィンドウごとにインサンプル・アウトオブサンプルの BacktestRun を作成し、並列に実行する
+    runs = []
+    for index, (is_start, is_end, oos_start, oos_end) in enumerate(windows):
+        for sample, start, end in (("in_sample", is_start, is_end), ("out_of_sample", oos_start, oos_end)):
+            runs.append(
+                BacktestRun(
+                    strategy_version_id=request_data.strategyVersionId,
+                    status=BacktestStatus.pending,
+                    started_at=datetime.now(),
+                    parameters=request_data.parameters,
+                    data_source_id=request_data.dataSourceId,
+                    timeframe=request_data.timeframe,
+                    start_time=start,
+                    end_time=end,
+                    walk_forward_id=wf.id,
+                    window_index=index,
+                    sample=sample,
+                )
+            )
+    db.add_all(runs)
+    db.commit()
+    db.refresh(wf)
+
+    enqueue_backtests([run.id for run in runs], request_data.priority, db)
+
+    return wf
+
+
+def get_walk_forward_run(walk_forward_id: UUID, db: Session) -> WalkForwardRun | None:
+    return db.query(WalkForwardRun).filter(WalkForwardRun.id == walk_forward_id).first()
+
+
+def get_walk_forward_windows(wf: WalkForwardRun) -> list[dict[str, BacktestRun]]:
+    windows: list[dict[str, BacktestRun]] = [{} for _ in range(wf.window_count)]
+    for run in wf.runs:
+        windows[run.window_index][run.sample] = run
+    return windows
+
+
+def iter_walk_forward_equity(wf: WalkForwardRun, db: Session) -> Iterator[dict]:
+    # アウトオブサンプルの評価額を、前のウィンドウまでの損益を複利で反映してつなげる
+    oos_runs = [window["out_of_sample"] for window in get_walk_forward_windows(wf)]
+    factors = logic.equity_factors([run.result_summary for run in oos_runs])
+    if factors is None:
+        return
+    for run, factor in zip(oos_runs, factors, strict=False):
+        for point in iter_backtest_chart(run, db):
+            if point.get("equity") is not None:
+                yield {**point, "equity": point["equity"] * factor, "window": run.window_index}
+
+
+def refresh_walk_forward_status(wf: WalkForwardRun, db: Session) -> WalkForwardRun:
+    if wf.status in (BacktestStatus.success, BacktestStatus.failed):
+        return wf
+
+    wf.status, wf.completed_at = logic.derive_group_status(wf.runs)
+    if wf.completed_at is not None:
+        oos_runs = [window["out_of_sample"] for window in get_walk_forward_windows(wf)]
+        # アウトオブサンプルが1つでも失敗していればつなげた結果は作れない
+        if all(run.status == BacktestStatus.success for run in oos_runs):
+            wf.summary = logic.summarize_walk_forward(
+                [run.result_summary for run in oos_runs],
+                (point["equity"] for point in iter_walk_forward_equity(wf, db)),
+            )
+        else:
+            wf.status = BacktestStatus.failed
+        remove_shared_dataset(f"wf_{wf.id}")
+    db.commit()
+    db.refresh(wf)
+    return wf
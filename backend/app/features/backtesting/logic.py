@@ -0,0 +1,171 @@
+import itertools
+import math
+import os
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.services.timeframes import timeframe_seconds
+
+from .schemas import BacktestStatus, OptimizationRequest, ParameterRange
+
+DEFAULT_INITIAL_CASH = 100000
+
+
+def with_default_parameters(parameters: dict | None) -> dict:
+    params = dict(parameters or {})
+    params["initial_cash"] = params.get("initial_cash", DEFAULT_INITIAL_CASH)
+    return params
+
+
+def get_max_combinations() -> int:
+    return int(os.getenv("OPTIMIZATION_MAX_COMBINATIONS", "10000"))
+
+
+def expand_parameter_range(name: str, spec: ParameterRange) -> list[Any]:
+    if spec.values is not None:
+        if not spec.values:
+            raise ValueError(f"Parameter '{name}' has no values")
+        return list(spec.values)
+
+    if spec.start is None or spec.stop is None or not spec.step:
+        raise ValueError(f"Parameter '{name}' requires values or start/stop/step")
+    if spec.step < 0 or spec.stop < spec.start:
+        raise ValueError(f"Parameter '{name}' has an invalid range")
+
+    count = math.floor((spec.stop - spec.start) / spec.step + 1e-9) + 1
+    is_int = all(float(v).is_integer() for v in (spec.start, spec.stop, spec.step))
+    # 浮動小数の誤差が値に乗らないよう丸める
+    return [int(spec.start + i * spec.step) if is_int else round(spec.start + i * spec.step, 10) for i in range(count)]
+
+
+def build_combinations(request: OptimizationRequest) -> list[dict]:
+    base = dict(request.parameters or {})
+    combinations: list[dict] = []
+
+    if request.parameterRanges:
+        names = list(request.parameterRanges.keys())
+        axes = [expand_parameter_range(n, request.parameterRanges[n]) for n in names]
+        total = math.prod(len(a) for a in axes)
+        if total > get_max_combinations():
+            raise ValueError(f"Too many parameter combinations: {total}")
+        combinations.extend({**base, **dict(zip(names, values, strict=True))} for values in itertools.product(*axes))
+
+    if request.combinations:
+        combinations.extend({**base, **c} for c in request.combinations)
+
+    if not combinations:
+        raise ValueError("parameterRanges or combinations is required")
+    if len(combinations) > get_max_combinations():
+        raise ValueError(f"Too many parameter combinations: {len(combinations)}")
+    return combinations
+
+
+def score_of(result_summary: dict | None, objective: str) -> float | None:
+    if not result_summary:
+        return None
+    value = result_summary.get(objective)
+    if isinstance(value, bool) or not isinstance(value, int | float):
+        return None
+    return float(value)
+
+
+def rank_runs(runs: list, objective: str, maximize: bool) -> list[tuple[int | None, Any, float | None]]:
+    scored = [
+        (run, score_of(run.result_summary, objective) if run.status == BacktestStatus.success else None) for run in runs
+    ]
+    ranked = sorted(
+        (r for r in scored if r[1] is not None),
+        key=lambda r: r[1],
+        reverse=maximize,
+    )
+    unranked = [r for r in scored if r[1] is None]
+    return [(i + 1, run, score) for i, (run, score) in enumerate(ranked)] + [(None, run, None) for run, _ in unranked]
+
+
+def get_max_walk_forward_windows() -> int:
+    return int(os.getenv("WALK_FORWARD_MAX_WINDOWS", "200"))
+
+
+# 隣り合う期間で同じバーを重複して使わないよう、終了時刻をわずかに手前にする
+WINDOW_EPSILON = timedelta(microseconds=1)
+
+
+def build_walk_forward_windows(
+    start: datetime,
+    end: datetime,
+    in_sample: str,
+    out_of_sample: str,
+    step: str | None = None,
+    anchored: bool = False,
+) -> list[tuple[datetime, datetime, datetime, datetime]]:
+    in_sample_span = timedelta(seconds=timeframe_seconds(in_sample))
+    out_of_sample_span = timedelta(seconds=timeframe_seconds(out_of_sample))
+    step_span = timedelta(seconds=timeframe_seconds(step)) if step else out_of_sample_span
+
+    windows = []
+    oos_start = start + in_sample_span
+    while oos_start + out_of_sample_span <= end:
+        is_start = start if anchored else oos_start - in_sample_span
+        windows.append(
+            (is_start, oos_start - WINDOW_EPSILON, oos_start, oos_start + out_of_sample_span - WINDOW_EPSILON)
+        )
+        if len(windows) > get_max_walk_forward_windows():
+            raise ValueError(f"Too many walk-forward windows (max {get_max_walk_forward_windows()})")
+        oos_start += step_span
+
+    if not windows:
+        raise ValueError("Time range is shorter than one in-sample and out-of-sample window")
+    return windows
+
+
+def derive_group_status(runs: list) -> tuple[BacktestStatus, datetime | None]:
+    # 全件終了で完了（1件でも成功していれば成功）、1件でも開始していれば実行中
+    statuses = [run.status for run in runs]
+    if all(s in (BacktestStatus.success, BacktestStatus.failed) for s in statuses):
+        status = BacktestStatus.success if BacktestStatus.success in statuses else BacktestStatus.failed
+        return status, max((run.completed_at for run in runs if run.completed_at), default=datetime.now())
+    if any(s != BacktestStatus.pending for s in statuses):
+        return BacktestStatus.running, None
+    return BacktestStatus.pending, None
+
+
+def equity_factors(summaries: list[dict | None]) -> list[float] | None:
+    # 各ウィンドウの評価額に掛ける係数（前のウィンドウまでの損益を複利でつなぐ）
+    factors = [1.0]
+    for summary in summaries:
+        initial = score_of(summary, "initial_cash")
+        final = score_of(summary, "final_value")
+        if not initial or final is None:
+            return None
+        factors.append(factors[-1] * final / initial)
+    return factors
+
+
+def summarize_walk_forward(summaries: list[dict | None], equity: Iterable[float]) -> dict | None:
+    factors = equity_factors(summaries)
+    if factors is None or not summaries:
+        return None
+
+    peak = None
+    max_drawdown = 0.0
+    for value in equity:
+        peak = value if peak is None else max(peak, value)
+        if peak > 0:
+            max_drawdown = max(max_drawdown, (peak - value) / peak * 100)
+
+    initial_cash = float(summaries[0]["initial_cash"])
+    trade_count = sum(int(s.get("trade_count") or 0) for s in summaries)
+    wins = sum((s.get("win_rate") or 0) * (s.get("trade_count") or 0) for s in summaries)
+    final_value = initial_cash * factors[-1]
+    return {
+        "initial_cash": initial_cash,
+        "final_value": final_value,
+        "net_profit": final_value - initial_cash,
+        "return_pct": (factors[-1] - 1) * 100,
+        "trade_count": trade_count,
+        "win_rate": wins / trade_count if trade_count else 0.0,
+        "max_drawdown": max_drawdown,
+        "window_count": len(summaries),
+        "profitable_windows": sum(1 for a, b in zip(factors, factors[1:], strict=False) if b > a),
+    }
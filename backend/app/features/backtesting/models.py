@@ -4,7 +4,7 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import JSON, DateTime, Enum, ForeignKey, String
+from sqlalchemy import JSON, Boolean, DateTime, Enum, ForeignKey, Index, Integer, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -19,6 +19,81 @@ class BacktestStatus(str, enum.Enum):
     failed = "failed"
 
 
+class TaskStatus(str, enum.Enum):
+    queued = "queued"
+    leased = "leased"
+    failed = "failed"
+
+
+class OptimizationRun(Base):
+    __tablename__ = "optimization_runs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    strategy_version_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("strategy_versions.id"), nullable=False
+    )
+    status: Mapped[BacktestStatus] = mapped_column(
+        Enum(BacktestStatus), default=BacktestStatus.pending, nullable=False
+    )
+
+    data_source_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), nullable=False
+    )
+    timeframe: Mapped[str] = mapped_column(String, nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # 入力されたパラメータ空間（固定値・範囲・組み合わせ）
+    parameter_space: Mapped[dict] = mapped_column(JSON, nullable=False)
+    combination_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    objective: Mapped[str] = mapped_column(String, nullable=False)
+    maximize: Mapped[bool] = mapped_column(Boolean, default=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    runs: Mapped[list[BacktestRun]] = relationship(back_populates="optimization")
+
+
+class WalkForwardRun(Base):
+    __tablename__ = "walk_forward_runs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    strategy_version_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("strategy_versions.id"), nullable=False
+    )
+    status: Mapped[BacktestStatus] = mapped_column(
+        Enum(BacktestStatus), default=BacktestStatus.pending, nullable=False
+    )
+
+    parameters: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    data_source_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), nullable=False
+    )
+    timeframe: Mapped[str] = mapped_column(String, nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # 期間は足種と同じ表記（例: 30d, 12h）
+    in_sample_period: Mapped[str] = mapped_column(String, nullable=False)
+    out_of_sample_period: Mapped[str] = mapped_column(String, nullable=False)
+    step_period: Mapped[str] = mapped_column(String, nullable=False)
+    anchored: Mapped[bool] = mapped_column(Boolean, default=False)
+    window_count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    # アウトオブサンプル結果をつなげた集計
+    summary: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    runs: Mapped[list[BacktestRun]] = relationship(back_populates="walk_forward")
+
+
 class BacktestRun(Base):
     __tablename__ = "backtest_runs"
 
@@ -44,9 +119,31 @@ class BacktestRun(Base):
     start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
 
+    optimization_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("optimization_runs.id"), nullable=True
+    )
+    walk_forward_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("walk_forward_runs.id"), nullable=True
+    )
+    window_index: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # in_sample / out_of_sample
+    sample: Mapped[str | None] = mapped_column(String, nullable=True)
+    # ワーカーでの実行時間（キュー待ちを含まない）
+    duration_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    # 入力（コード・データ・条件）から計算した結果キャッシュのキー
+    cache_key: Mapped[str | None] = mapped_column(String, nullable=True)
+
     result_summary: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # 旧形式の出力（現在は backtest_trades / backtest_chart_points に保存する）
     log: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     chart_data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    trade_count: Mapped[int] = mapped_column(Integer, default=0)
+    chart_point_count: Mapped[int] = mapped_column(Integer, default=0)
+    # キャッシュヒット時は元の実行の出力を参照する
+    output_run_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("backtest_runs.id"), nullable=True
+    )
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(
@@ -58,3 +155,97 @@ class BacktestRun(Base):
         foreign_keys=[strategy_version_id],
         primaryjoin="BacktestRun.strategy_version_id == StrategyVersion.id",
     )
+    optimization: Mapped[OptimizationRun | None] = relationship(back_populates="runs")
+    walk_forward: Mapped[WalkForwardRun | None] = relationship(back_populates="runs")
+
+    @property
+    def output_id(self) -> uuid.UUID:
+        return self.output_run_id or self.id
+
+
+class BacktestResultCache(Base):
+    __tablename__ = "backtest_result_cache"
+
+    # sha256(戦略コード, データソース, 足種, 期間, パラメータ, 使用チャンクのバージョン)
+    cache_key: Mapped[str] = mapped_column(String, primary_key=True)
+    data_source_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), nullable=False, index=True
+    )
+
+    result_summary: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # 出力（取引・チャート）は元の実行のものを参照する
+    backtest_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("backtest_runs.id"), nullable=False
+    )
+
+    hit_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    last_accessed_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, index=True
+    )
+
+
+class BacktestCacheStats(Base):
+    __tablename__ = "backtest_cache_stats"
+
+    # 複数ワーカーから更新されるためDBで集計する（1行のみ）
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    hits: Mapped[int] = mapped_column(Integer, default=0)
+    misses: Mapped[int] = mapped_column(Integer, default=0)
+    evictions: Mapped[int] = mapped_column(Integer, default=0)
+    invalidations: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class BacktestTask(Base):
+    __tablename__ = "backtest_tasks"
+    __table_args__ = (
+        Index("ix_backtest_tasks_ready", "status", "priority", "available_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    backtest_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("backtest_runs.id"), nullable=False, index=True
+    )
+    # 大きいほど先に実行する
+    priority: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    status: Mapped[TaskStatus] = mapped_column(
+        Enum(TaskStatus), default=TaskStatus.queued, nullable=False
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # リトライ時はバックオフ後の時刻まで取り出さない
+    available_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    # リース期限を過ぎたタスクは他のワーカーが再取得できる
+    lease_owner: Mapped[str | None] = mapped_column(String, nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, onupdate=datetime.now
+    )
+
+
+class BacktestTrade(Base):
+    __tablename__ = "backtest_trades"
+    __table_args__ = (Index("ix_backtest_trades_run_seq", "backtest_id", "seq"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    backtest_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("backtest_runs.id"), nullable=False
+    )
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
+
+
+class BacktestChartPoint(Base):
+    __tablename__ = "backtest_chart_points"
+    __table_args__ = (Index("ix_backtest_chart_points_run_seq", "backtest_id", "seq"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    backtest_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("backtest_runs.id"), nullable=False
+    )
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)
@@ -1,15 +1,28 @@
+import itertools
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
+from app.services.downsample import downsample_points
+from app.workers.worker_pool import get_worker_pool
 
-from . import crud
+from . import cache, crud, logic
 from .schemas import (
+    BacktestOutputPage,
     BacktestRequest,
     BacktestRunResponse,
+    BacktestStatus,
     BacktestStatusResponse,
+    CacheStatsResponse,
+    OptimizationRequest,
+    OptimizationResponse,
+    OptimizationResultRow,
+    WalkForwardRequest,
+    WalkForwardResponse,
+    WalkForwardWindowResult,
+    WorkerStatusResponse,
 )
 
 router = APIRouter(prefix="/backtests", tags=["Backtests"])
@@ -36,11 +49,206 @@ def create_backtest(request: BacktestRequest, db: Session = Depends(get_db)):
         resultSummary=bt.result_summary,
         log=bt.log,
         chartData=bt.chart_data,
+        tradeCount=bt.trade_count or 0,
+        chartPointCount=bt.chart_point_count or 0,
     )
 
 
+def to_optimization_response(opt) -> OptimizationResponse:
+    ranked = logic.rank_runs(opt.runs, opt.objective, opt.maximize)
+    return OptimizationResponse(
+        id=opt.id,
+        strategyVersionId=opt.strategy_version_id,
+        status=opt.status,
+        dataSourceId=opt.data_source_id,
+        timeframe=opt.timeframe,
+        startTime=opt.start_time,
+        endTime=opt.end_time,
+        objective=opt.objective,
+        maximize=opt.maximize,
+        combinationCount=opt.combination_count,
+        completedCount=sum(1 for run in opt.runs if run.status == BacktestStatus.success),
+        failedCount=sum(1 for run in opt.runs if run.status == BacktestStatus.failed),
+        createdAt=opt.created_at,
+        completedAt=opt.completed_at,
+        results=[
+            OptimizationResultRow(
+                rank=rank,
+                backtestId=run.id,
+                status=run.status,
+                parameters=run.parameters,
+                score=score,
+                resultSummary=run.result_summary,
+                errorMessage=run.error_message,
+            )
+            for rank, run, score in ranked
+        ],
+    )
+
+
+@router.post("/optimizations", response_model=OptimizationResponse)
+def create_optimization(request: OptimizationRequest, db: Session = Depends(get_db)):
+    """
+    パラメータ最適化（グリッドサーチ）を新規作成し、組み合わせごとのバックテストを実行
+    """
+    try:
+        opt = crud.create_optimization_run(request, db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return to_optimization_response(opt)
+
+
+@router.get("/optimizations/{optimization_id}", response_model=OptimizationResponse)
+def get_optimization(optimization_id: UUID, db: Session = Depends(get_db)):
+    """
+    パラメータ最適化の進捗と、目的指標で順位付けした結果一覧を取得
+    """
+    opt = crud.get_optimization_run(optimization_id, db)
+    if not opt:
+        raise HTTPException(status_code=404, detail="Optimization not found")
+    opt = crud.refresh_optimization_status(opt, db)
+    return to_optimization_response(opt)
+
+
+def to_walk_forward_response(wf) -> WalkForwardResponse:
+    windows = []
+    for index, window in enumerate(crud.get_walk_forward_windows(wf)):
+        is_run, oos_run = window["in_sample"], window["out_of_sample"]
+        windows.append(
+            WalkForwardWindowResult(
+                index=index,
+                inSampleStart=is_run.start_time,
+                inSampleEnd=is_run.end_time,
+                outOfSampleStart=oos_run.start_time,
+                outOfSampleEnd=oos_run.end_time,
+                inSampleBacktestId=is_run.id,
+                outOfSampleBacktestId=oos_run.id,
+                inSampleStatus=is_run.status,
+                outOfSampleStatus=oos_run.status,
+                inSampleSummary=is_run.result_summary,
+                outOfSampleSummary=oos_run.result_summary,
+                inSampleDurationMs=is_run.duration_ms,
+                outOfSampleDurationMs=oos_run.duration_ms,
+            )
+        )
+    return WalkForwardResponse(
+        id=wf.id,
+        strategyVersionId=wf.strategy_version_id,
+        status=wf.status,
+        dataSourceId=wf.data_source_id,
+        timeframe=wf.timeframe,
+        startTime=wf.start_time,
+        endTime=wf.end_time,
+        parameters=wf.parameters,
+        inSamplePeriod=wf.in_sample_period,
+        outOfSamplePeriod=wf.out_of_sample_period,
+        stepPeriod=wf.step_period,
+        anchored=wf.anchored,
+        windowCount=wf.window_count,
+        completedCount=sum(1 for run in wf.runs if run.status == BacktestStatus.success),
+        failedCount=sum(1 for run in wf.runs if run.status == BacktestStatus.failed),
+        summary=wf.summary,
+        createdAt=wf.created_at,
+        completedAt=wf.completed_at,
+        windows=windows,
+    )
+
+
+@router.post("/walk-forwards", response_model=WalkForwardResponse)
+def create_walk_forward(request: WalkForwardRequest, db: Session = Depends(get_db)):
+    """
+    ウォークフォワード分析を新規作成し、ウィンドウごとのバックテストを並列に実行
+    """
+    try:
+        wf = crud.create_walk_forward_run(request, db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return to_walk_forward_response(wf)
+
+
+@router.get("/walk-forwards/{walk_forward_id}", response_model=WalkForwardResponse)
+def get_walk_forward(walk_forward_id: UUID, db: Session = Depends(get_db)):
+    """
+    ウォークフォワード分析の進捗と、ウィンドウごとの結果・実行時間を取得
+    """
+    wf = crud.get_walk_forward_run(walk_forward_id, db)
+    if not wf:
+        raise HTTPException(status_code=404, detail="Walk-forward not found")
+    wf = crud.refresh_walk_forward_status(wf, db)
+    return to_walk_forward_response(wf)
+
+
+@router.get("/walk-forwards/{walk_forward_id}/equity", response_model=BacktestOutputPage)
+def get_walk_forward_equity(
+    walk_forward_id: UUID,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    max_points: int | None = Query(None, ge=3),
+    db: Session = Depends(get_db),
+):
+    """
+    アウトオブサンプル結果をつなげた評価額の推移を取得
+    """
+    wf = crud.get_walk_forward_run(walk_forward_id, db)
+    if not wf:
+        raise HTTPException(status_code=404, detail="Walk-forward not found")
+    wf = crud.refresh_walk_forward_status(wf, db)
+    if wf.status != BacktestStatus.success:
+        raise HTTPException(status_code=409, detail="Walk-forward is not completed")
+    oos_runs = [window["out_of_sample"] for window in crud.get_walk_forward_windows(wf)]
+    total = sum(len(run.chart_data) if run.chart_data is not None else run.chart_point_count for run in oos_runs)
+    if max_points:
+        # 評価額は読み進めながら間引く（全点をメモリに持たない）
+        points = list(downsample_points(crud.iter_walk_forward_equity(wf, db), max_points, total))
+        return BacktestOutputPage(total=len(points), offset=offset, limit=limit, items=points[offset : offset + limit])
+    items = list(itertools.islice(crud.iter_walk_forward_equity(wf, db), offset, offset + limit))
+    return BacktestOutputPage(total=total, offset=offset, limit=limit, items=items)
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+def get_cache_stats(db: Session = Depends(get_db)):
+    """
+    バックテスト結果キャッシュの件数とヒット率を取得
+    """
+    stats = cache.get_cache_stats(db)
+    return CacheStatsResponse(
+        entries=stats["entries"],
+        maxEntries=stats["max_entries"],
+        hits=stats["hits"],
+        misses=stats["misses"],
+        evictions=stats["evictions"],
+        invalidations=stats["invalidations"],
+        hitRate=stats["hit_rate"],
+    )
+
+
+@router.get("/workers", response_model=list[WorkerStatusResponse])
+def get_worker_statuses():
+    """
+    バックテストワーカーの稼働状態を取得
+    """
+    pool = get_worker_pool()
+    if pool is None:
+        return []
+    return [
+        WorkerStatusResponse(
+            workerId=s["worker_id"],
+            pid=s["pid"],
+            state=s["state"],
+            taskId=s["task_id"],
+            restarts=s["restarts"],
+            updatedAt=s["updated_at"],
+        )
+        for s in pool.states()
+    ]
+
+
 @router.get("/{backtest_id}", response_model=BacktestRunResponse)
-def get_backtest(backtest_id: UUID, db: Session = Depends(get_db)):
+def get_backtest(
+    backtest_id: UUID,
+    max_points: int | None = Query(None, ge=3),
+    db: Session = Depends(get_db),
+):
     """
     バックテストの詳細を取得
     """
@@ -61,10 +269,54 @@ def get_backtest(backtest_id: UUID, db: Session = Depends(get_db)):
         endTime=bt.end_time,
         resultSummary=bt.result_summary,
         log=bt.log,
-        chartData=bt.chart_data,
+        chartData=list(downsample_points(bt.chart_data, max_points)) if max_points and bt.chart_data else bt.chart_data,
+        tradeCount=bt.trade_count or 0,
+        chartPointCount=bt.chart_point_count or 0,
     )
 
 
+@router.get("/{backtest_id}/trades", response_model=BacktestOutputPage)
+def get_backtest_trades(
+    backtest_id: UUID,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """
+    バックテストの取引履歴をページ単位で取得
+    """
+    return get_output_page(backtest_id, "trades", offset, limit, db)
+
+
+@router.get("/{backtest_id}/chart", response_model=BacktestOutputPage)
+def get_backtest_chart(
+    backtest_id: UUID,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    max_points: int | None = Query(None, ge=3),
+    db: Session = Depends(get_db),
+):
+    """
+    バックテストのチャートデータをページ単位で取得（max_points を指定すると形を保ったまま間引く）
+    """
+    if max_points:
+        bt = crud.get_backtest_run(backtest_id, db)
+        if not bt:
+            raise HTTPException(status_code=404, detail="Backtest not found")
+        total = len(bt.chart_data) if bt.chart_data is not None else bt.chart_point_count
+        points = list(downsample_points(crud.iter_backtest_chart(bt, db), max_points, total))
+        return BacktestOutputPage(total=len(points), offset=offset, limit=limit, items=points[offset : offset + limit])
+    return get_output_page(backtest_id, "chart_data", offset, limit, db)
+
+
+def get_output_page(backtest_id: UUID, kind: str, offset: int, limit: int, db: Session) -> BacktestOutputPage:
+    bt = crud.get_backtest_run(backtest_id, db)
+    if not bt:
+        raise HTTPException(status_code=404, detail="Backtest not found")
+    total, items = crud.get_backtest_outputs(bt, kind, offset, limit, db)
+    return BacktestOutputPage(total=total, offset=offset, limit=limit, items=items)
+
+
 @router.get("/{backtest_id}/status", response_model=BacktestStatusResponse)
 def get_backtest_status(backtest_id: UUID, db: Session = Depends(get_db)):
     """
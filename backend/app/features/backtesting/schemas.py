@@ -20,6 +20,8 @@ class BacktestRequest(BaseModel):
     timeframe: str
     startTime: datetime
     endTime: datetime
+    # 大きいほど先に実行する
+    priority: int = 0
 
 
 class BacktestStatusResponse(BaseModel):
@@ -42,3 +44,136 @@ class BacktestRunResponse(BaseModel):
     resultSummary: Any | None
     log: Any | None
     chartData: Any | None
+    tradeCount: int = 0
+    chartPointCount: int = 0
+
+
+class ParameterRange(BaseModel):
+    # start〜stop を step 刻み（両端含む）、または values を列挙
+    start: float | None = None
+    stop: float | None = None
+    step: float | None = None
+    values: list[Any] | None = None
+
+
+class OptimizationRequest(BaseModel):
+    strategyVersionId: uuid.UUID
+    dataSourceId: uuid.UUID
+    timeframe: str
+    startTime: datetime
+    endTime: datetime
+    parameters: dict | None = None
+    parameterRanges: dict[str, ParameterRange] | None = None
+    combinations: list[dict] | None = None
+    objective: str = "final_value"
+    maximize: bool = True
+    priority: int = 0
+
+
+class OptimizationResultRow(BaseModel):
+    rank: int | None
+    backtestId: uuid.UUID
+    status: BacktestStatus
+    parameters: dict | None
+    score: float | None
+    resultSummary: Any | None
+    errorMessage: str | None
+
+
+class OptimizationResponse(BaseModel):
+    id: uuid.UUID
+    strategyVersionId: uuid.UUID
+    status: BacktestStatus
+    dataSourceId: uuid.UUID
+    timeframe: str
+    startTime: datetime
+    endTime: datetime
+    objective: str
+    maximize: bool
+    combinationCount: int
+    completedCount: int
+    failedCount: int
+    createdAt: datetime
+    completedAt: datetime | None
+    results: list[OptimizationResultRow]
+
+
+class WorkerStatusResponse(BaseModel):
+    workerId: int
+    pid: int | None
+    state: str
+    taskId: str | None
+    restarts: int
+    updatedAt: datetime
+
+
+class CacheStatsResponse(BaseModel):
+    entries: int
+    maxEntries: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    hitRate: float
+
+
+class BacktestOutputPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    items: list[Any]
+
+
+class WalkForwardRequest(BaseModel):
+    strategyVersionId: uuid.UUID
+    dataSourceId: uuid.UUID
+    timeframe: str
+    startTime: datetime
+    endTime: datetime
+    parameters: dict | None = None
+    # 足種と同じ表記（例: 30d, 12h）
+    inSamplePeriod: str
+    outOfSamplePeriod: str
+    # 未指定時はアウトオブサンプル期間ずつずらす
+    stepPeriod: str | None = None
+    # True の場合はインサンプルの開始を固定して伸ばす
+    anchored: bool = False
+    priority: int = 0
+
+
+class WalkForwardWindowResult(BaseModel):
+    index: int
+    inSampleStart: datetime
+    inSampleEnd: datetime
+    outOfSampleStart: datetime
+    outOfSampleEnd: datetime
+    inSampleBacktestId: uuid.UUID | None
+    outOfSampleBacktestId: uuid.UUID | None
+    inSampleStatus: BacktestStatus | None
+    outOfSampleStatus: BacktestStatus | None
+    inSampleSummary: Any | None
+    outOfSampleSummary: Any | None
+    inSampleDurationMs: int | None
+    outOfSampleDurationMs: int | None
+
+
+class WalkForwardResponse(BaseModel):
+    id: uuid.UUID
+    strategyVersionId: uuid.UUID
+    status: BacktestStatus
+    dataSourceId: uuid.UUID
+    timeframe: str
+    startTime: datetime
+    endTime: datetime
+    parameters: dict | None
+    inSamplePeriod: str
+    outOfSamplePeriod: str
+    stepPeriod: str
+    anchored: bool
+    windowCount: int
+    completedCount: int
+    failedCount: int
+    summary: Any | None
+    createdAt: datetime
+    completedAt: datetime | None
+    windows: list[WalkForwardWindowResult]
@@ -1,6 +1,8 @@
+from datetime import datetime
+
 from sqlalchemy.orm import Session
 
-from .models import Blob
+from .models import Blob, BlobContent
 
 
 def get_blob_by_name(container_name: str, blob_name: str, db: Session) -> Blob | None:
@@ -13,3 +15,73 @@ def get_blob_by_name(container_name: str, blob_name: str, db: Session) -> Blob |
         )
         .first()
     )
+
+
+def acquire_content(db: Session, content_hash: str, size: int) -> None:
+    # 参照数は条件付き UPDATE で増やし、初めての内容なら行を作る
+    updated = (
+        db.query(BlobContent)
+        .filter(BlobContent.content_hash == content_hash)
+        .update(
+            {BlobContent.ref_count: BlobContent.ref_count + 1, BlobContent.released_at: None},
+            synchronize_session=False,
+        )
+    )
+    if not updated:
+        db.add(BlobContent(content_hash=content_hash, size=size, ref_count=1))
+        db.flush()
+
+
+def release_content(db: Session, content_hash: str) -> None:
+    db.query(BlobContent).filter(BlobContent.content_hash == content_hash).update(
+        {BlobContent.ref_count: BlobContent.ref_count - 1, BlobContent.released_at: datetime.now()},
+        synchronize_session=False,
+    )
+
+
+def put_blob(db: Session, container_name: str, blob_name: str, content_hash: str, size: int, meta_data: dict) -> Blob:
+    # 同じ名前の Blob は置き換え、前の内容の参照を外す（新しい内容の参照は本体の保存時に取り済み）
+    for old in db.query(Blob).filter(
+        Blob.container_name == container_name, Blob.blob_name == blob_name, Blob.deleted.is_(False)
+    ):
+        delete_blob(db, old)
+    blob = Blob(
+        container_name=container_name,
+        blob_name=blob_name,
+        blob_path=f"/blobs/{container_name.lstrip('/')}/{blob_name}",
+        content_hash=content_hash,
+        size=size,
+        meta_data=meta_data,
+    )
+    db.add(blob)
+    db.flush()
+    return blob
+
+
+def delete_blob(db: Session, blob: Blob) -> None:
+    blob.deleted = True
+    if blob.content_hash is not None:
+        release_content(db, blob.content_hash)
+
+
+def find_unreferenced_contents(db: Session, released_before: datetime) -> list[str]:
+    rows = (
+        db.query(BlobContent.content_hash)
+        .filter(BlobContent.ref_count <= 0, BlobContent.released_at < released_before)
+        .all()
+    )
+    return [row.content_hash for row in rows]
+
+
+def remove_content(db: Session, content_hash: str, released_before: datetime) -> bool:
+    # 確認後に参照された内容は消さない（行を消せたときだけ本体を削除する）
+    removed = (
+        db.query(BlobContent)
+        .filter(
+            BlobContent.content_hash == content_hash,
+            BlobContent.ref_count <= 0,
+            BlobContent.released_at < released_before,
+        )
+        .delete(synchronize_session=False)
+    )
+    return bool(removed)
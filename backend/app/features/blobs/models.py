@@ -5,8 +5,11 @@ from datetime import datetime
 
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     DateTime,
+    Index,
+    Integer,
     String,
 )
 from sqlalchemy.dialects.postgresql import UUID
@@ -24,9 +27,25 @@ class Blob(Base):
     container_name: Mapped[str] = mapped_column(String, nullable=False)
     blob_name: Mapped[str] = mapped_column(String, nullable=False)
     blob_path: Mapped[str] = mapped_column(String, nullable=False)
+    # 本体は内容のハッシュで1度だけ保存し、同じ内容の Blob で共有する（従来の Blob は None）
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     meta_data: Mapped[dict] = mapped_column(JSON, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.now, onupdate=datetime.now
     )
     deleted: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+# 内容ごとの本体（参照している Blob の数を数え、0 になったものを GC で削除する）
+class BlobContent(Base):
+    __tablename__ = "blob_contents"
+    __table_args__ = (Index("ix_blob_contents_unreferenced", "ref_count", "released_at"),)
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    # 参照が 0 になった時刻（直後のアップロードと GC が競合しないよう猶予を置く）
+    released_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.services.storage import BlobStorageClient, get_blob_client
+from app.services.storage import (
+    AsyncBlobStorageClient,
+    BlobStorageClient,
+    BlobStorageException,
+    get_async_blob_client,
+    get_blob_client,
+)
 
 from . import crud
+from .responses import BlobFileResponse
 
 router = APIRouter(prefix="/blobs", tags=["Blobs"])
 
@@ -16,15 +25,71 @@ def get_blob_detail(
     blob_name: str,
     db: Session = Depends(get_db),
     blob_client: BlobStorageClient = Depends(get_blob_client),
+    async_client: AsyncBlobStorageClient = Depends(get_async_blob_client),
 ):
     blob = crud.get_blob_by_name(container_name, blob_name, db)
     if not blob:
         raise HTTPException(status_code=404, detail="Blob not found")
 
-    data = blob_client.read_blob(container_name, blob_name)
+    headers = dict(blob.meta_data or {})
+    media_type = headers.pop("Content-Type", "application/octet-stream")
+    if blob.content_hash is not None:
+        # 内容のハッシュをそのまま ETag にする（同じ内容なら別の Blob でも同じ値）
+        headers["ETag"] = f'"{blob.content_hash}"'
+    try:
+        if blob.content_hash is not None:
+            path = blob_client.get_content_path(blob.content_hash)
+        else:
+            path = blob_client.get_blob_path(container_name, blob_name)
+        if path is None:
+            # ローカルのファイルでないストレージはチャンクごとに読みながら返す
+            chunks = (
+                async_client.read_content_stream(blob.content_hash)
+                if blob.content_hash is not None
+                else async_client.read_blob_stream(container_name, blob_name)
+            )
+            return StreamingResponse(chunks, media_type=media_type, headers=headers)
+        stat_result = os.stat(path)
+    except (BlobStorageException, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail="Blob not found") from e
+
+    # Range (206)・ETag / Last-Modified・If-None-Match (304) に対応し、ファイルを読み込まずに返す
+    return BlobFileResponse(path, stat_result=stat_result, media_type=media_type, headers=headers)
+
+
+@router.put("/{container_name}/{blob_name:path}", status_code=201)
+async def upload_blob(
+    container_name: str,
+    blob_name: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    async_client: AsyncBlobStorageClient = Depends(get_async_blob_client),
+):
+    # リクエスト本文を受け取りながら書き込み、全体をメモリに載せない
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    try:
+        blob_path, size = await async_client.upload_stream(
+            db, container_name, blob_name, request.stream(), content_type
+        )
+    except BlobStorageException as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+    return {"blobPath": blob_path, "size": size}
+
+
+@router.delete("/{container_name}/{blob_name:path}", status_code=204)
+def delete_blob(
+    container_name: str,
+    blob_name: str,
+    db: Session = Depends(get_db),
+    blob_client: BlobStorageClient = Depends(get_blob_client),
+):
+    if not blob_client.delete_blob(db, container_name, blob_name):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
 
-    return StreamingResponse(
-        data,
-        media_type="application/octet-stream",
-        headers=blob.metadata,
-    )
+@router.post("/gc")
+def collect_garbage(
+    db: Session = Depends(get_db),
+    blob_client: BlobStorageClient = Depends(get_blob_client),
+):
+    return {"removed": blob_client.collect_garbage(db)}
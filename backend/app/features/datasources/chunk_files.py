@@ -0,0 +1,111 @@
+import argparse
+import io
+import logging
+import os
+from uuid import UUID
+
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal, engine
+from app.features.blobs import crud as blob_crud
+from app.services.storage import get_blob_client
+
+from .models import DataChunk
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ("db", "blob")
+
+
+def get_chunk_storage() -> str:
+    # db: 本体を data_chunks.data に保存（既定値） / blob: ストレージのファイルに保存し、行はメタデータだけにする
+    mode = os.getenv("DATA_CHUNK_STORAGE", "db")
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown DATA_CHUNK_STORAGE: {mode}")
+    return mode
+
+
+def store_payload(db: Session, payload: bytes) -> str:
+    # 内容のハッシュで保存し、参照を数えて GC の対象から外す（参照は本体の保存前に取る）
+    content_hash, _ = get_blob_client().put_content(db, io.BytesIO(payload))
+    return content_hash
+
+
+def store_payloads(db: Session, rows: list[dict]) -> None:
+    # INSERT 前のチャンク行の本体を、blob モードのときだけファイルに移す
+    if get_chunk_storage() != "blob":
+        return
+    for row in rows:
+        row["content_hash"] = store_payload(db, row["data"])
+        row["data"] = b""
+
+
+def release_payloads(db: Session, chunk_ids: list[UUID]) -> None:
+    # 置き換えられたチャンクの本体の参照を外す（参照がなくなった本体は GC で削除される）
+    rows = (
+        db.query(DataChunk.id, DataChunk.content_hash)
+        .filter(DataChunk.id.in_(chunk_ids), DataChunk.content_hash.is_not(None))
+        .all()
+    )
+    for row in rows:
+        blob_crud.release_content(db, row.content_hash)
+    if rows:
+        db.query(DataChunk).filter(DataChunk.id.in_([row.id for row in rows])).update(
+            {DataChunk.content_hash: None}, synchronize_session=False
+        )
+
+
+def migrate_chunks(db: Session, to: str, data_source_id: UUID | None = None, batch_size: int = 100) -> int:
+    # 既存のチャンクを batch_size 件ずつ移してコミットする（移行中もどちらの形式のチャンクも読める）
+    if to not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode: {to}")
+    client = get_blob_client()
+    moved = 0
+    while True:
+        query = db.query(DataChunk.id, DataChunk.data, DataChunk.content_hash)
+        if data_source_id is not None:
+            query = query.filter(DataChunk.data_source_id == data_source_id)
+        if to == "blob":
+            # 無効なチャンクの本体は参照を外しているので、移すのは有効なチャンクだけ
+            query = query.filter(DataChunk.content_hash.is_(None), DataChunk.is_active.is_(True))
+        else:
+            query = query.filter(DataChunk.content_hash.is_not(None))
+        rows = query.limit(batch_size).all()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            if to == "blob":
+                updates.append({"id": row.id, "data": b"", "content_hash": store_payload(db, row.data)})
+            else:
+                updates.append({"id": row.id, "data": client.read_content(row.content_hash), "content_hash": None})
+                blob_crud.release_content(db, row.content_hash)
+        db.execute(update(DataChunk), updates)
+        db.commit()
+        moved += len(rows)
+        logger.info(f"[ChunkFiles] Moved {moved} chunks to {to}")
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move data chunk payloads between the database and blob storage")
+    parser.add_argument("--to", choices=STORAGE_MODES, default="blob")
+    parser.add_argument("--data-source-id", type=UUID)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--vacuum", action="store_true", help="run VACUUM afterwards (SQLite)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        moved = migrate_chunks(db, args.to, args.data_source_id, args.batch_size)
+    logger.info(f"[ChunkFiles] Done: {moved} chunks")
+    # 空いた領域は VACUUM するまでファイルサイズが縮まない
+    if args.vacuum and engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    main()
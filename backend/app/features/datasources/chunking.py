@@ -0,0 +1,90 @@
+import uuid
+from collections.abc import Iterator
+from datetime import datetime
+
+import numpy as np
+
+from app.services.chunk_codec import encode_columns
+from app.services.market_data import to_utc_naive
+from app.services.market_hours import expected_slots, is_open
+from app.services.timeframes import chunk_span, is_tick_timeframe, timeframe_seconds
+
+from .models import DataFormat, DataSource
+
+OHLC_NAMES = {"open", "high", "low", "close"}
+# 想定本数に対してこの割合未満のチャンクは不完全とする
+COMPLETE_RATIO = 0.9
+TICK_SLOT_NS = 60 * 1_000_000_000
+EPOCH = np.datetime64(0, "ns")
+
+
+def split_by_chunk(columns: dict[str, np.ndarray], span: int) -> Iterator[tuple[int, dict[str, np.ndarray]]]:
+    # 時刻順の列をチャンク境界（span ナノ秒単位）ごとに切り分ける（コピーなし）
+    ns = columns["time"].view(np.int64)
+    if len(ns) == 0:
+        return
+    keys = ns - ns % span
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    for start, stop in zip(starts, np.r_[starts[1:], len(ns)], strict=False):
+        yield int(keys[start]), {name: values[start:stop] for name, values in columns.items()}
+
+
+def get_chunk_span(data_source: DataSource) -> int:
+    return int(np.timedelta64(chunk_span(data_source.timeframe), "ns").astype(np.int64))
+
+
+def to_ns(value: datetime) -> int:
+    return int((np.datetime64(to_utc_naive(value), "ns") - EPOCH).astype(np.int64))
+
+
+def to_datetime(ns: int) -> datetime:
+    return (EPOCH + np.timedelta64(ns, "ns")).astype("datetime64[us]").item()
+
+
+def build_chunk(data_source: DataSource, key: int, columns: dict[str, np.ndarray], version: int) -> dict:
+    span = get_chunk_span(data_source)
+    payload, codec = encode_columns(columns)
+    fmt = DataFormat.ohlc if OHLC_NAMES <= columns.keys() else DataFormat.tick
+    ratio = completeness(data_source, key, span, columns)
+    return {
+        "id": uuid.uuid4(),
+        "data_source_id": data_source.id,
+        "start_time": to_datetime(key),
+        "end_time": to_datetime(key + span),
+        "version": version,
+        "is_complete": ratio is None or ratio >= COMPLETE_RATIO,
+        "completeness_ratio": ratio,
+        "is_active": True,
+        "format": fmt,
+        "size": len(payload),
+        "codec": codec,
+        "data": payload,
+    }
+
+
+def get_slot(data_source: DataSource) -> int:
+    # 足は1本ごと、ティックは1分ごとにデータがあるかで完全性を判定する
+    if is_tick_timeframe(data_source.timeframe):
+        return TICK_SLOT_NS
+    return timeframe_seconds(data_source.timeframe) * 1_000_000_000
+
+
+def count_slots(columns: dict[str, np.ndarray], slot: int) -> int:
+    # 開場時間内でデータのある slot の数（時刻順の前提）
+    ns = columns["time"].view(np.int64)
+    slots = ns[is_open(ns)] // slot
+    return int(np.count_nonzero(slots[1:] != slots[:-1])) + 1 if len(slots) else 0
+
+
+def completeness_ratios(starts: np.ndarray, ends: np.ndarray, actual: np.ndarray, slot: int) -> np.ndarray:
+    # 複数チャンクの想定数と実数をまとめて比較する（休場中だけのチャンクは NaN）
+    expected = expected_slots(starts, ends, slot)
+    return np.where(expected > 0, np.minimum(actual / np.maximum(expected, 1), 1.0), np.nan)
+
+
+def completeness(data_source: DataSource, key: int, span: int, columns: dict[str, np.ndarray]) -> float | None:
+    slot = get_slot(data_source)
+    ratio = completeness_ratios(np.array([key]), np.array([key + span]), np.array([count_slots(columns, slot)]), slot)[
+        0
+    ]
+    return None if np.isnan(ratio) else float(ratio)
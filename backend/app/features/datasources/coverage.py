@@ -0,0 +1,159 @@
+import logging
+import math
+from datetime import datetime
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.services.market_data import decode_chunk_payload, sort_by_time
+from app.services.market_hours import HOUR_NS, is_open
+
+from .chunking import COMPLETE_RATIO, completeness_ratios, count_slots, get_slot, to_datetime, to_ns
+from .models import DataChunk, DataCoverage, DataSource
+
+logger = logging.getLogger(__name__)
+
+YEAR_HOURS = 366 * 24
+
+
+def hours_of(columns: dict[str, np.ndarray]) -> np.ndarray:
+    # データのある時間（エポックからの時間数、時刻順の前提）
+    hours = columns["time"].view(np.int64) // HOUR_NS
+    return hours[np.r_[True, hours[1:] != hours[:-1]]] if len(hours) else hours
+
+
+def year_of(hours: np.ndarray) -> np.ndarray:
+    return hours.astype("datetime64[h]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def first_hour(year: int) -> int:
+    return int(np.datetime64(year - 1970, "Y").astype("datetime64[h]").astype(np.int64))
+
+
+def load_bits(row: DataCoverage | None) -> np.ndarray:
+    if row is None:
+        return np.zeros(YEAR_HOURS, dtype=np.uint8)
+    return np.unpackbits(np.frombuffer(row.hours, dtype=np.uint8), count=YEAR_HOURS)
+
+
+def mark_hours(db: Session, data_source_id: UUID, hours: np.ndarray) -> None:
+    # データのある時間のビットを立てる（年ごとの行を読み書きするだけで、チャンク本体は読まない）
+    if not len(hours):
+        return
+    hours = np.unique(hours)
+    years = year_of(hours)
+    for year in np.unique(years).tolist():
+        row = db.query(DataCoverage).filter_by(data_source_id=data_source_id, year=year).first()
+        bits = load_bits(row)
+        bits[hours[years == year] - first_hour(year)] = 1
+        if row is None:
+            row = DataCoverage(data_source_id=data_source_id, year=year)
+            db.add(row)
+        row.hours = np.packbits(bits).tobytes()
+        row.covered_hours = int(bits.sum())
+
+
+def covered_mask(db: Session, data_source_id: UUID, start_hour: int, end_hour: int) -> np.ndarray:
+    # [start_hour, end_hour) の各時間にデータがあるか
+    mask = np.zeros(end_hour - start_hour, dtype=bool)
+    if end_hour <= start_hour:
+        return mask
+    years = year_of(np.array([start_hour, end_hour - 1]))
+    rows = (
+        db.query(DataCoverage)
+        .filter(
+            DataCoverage.data_source_id == data_source_id,
+            DataCoverage.year >= int(years[0]),
+            DataCoverage.year <= int(years[1]),
+        )
+        .all()
+    )
+    for row in rows:
+        offset = first_hour(row.year)
+        lo, hi = max(start_hour, offset), min(end_hour, offset + YEAR_HOURS)
+        if lo < hi:
+            mask[lo - start_hour : hi - start_hour] = load_bits(row)[lo - offset : hi - offset].astype(bool)
+    return mask
+
+
+def find_missing_ranges(
+    db: Session, data_source_id: UUID, start: datetime, end: datetime
+) -> list[tuple[datetime, datetime]]:
+    # 開場中でデータのない時間を、連続する範囲にまとめて返す
+    start_hour = to_ns(start) // HOUR_NS
+    end_hour = math.ceil(to_ns(end) / HOUR_NS)
+    hours = np.arange(start_hour, end_hour, dtype=np.int64)
+    missing = is_open(hours * HOUR_NS) & ~covered_mask(db, data_source_id, start_hour, end_hour)
+    edges = np.flatnonzero(np.diff(np.r_[0, missing.astype(np.int8), 0]))
+    return [
+        (to_datetime(int(hours[lo]) * HOUR_NS), to_datetime(int(hours[hi - 1] + 1) * HOUR_NS))
+        for lo, hi in zip(edges[::2].tolist(), edges[1::2].tolist(), strict=True)
+    ]
+
+
+def find_incomplete_chunks(
+    db: Session, data_source_id: UUID, start: datetime | None = None, end: datetime | None = None
+) -> list[DataChunk]:
+    # 不完全なチャンクはインデックスから探す（本体は読まない）
+    query = db.query(DataChunk).filter(
+        DataChunk.data_source_id == data_source_id,
+        DataChunk.is_active.is_(True),
+        DataChunk.is_complete.is_(False),
+    )
+    if start is not None:
+        query = query.filter(DataChunk.end_time > start)
+    if end is not None:
+        query = query.filter(DataChunk.start_time < end)
+    return query.order_by(DataChunk.start_time).all()
+
+
+def rebuild_coverage(db: Session, data_source: DataSource) -> tuple[int, int]:
+    # 有効なチャンクを1つずつ読み、完全性の再計算とビットマップの作り直しを行う
+    slot = get_slot(data_source)
+    query = (
+        db.query(
+            DataChunk.id,
+            DataChunk.start_time,
+            DataChunk.end_time,
+            DataChunk.codec,
+            DataChunk.data,
+            DataChunk.content_hash,
+        )
+        .filter(DataChunk.data_source_id == data_source.id, DataChunk.is_active.is_(True))
+        .execution_options(yield_per=8)
+    )
+    ids, starts, ends, actual, hours = [], [], [], [], []
+    for chunk_id, start_time, end_time, codec, data, content_hash in query:
+        columns = sort_by_time(decode_chunk_payload(codec, data, content_hash))
+        ids.append(chunk_id)
+        starts.append(to_ns(start_time))
+        ends.append(to_ns(end_time))
+        actual.append(count_slots(columns, slot))
+        hours.append(hours_of(columns))
+
+    # 想定数との比較は全チャンクまとめて行う
+    ratios = completeness_ratios(
+        np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), np.array(actual), slot
+    )
+    if ids:
+        db.execute(
+            update(DataChunk),
+            [
+                {
+                    "id": chunk_id,
+                    "is_complete": bool(np.isnan(ratio) or ratio >= COMPLETE_RATIO),
+                    "completeness_ratio": None if np.isnan(ratio) else float(ratio),
+                }
+                for chunk_id, ratio in zip(ids, ratios.tolist(), strict=True)
+            ],
+        )
+    covered = np.unique(np.concatenate(hours)) if hours else np.array([], dtype=np.int64)
+    db.query(DataCoverage).filter(DataCoverage.data_source_id == data_source.id).delete(synchronize_session=False)
+    mark_hours(db, data_source.id, covered)
+    db.commit()
+
+    incomplete = int(np.count_nonzero(ratios < COMPLETE_RATIO))
+    logger.info(f"[Coverage] {data_source.id}: {len(covered)} hours covered, {incomplete} incomplete chunks")
+    return len(covered), incomplete
@@ -1,11 +1,11 @@
-import base64
 import uuid
 from datetime import datetime
 
+from sqlalchemy import case, func, select, update
 from sqlalchemy.orm import Session
 
-from .models import DataChunk, DataFormat, DataSource, UploadHistory
-from .schemas import DataChunkCreate, DataSourceCreate
+from .models import DataChunk, DataSource, UploadHistory
+from .schemas import DataSourceCreate
 
 
 def create_data_source(db: Session, data: DataSourceCreate) -> DataSource:
@@ -23,12 +23,40 @@ def create_data_source(db: Session, data: DataSourceCreate) -> DataSource:
     return ds
 
 
+def allocate_version(db: Session, data_source_id: uuid.UUID) -> int:
+    # 行を UPDATE してから読み戻すので、同じデータソースの取り込み同士でも同じ番号にならない
+    # （列の追加前に作られたチャンクのバージョンより大きい番号から始める）
+    existing = (
+        select(func.coalesce(func.max(DataChunk.version), 0))
+        .where(DataChunk.data_source_id == data_source_id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(DataSource)
+        .where(DataSource.id == data_source_id)
+        .values(last_version=case((existing > DataSource.last_version, existing), else_=DataSource.last_version) + 1)
+    )
+    version = db.query(DataSource.last_version).filter(DataSource.id == data_source_id).scalar()
+    db.commit()
+    return version
+
+
 def create_upload_history(
-    db: Session, data_source_id: str, message: str
+    db: Session,
+    data_source_id: uuid.UUID,
+    uploaded_by: str,
+    file_name: str | None,
+    version: int,
+    row_count: int | None = None,
+    chunk_count: int | None = None,
 ) -> UploadHistory:
     history = UploadHistory(
         data_source_id=data_source_id,
-        message=message,
+        uploaded_by=uploaded_by,
+        file_name=file_name,
+        version=version,
+        row_count=row_count,
+        chunk_count=chunk_count,
     )
     db.add(history)
     db.flush()
@@ -36,26 +64,6 @@ def create_upload_history(
     return history
 
 
-def create_data_chunk(
-    db: Session, data: DataChunkCreate, data_source_id: uuid.UUID
-) -> DataChunk:
-    byte_data = base64.b64decode(data.data.encode()).decode()
-    chunk = DataChunk(
-        data_source_id=data_source_id,
-        start_at=data.startAt,
-        end_at=data.endAt,
-        version=1,
-        is_complete=True,
-        completeness_ratio=1,
-        format=DataFormat.tick,
-        data=byte_data,
-    )
-    db.add(chunk)
-    db.flush()
-    db.refresh(chunk)
-    return chunk
-
-
 def get_chunks_by_timerange(
     db: Session,
     data_source_id: str,
@@ -0,0 +1,53 @@
+import os
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from .importer import iter_csv_batches
+from .models import DataSource
+
+
+class DataFetcher(Protocol):
+    # [start, end) のデータを列の配列のバッチで返す（start が None なら取得できる最初から）
+    def fetch(
+        self, data_source: DataSource, start: datetime | None, end: datetime
+    ) -> Iterator[dict[str, np.ndarray]]: ...
+
+
+class LocalFileFetcher:
+    # {root}/{symbol}/ 以下の CSV (gzip 可) を取得元とする（MT のエクスポートの置き場・テスト用）
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root or os.getenv("DATA_FETCH_DIR", "./data/fetch"))
+
+    def fetch(self, data_source: DataSource, start: datetime | None, end: datetime) -> Iterator[dict[str, np.ndarray]]:
+        directory = self.root / data_source.symbol
+        if not directory.is_dir():
+            return
+        for path in sorted(directory.glob("*.csv*")):
+            with open(path, "rb") as file:
+                for columns in iter_csv_batches(file):
+                    # end は含めない
+                    mask = columns["time"] < np.datetime64(end, "ns")
+                    if start is not None:
+                        mask &= columns["time"] >= np.datetime64(start, "ns")
+                    if mask.any():
+                        yield {name: values[mask] for name, values in columns.items()}
+
+
+# source_type -> 取得元（Dukascopy などは register_fetcher で追加する）
+FETCHERS: dict[str, Callable[[], DataFetcher]] = {
+    "local_file": LocalFileFetcher,
+}
+
+
+def register_fetcher(source_type: str, factory: Callable[[], DataFetcher]) -> None:
+    FETCHERS[source_type] = factory
+
+
+def get_fetcher(source_type: str) -> DataFetcher:
+    if source_type not in FETCHERS:
+        raise ValueError(f"No fetcher for source type: {source_type}")
+    return FETCHERS[source_type]()
@@ -0,0 +1,192 @@
+import gzip
+import logging
+import os
+import time
+import uuid
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.features.backtesting import cache
+from app.services.chunk_cache import get_chunk_cache
+from app.services.market_data import concat_columns, parse_iso_times, sort_by_time
+
+from . import coverage, crud
+from .chunk_files import release_payloads, store_payloads
+from .chunking import build_chunk, get_chunk_span, split_by_chunk
+from .merge import MergeResult, merge_chunks
+from .models import DataChunk, DataSource, UploadHistory
+from .rollup import update_rollups
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def get_batch_rows() -> int:
+    return int(os.getenv("DATA_IMPORT_BATCH_ROWS", "200000"))
+
+
+def get_commit_chunks() -> int:
+    return int(os.getenv("DATA_IMPORT_COMMIT_CHUNKS", "100"))
+
+
+@dataclass
+class ImportResult:
+    history: UploadHistory
+    row_count: int
+    chunk_count: int
+    merge: MergeResult
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.row_count / self.seconds if self.seconds > 0 else 0.0
+
+
+def open_upload(file: BinaryIO) -> BinaryIO:
+    # gzip は先頭のマジックバイトで判定し、展開しながら読む
+    head = file.read(2)
+    file.seek(0)
+    return gzip.GzipFile(fileobj=file, mode="rb") if head == GZIP_MAGIC else file
+
+
+def iter_csv_batches(file: BinaryIO, batch_rows: int | None = None) -> Iterator[dict[str, np.ndarray]]:
+    # ファイル全体を読み込まずに batch_rows 行ずつ列の配列に変換する
+    reader = pd.read_csv(open_upload(file), chunksize=batch_rows or get_batch_rows(), engine="c")
+    with reader:
+        for df in reader:
+            df.columns = [str(name).strip().lower() for name in df.columns]
+            if "time" not in df.columns:
+                raise ValueError("CSV must have a time column")
+            columns = {"time": parse_iso_times(df["time"].to_numpy())}
+            for name in df.columns:
+                if name != "time":
+                    columns[name] = df[name].to_numpy(dtype=np.float64)
+            yield columns
+
+
+class ChunkImporter:
+    def __init__(self, db: Session, data_source: DataSource, version: int):
+        self._db = db
+        self._data_source = data_source
+        self._version = version
+        self._span = get_chunk_span(data_source)
+        # チャンク開始時刻(ns) -> まだ確定していない行
+        self._pending: dict[int, list[dict[str, np.ndarray]]] = {}
+        self._rows: list[dict] = []
+        self._hours: list[np.ndarray] = []
+        self.chunk_count = 0
+        # コミット済みのチャンクの ID（失敗したときに無効にする）
+        self.chunk_ids: list[uuid.UUID] = []
+        # 書き込んだ範囲（マージの対象範囲）
+        self.start: datetime | None = None
+        self.end: datetime | None = None
+
+    def add(self, columns: dict[str, np.ndarray]) -> None:
+        latest = None
+        for key, part in split_by_chunk(sort_by_time(columns), self._span):
+            self._pending.setdefault(key, []).append(part)
+            latest = key
+        if latest is None:
+            return
+
+        # 時刻順のアップロードを前提に、最新のバッチより前のチャンクは確定して書き込む
+        # （遅れて届いた行は同じ期間の別チャンクになり、マージで1つにまとめられる）
+        for key in sorted(k for k in self._pending if k < latest):
+            self._finish(key)
+
+    def close(self) -> None:
+        for key in sorted(self._pending):
+            self._finish(key)
+        self.flush()
+
+    def flush(self) -> None:
+        # 複数チャンクをまとめて1回の INSERT・コミットにする
+        if not self._rows:
+            return
+        store_payloads(self._db, self._rows)
+        self._db.execute(insert(DataChunk), self._rows)
+        # データのある時間をビットマップに記録する
+        coverage.mark_hours(self._db, self._data_source.id, np.concatenate(self._hours))
+        self._db.commit()
+        self.chunk_ids.extend(row["id"] for row in self._rows)
+        self._rows = []
+        self._hours = []
+
+    def _finish(self, key: int) -> None:
+        columns = sort_by_time(concat_columns(self._pending.pop(key)))
+        row = build_chunk(self._data_source, key, columns, self._version)
+        self._rows.append(row)
+        self._hours.append(coverage.hours_of(columns))
+        self.chunk_count += 1
+        self.start = row["start_time"] if self.start is None else min(self.start, row["start_time"])
+        self.end = row["end_time"] if self.end is None else max(self.end, row["end_time"])
+        if len(self._rows) >= get_commit_chunks():
+            self.flush()
+
+
+def import_csv(
+    db: Session,
+    data_source: DataSource,
+    file: BinaryIO,
+    file_name: str | None,
+    uploaded_by: str,
+) -> ImportResult:
+    return import_batches(db, data_source, iter_csv_batches(file), file_name, uploaded_by)
+
+
+def import_batches(
+    db: Session,
+    data_source: DataSource,
+    batches: Iterator[dict[str, np.ndarray]],
+    file_name: str | None,
+    uploaded_by: str,
+) -> ImportResult:
+    # 列の配列のバッチ（CSV・取得元）をチャンクに保存し、マージ・上位足の更新まで行う
+    started = time.monotonic()
+    version = crud.allocate_version(db, data_source.id)
+    importer = ChunkImporter(db, data_source, version)
+    row_count = 0
+    try:
+        for columns in batches:
+            importer.add(columns)
+            row_count += len(columns["time"])
+        importer.close()
+    except Exception:
+        # この取り込みが途中まで書き込んだチャンクだけを無効にしておく
+        db.rollback()
+        if importer.chunk_ids:
+            get_chunk_cache().invalidate(importer.chunk_ids)
+            release_payloads(db, importer.chunk_ids)
+            db.query(DataChunk).filter(DataChunk.id.in_(importer.chunk_ids)).update(
+                {DataChunk.is_active: False}, synchronize_session=False
+            )
+            db.commit()
+        raise
+
+    # 既存のチャンクと重なる範囲をマージし、アップロードのバージョンとして保存する
+    merged = MergeResult()
+    if importer.start is not None:
+        merged = merge_chunks(db, data_source, importer.start, importer.end, version)
+        # 上位足は変更のあった範囲だけ作り直す
+        update_rollups(db, data_source, importer.start, importer.end)
+
+    history = crud.create_upload_history(
+        db, data_source.id, uploaded_by, file_name, version, row_count, importer.chunk_count
+    )
+    cache.invalidate_data_source(db, data_source.id)
+    db.commit()
+
+    result = ImportResult(history, row_count, importer.chunk_count, merged, time.monotonic() - started)
+    logger.info(
+        f"[Import] {data_source.id}: {row_count} rows in {result.chunk_count} chunks "
+        f"({result.rows_per_second:.0f} rows/s)"
+    )
+    return result
@@ -0,0 +1,122 @@
+import itertools
+import logging
+import os
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+from datetime import time as time_of_day
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .coverage import find_incomplete_chunks
+from .fetchers import DataFetcher, get_fetcher
+from .importer import ImportResult, import_batches
+from .models import DataChunk, DataSource, DataSourceJob
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+
+
+def utcnow() -> datetime:
+    # スケジュールの時刻は UTC（タイムゾーンなし）で扱う
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def get_retry_chunks() -> int:
+    return int(os.getenv("DATA_SCHEDULE_RETRY_CHUNKS", "24"))
+
+
+def first_run_at(run_at: time_of_day, now: datetime) -> datetime:
+    candidate = datetime.combine(now.date(), run_at)
+    return candidate if candidate > now else candidate + timedelta(days=1)
+
+
+def following_run_at(scheduled: datetime, interval_type: str, now: datetime) -> datetime:
+    # 予定時刻から間隔ずつ進め、止まっていた間の分はまとめて飛ばす
+    step = INTERVALS[interval_type]
+    if scheduled > now:
+        return scheduled
+    return scheduled + step * ((now - scheduled) // step + 1)
+
+
+def select_retry_chunks(
+    ranges: list[tuple[datetime, datetime]], cursor: datetime | None, limit: int
+) -> list[tuple[datetime, datetime]]:
+    # 前回の続きから limit 件を選び、最後まで進んだら先頭に戻る
+    # （取得元にも無い期間のチャンクが毎回先頭に残り、新しいチャンクまで届かなくなるのを防ぐ）
+    after = [r for r in ranges if cursor is None or r[0] > cursor]
+    before = [r for r in ranges if cursor is not None and r[0] <= cursor]
+    return (after + before)[:limit]
+
+
+def import_fetched(
+    db: Session, data_source: DataSource, batches: Iterator[dict[str, np.ndarray]]
+) -> ImportResult | None:
+    # 取得元にデータがなければ何も記録しない
+    first = next(batches, None)
+    if first is None:
+        return None
+    return import_batches(db, data_source, itertools.chain([first], batches), None, "scheduler")
+
+
+def run_data_source_job(db: Session, data_source: DataSource, fetcher: DataFetcher | None = None) -> DataSourceJob:
+    # 取得 → チャンク保存 → 上位足の更新 → 不完全なチャンクの再取得 を順に行い、所要時間と件数を記録する
+    started = time.monotonic()
+    job = DataSourceJob(data_source_id=data_source.id, status="running", started_at=utcnow())
+    db.add(job)
+    db.commit()
+
+    try:
+        fetcher = fetcher or get_fetcher(data_source.source_type)
+        end = utcnow()
+        # 最後のチャンクは途中までの可能性があるので、その先頭から取得し直す（重複はマージで除かれる）
+        start = (
+            db.query(func.max(DataChunk.start_time))
+            .filter(DataChunk.data_source_id == data_source.id, DataChunk.is_active.is_(True))
+            .scalar()
+        )
+        fetched = import_fetched(db, data_source, fetcher.fetch(data_source, start, end))
+        if fetched is not None:
+            job.fetched_rows += fetched.row_count
+            job.chunk_count += fetched.chunk_count
+
+        # 終わっている期間の不完全なチャンクだけを取得し直す
+        incomplete = select_retry_chunks(
+            [
+                (chunk.start_time, chunk.end_time)
+                for chunk in find_incomplete_chunks(db, data_source.id, end=end)
+                if chunk.end_time <= end
+            ],
+            data_source.retry_cursor,
+            get_retry_chunks(),
+        )
+        if incomplete:
+            data_source.retry_cursor = incomplete[-1][0]
+            batches = itertools.chain.from_iterable(
+                fetcher.fetch(data_source, chunk_start, chunk_end) for chunk_start, chunk_end in incomplete
+            )
+            retried = import_fetched(db, data_source, batches)
+            if retried is not None:
+                job.fetched_rows += retried.row_count
+                job.chunk_count += retried.chunk_count
+            job.retried_chunks = len(incomplete)
+        job.status = "success"
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"[Schedule] Job for {data_source.id} failed")
+        job.status = "failed"
+        job.error = str(e)
+
+    seconds = time.monotonic() - started
+    job.finished_at = utcnow()
+    job.duration_ms = int(seconds * 1000)
+    job.rows_per_second = job.fetched_rows / seconds if seconds > 0 else None
+    db.commit()
+    logger.info(
+        f"[Schedule] {data_source.id}: {job.status} in {job.duration_ms}ms "
+        f"({job.fetched_rows} rows, {job.chunk_count} chunks, {job.retried_chunks} retried)"
+    )
+    return job
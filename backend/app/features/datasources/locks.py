@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .jobs import utcnow
+from .models import DataSource
+
+logger = logging.getLogger(__name__)
+
+
+class DataSourceBusy(Exception):
+    pass
+
+
+def get_lock_seconds() -> float:
+    return float(os.getenv("DATA_SCHEDULER_LOCK_SECONDS", "3600"))
+
+
+def acquire_lock(db: Session, data_source_id: uuid.UUID, now: datetime | None = None) -> str | None:
+    # 条件付き UPDATE が1行更新できたときだけロックを取る（期限切れのロックは取り直せる）
+    now = now or utcnow()
+    token = uuid.uuid4().hex
+    updated = (
+        db.query(DataSource)
+        .filter(
+            DataSource.id == data_source_id,
+            or_(DataSource.locked_until.is_(None), DataSource.locked_until < now),
+        )
+        .update(
+            {DataSource.locked_by: token, DataSource.locked_until: now + timedelta(seconds=get_lock_seconds())},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return token if updated else None
+
+
+def renew_lock(db: Session, data_source_id: uuid.UUID, token: str) -> bool:
+    updated = (
+        db.query(DataSource)
+        .filter(DataSource.id == data_source_id, DataSource.locked_by == token)
+        .update(
+            {DataSource.locked_until: utcnow() + timedelta(seconds=get_lock_seconds())},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return bool(updated)
+
+
+def release_lock(db: Session, data_source_id: uuid.UUID, token: str) -> None:
+    # 期限切れで他の処理に取られたロックは外さない
+    db.query(DataSource).filter(DataSource.id == data_source_id, DataSource.locked_by == token).update(
+        {DataSource.locked_by: None, DataSource.locked_until: None}, synchronize_session=False
+    )
+    db.commit()
+
+
+@contextmanager
+def hold_lock(
+    db: Session, data_source_id: uuid.UUID, on_renew: Callable[[Session], None] | None = None
+) -> Iterator[None]:
+    # データソースに書き込む処理（スケジュール実行・アップロード・マージ）を重ねない
+    # ロックの操作は呼び出し元のトランザクションに混ぜないよう別のセッションで行う
+    bind = db.get_bind()
+    with Session(bind=bind) as lock_db:
+        token = acquire_lock(lock_db, data_source_id)
+    if token is None:
+        raise DataSourceBusy(f"Data source {data_source_id} is being updated by another job")
+
+    # 実行中は期限の 1/3 ごとにロックを延長する（長い取得でも期限切れで他の処理に取られない）
+    stop = threading.Event()
+
+    def renew() -> None:
+        while not stop.wait(get_lock_seconds() / 3):
+            try:
+                with Session(bind=bind) as renew_db:
+                    if not renew_lock(renew_db, data_source_id, token):
+                        logger.warning(f"[Lock] Lost lock on data source {data_source_id}")
+                        return
+                    if on_renew is not None:
+                        on_renew(renew_db)
+                        renew_db.commit()
+            except Exception:
+                logger.exception(f"[Lock] Failed to renew lock on data source {data_source_id}")
+
+    thread = threading.Thread(target=renew, name=f"lock-{data_source_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        with Session(bind=bind) as lock_db:
+            release_lock(lock_db, data_source_id, token)
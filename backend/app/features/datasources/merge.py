@@ -0,0 +1,130 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.services.chunk_cache import get_chunk_cache
+from app.services.market_data import concat_columns, load_decoded_chunks
+
+from .chunk_files import release_payloads, store_payloads
+from .chunking import build_chunk, get_chunk_span, split_by_chunk, to_datetime, to_ns
+from .models import DataChunk, DataSource
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MergeResult:
+    groups: int = 0
+    deactivated_chunks: int = 0
+    created_chunks: int = 0
+    duplicate_rows: int = 0
+
+
+def find_merge_groups(chunks: list[tuple[UUID, datetime, datetime]], span: int) -> list[list[UUID]]:
+    # 開始時刻順に走査し、同じチャンク境界の枠に掛かるチャンクを1グループにまとめる
+    groups: list[list[UUID]] = []
+    current: list[UUID] = []
+    current_end = None
+    current_aligned = True
+    for chunk_id, start, end in sorted(chunks, key=lambda c: c[1]):
+        start_ns, end_ns = to_ns(start), to_ns(end)
+        slot_start = start_ns - start_ns % span
+        slot_end = max(end_ns + (-end_ns) % span, slot_start + span)
+        aligned = start_ns == slot_start and end_ns == slot_start + span
+        if current and slot_start < current_end:
+            current.append(chunk_id)
+            current_end = max(current_end, slot_end)
+            current_aligned = False
+            continue
+        # 境界どおりのチャンクが単独であれば作り直す必要はない
+        if len(current) > 1 or (current and not current_aligned):
+            groups.append(current)
+        current, current_end, current_aligned = [chunk_id], slot_end, aligned
+    if len(current) > 1 or (current and not current_aligned):
+        groups.append(current)
+    return groups
+
+
+def dedup_by_time(columns: dict[str, np.ndarray]) -> tuple[dict[str, np.ndarray], int]:
+    # 新しいバージョンの行が後ろに来るよう連結した前提で、同じ時刻は最後の行を残す
+    times = columns["time"]
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    keep = order[np.r_[sorted_times[1:] != sorted_times[:-1], True]]
+    return {name: values[keep] for name, values in columns.items()}, len(times) - len(keep)
+
+
+def merge_group(db: Session, data_source: DataSource, chunk_ids: list[UUID], version: int | None) -> MergeResult:
+    chunks = (
+        db.query(DataChunk.id, DataChunk.version, DataChunk.codec)
+        .filter(DataChunk.id.in_(chunk_ids))
+        .order_by(DataChunk.version, DataChunk.start_time)
+        .all()
+    )
+    # マージ後すぐに無効にするチャンクなので、キャッシュには追加しない
+    decoded = load_decoded_chunks(db, [tuple(chunk) for chunk in chunks], use_cache=False)
+    columns, duplicates = dedup_by_time(concat_columns(decoded))
+    new_version = version or max(chunk.version for chunk in chunks) + 1
+
+    rows = [
+        build_chunk(data_source, key, part, new_version)
+        for key, part in split_by_chunk(columns, get_chunk_span(data_source))
+    ]
+    # 新しいチャンクの追加と古いチャンクの無効化を1トランザクションで行う
+    try:
+        if rows:
+            store_payloads(db, rows)
+            db.execute(insert(DataChunk), rows)
+        release_payloads(db, chunk_ids)
+        db.query(DataChunk).filter(DataChunk.id.in_(chunk_ids)).update(
+            {DataChunk.is_active: False}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # 無効にしたチャンクはキャッシュからも除く
+    get_chunk_cache().invalidate(chunk_ids)
+    return MergeResult(1, len(chunk_ids), len(rows), duplicates)
+
+
+def merge_chunks(
+    db: Session,
+    data_source: DataSource,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    version: int | None = None,
+) -> MergeResult:
+    # 重複・同じ境界の枠に掛かる有効なチャンクを、時刻で重複を除いた新しいバージョンのチャンクに再構成する
+    span = get_chunk_span(data_source)
+    query = db.query(DataChunk.id, DataChunk.start_time, DataChunk.end_time).filter(
+        DataChunk.data_source_id == data_source.id,
+        DataChunk.is_active.is_(True),
+    )
+    if start is not None:
+        start_ns = to_ns(start)
+        query = query.filter(DataChunk.end_time > to_datetime(start_ns - start_ns % span))
+    if end is not None:
+        end_ns = to_ns(end)
+        query = query.filter(DataChunk.start_time < to_datetime(end_ns + (-end_ns) % span))
+
+    result = MergeResult()
+    # データ本体はグループごとに読み込み、対象範囲以外は読み込まない
+    for group in find_merge_groups([tuple(row) for row in query.all()], span):
+        merged = merge_group(db, data_source, group, version)
+        result.groups += merged.groups
+        result.deactivated_chunks += merged.deactivated_chunks
+        result.created_chunks += merged.created_chunks
+        result.duplicate_rows += merged.duplicate_rows
+
+    if result.groups:
+        logger.info(
+            f"[Merge] {data_source.id}: {result.deactivated_chunks} chunks -> {result.created_chunks} chunks "
+            f"({result.duplicate_rows} duplicate rows)"
+        )
+    return result
@@ -2,7 +2,7 @@ import enum
 import uuid
 from datetime import datetime, time
 
-from sqlalchemy import UUID, Enum, ForeignKey
+from sqlalchemy import UUID, Enum, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.types import UUID as UUIDType
 from sqlalchemy.types import (
@@ -41,14 +41,27 @@ class DataSource(Base):
     source_type: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str | None] = mapped_column(String, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # 取り込みごとに採番したバージョンの最大値（同時の取り込みでも重ならないよう UPDATE で採番する）
+    last_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # 最後に再取得した不完全なチャンクの開始時刻（次のジョブはこの後ろから再取得する）
+    retry_cursor: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # スケジュール実行・アップロード・マージを重ねないためのロック（期限切れのロックは再取得できる）
+    locked_by: Mapped[str | None] = mapped_column(String, nullable=True)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     chunks = relationship("DataChunk", back_populates="data_source", cascade="all, delete-orphan")
     schedule = relationship("DataSourceSchedule", back_populates="data_source", cascade="all, delete-orphan")
     upload_histories = relationship("UploadHistory", back_populates="data_source", cascade="all, delete-orphan")
+    rollups = relationship("RollupChunk", back_populates="data_source", cascade="all, delete-orphan")
+    coverages = relationship("DataCoverage", back_populates="data_source", cascade="all, delete-orphan")
 
 
 class DataSourceSchedule(Base):
     __tablename__ = "data_source_schedules"
+    __table_args__ = (
+        # 実行予定の検索（enabled で絞り込み、next_run_at で範囲走査）
+        Index("ix_data_source_schedules_due", "enabled", "next_run_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     data_source_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("data_sources.id"), nullable=False)
@@ -58,13 +71,41 @@ class DataSourceSchedule(Base):
     run_at: Mapped[time] = mapped_column(Time, nullable=False)  # 例: UTCで04:00
     last_run_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     next_run_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # 同じデータソースのジョブを重ねて実行しない（期限切れのロックは再取得できる）
+    is_running: Mapped[bool] = mapped_column(Boolean, default=False)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     data_source = relationship("DataSource", back_populates="schedule", lazy="joined")
 
 
+# スケジュール実行の記録
+class DataSourceJob(Base):
+    __tablename__ = "data_source_jobs"
+    __table_args__ = (Index("ix_data_source_jobs_source", "data_source_id", "started_at"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUIDType(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    data_source_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("data_sources.id"), nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False)  # 'running', 'success', 'failed'
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    duration_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    fetched_rows: Mapped[int] = mapped_column(Integer, default=0)
+    chunk_count: Mapped[int] = mapped_column(Integer, default=0)
+    retried_chunks: Mapped[int] = mapped_column(Integer, default=0)
+    rows_per_second: Mapped[float | None] = mapped_column(Float, nullable=True)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+
 # チャンクデータ
 class DataChunk(Base):
     __tablename__ = "data_chunks"
+    __table_args__ = (
+        # 期間検索（data_source_id・is_active で絞り込み、start_time で範囲走査）
+        Index("ix_data_chunks_range", "data_source_id", "is_active", "start_time", "end_time"),
+        Index("ix_data_chunks_version", "data_source_id", "version"),
+        # 不完全なチャンクの検索（再取得ジョブ用）
+        Index("ix_data_chunks_incomplete", "data_source_id", "is_active", "is_complete"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUIDType(as_uuid=True), primary_key=True, default=uuid.uuid4)
     data_source_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("data_sources.id"), nullable=False)
@@ -76,11 +117,49 @@ class DataChunk(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     format: Mapped[DataFormat] = mapped_column(Enum(DataFormat), nullable=False)
     size: Mapped[int] = mapped_column(Integer, nullable=True)
-    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # csv: CSVテキスト（旧形式） / zlib・zstd・none: 圧縮方式を指定したバイナリ列形式
+    codec: Mapped[str] = mapped_column(String, nullable=False, default="csv")
+    # 本体は必要なときだけ読み込む（一覧・範囲検索ではメタデータのみ取得する）
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, deferred=True)
+    # 本体をストレージのファイルに置いたチャンクは内容のハッシュを持ち、data は空にする
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
     data_source = relationship("DataSource", back_populates="chunks")
 
 
+# 上位足の集計済みチャンク（下位のチャンクから生成し、更新時は該当範囲だけ作り直す）
+class RollupChunk(Base):
+    __tablename__ = "rollup_chunks"
+    __table_args__ = (UniqueConstraint("data_source_id", "timeframe", "start_time"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUIDType(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    data_source_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("data_sources.id"), nullable=False)
+    timeframe: Mapped[str] = mapped_column(String, nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    bar_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    codec: Mapped[str] = mapped_column(String, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, deferred=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    data_source = relationship("DataSource", back_populates="rollups")
+
+
+# データのある時間（1時間単位）のビットマップ（1年ごとに1行）
+class DataCoverage(Base):
+    __tablename__ = "data_coverages"
+    __table_args__ = (UniqueConstraint("data_source_id", "year"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUIDType(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    data_source_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("data_sources.id"), nullable=False)
+    year: Mapped[int] = mapped_column(Integer, nullable=False)
+    hours: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    covered_hours: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    data_source = relationship("DataSource", back_populates="coverages")
+
+
 # アップロード履歴
 class UploadHistory(Base):
     __tablename__ = "upload_histories"
@@ -91,5 +170,7 @@ class UploadHistory(Base):
     uploaded_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     file_name: Mapped[str] = mapped_column(String, nullable=True)
     version: Mapped[int] = mapped_column(Integer, nullable=False)
+    row_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    chunk_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     data_source = relationship("DataSource", back_populates="upload_histories")
@@ -0,0 +1,132 @@
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.services.chunk_codec import encode_columns
+from app.services.market_data import load_base_bars, load_rollup_columns, resample_ohlc
+from app.services.timeframes import is_tick_timeframe, timeframe_seconds
+
+from .chunking import to_datetime, to_ns
+from .models import DataChunk, DataSource, RollupChunk
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+
+def get_rollup_timeframes() -> list[str]:
+    value = os.getenv("DATA_ROLLUP_TIMEFRAMES", "5m,1h,1d")
+    return [tf.strip() for tf in value.split(",") if tf.strip()]
+
+
+def rollup_span(timeframe: str) -> int:
+    # 1チャンクあたり数百本程度になるよう、足の長さに応じてチャンク範囲を決める
+    seconds = timeframe_seconds(timeframe)
+    if seconds < 3600:
+        span = DAY
+    elif seconds < DAY:
+        span = 30 * DAY
+    else:
+        span = 360 * DAY
+    return span * 1_000_000_000
+
+
+def rollup_levels(data_source: DataSource) -> list[str]:
+    base = 0 if is_tick_timeframe(data_source.timeframe) else timeframe_seconds(data_source.timeframe)
+    levels = []
+    for timeframe in get_rollup_timeframes():
+        seconds = timeframe_seconds(timeframe)
+        if seconds <= base or (base and seconds % base):
+            continue
+        if rollup_span(timeframe) % (seconds * 1_000_000_000):
+            logger.warning(f"[Rollup] Skipping {timeframe}: it does not divide the rollup chunk range")
+            continue
+        levels.append(timeframe)
+    return sorted(set(levels), key=timeframe_seconds)
+
+
+def build_rollup_chunk(
+    db: Session,
+    data_source: DataSource,
+    timeframe: str,
+    source: str | None,
+    key: int,
+) -> dict | None:
+    span = rollup_span(timeframe)
+    start, end = to_datetime(key), to_datetime(key + span)
+    if source is None:
+        # 作り直しは全期間に及ぶことがあるので、チャンクのキャッシュには追加しない
+        bars = load_base_bars(db, data_source.id, timeframe, start, end, end_exclusive=True, use_cache=False)
+    else:
+        # 1つ下の集計済みの足から作る
+        columns = load_rollup_columns(db, data_source.id, source, start, end)
+        bars = resample_ohlc(columns, timeframe) if len(columns["time"]) else columns
+    if not len(bars["time"]):
+        return None
+    payload, codec = encode_columns(bars)
+    return {
+        "data_source_id": data_source.id,
+        "timeframe": timeframe,
+        "start_time": start,
+        "end_time": end,
+        "bar_count": len(bars["time"]),
+        "codec": codec,
+        "data": payload,
+        "updated_at": datetime.now(),
+    }
+
+
+def update_rollups(
+    db: Session,
+    data_source: DataSource,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> dict[str, int]:
+    # [start, end) の下位データが変わったときに、掛かる範囲の上位足チャンクだけを作り直す
+    base_start, base_end = (
+        db.query(func.min(DataChunk.start_time), func.max(DataChunk.end_time))
+        .filter(DataChunk.data_source_id == data_source.id, DataChunk.is_active.is_(True))
+        .one()
+    )
+    updated: dict[str, int] = {}
+    built: list[str] = []
+    for timeframe in rollup_levels(data_source):
+        # 割り切れる下位の集計済みの足があれば、そこから作る
+        seconds = timeframe_seconds(timeframe)
+        source = max((tf for tf in built if seconds % timeframe_seconds(tf) == 0), key=timeframe_seconds, default=None)
+        built.append(timeframe)
+
+        exists = db.query(RollupChunk.id).filter_by(data_source_id=data_source.id, timeframe=timeframe).first()
+        # 未作成の足は全期間を作る（作成済みの足は常に全期間そろっている）
+        if exists is None or start is None or end is None:
+            range_start, range_end = base_start, base_end
+        else:
+            range_start, range_end = start, end
+        if range_start is None:
+            continue
+
+        span = rollup_span(timeframe)
+        first = to_ns(range_start) - to_ns(range_start) % span
+        keys = range(first, to_ns(range_end), span)
+        rows = [build_rollup_chunk(db, data_source, timeframe, source, key) for key in keys]
+
+        # 足ごとに差し替えを1トランザクションで行う
+        db.query(RollupChunk).filter(
+            RollupChunk.data_source_id == data_source.id,
+            RollupChunk.timeframe == timeframe,
+            RollupChunk.start_time >= to_datetime(first),
+            RollupChunk.start_time < to_datetime(first + len(keys) * span),
+        ).delete(synchronize_session=False)
+        rows = [row for row in rows if row is not None]
+        if rows:
+            db.execute(insert(RollupChunk), rows)
+        db.commit()
+
+        updated[timeframe] = len(rows)
+
+    if updated:
+        logger.info(f"[Rollup] {data_source.id}: {updated}")
+    return updated
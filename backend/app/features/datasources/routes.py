@@ -1,24 +1,42 @@
+import tempfile
 from datetime import datetime
 from typing import Generator
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.datastructures import UploadFile
 
 from app.db.session import get_db
+from app.features.backtesting import cache
+from app.services.chunk_cache import get_chunk_cache
+from app.services.data_streamer import get_media_type, stream_data_chunks
+from app.services.timeframes import is_tick_timeframe, timeframe_seconds
 
-from . import crud
-from .models import DataChunk, DataSource, DataSourceSchedule
+from . import coverage, crud, importer, jobs, locks, merge, rollup
+from .chunk_files import release_payloads
+from .models import DataChunk, DataSource, DataSourceJob, DataSourceSchedule
 from .schemas import (
+    ChunkCacheStatsRead,
+    CoverageRead,
+    DataChunkRead,
+    DataGapRead,
     DataSourceCreate,
+    DataSourceJobRead,
     DataSourceRead,
     DataSourceScheduleUpdateRequest,
+    MergeResultRead,
+    UploadResultRead,
 )
 
 router = APIRouter(tags=["DataSources"])
 
+# 本文で受け取ったアップロードはこのサイズを超えると一時ファイルに書き出す
+IMPORT_SPOOL_SIZE = 16 * 1024 * 1024
+
 
 @router.get("/data-sources", response_model=list[DataSourceRead])
 def list_data_sources(db: Session = Depends(get_db)) -> list[DataSourceRead]:
@@ -70,6 +88,9 @@ def delete_data_source(data_source_id: UUID, db: Session = Depends(get_db)) -> N
     ds = db.query(DataSource).filter(DataSource.id == data_source_id).first()
     if not ds:
         raise HTTPException(status_code=404, detail="DataSource not found")
+    # 削除するチャンクの本体の参照も外しておく
+    chunk_ids = db.scalars(select(DataChunk.id).where(DataChunk.data_source_id == data_source_id)).all()
+    release_payloads(db, list(chunk_ids))
     db.delete(ds)
     db.commit()
     return
@@ -85,6 +106,9 @@ def update_data_source_schedule(
     if not data_source:
         raise HTTPException(status_code=404, detail="DataSource not found")
 
+    if req.interval_type not in jobs.INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unsupported interval type: {req.interval_type}")
+
     schedule = db.scalar(select(DataSourceSchedule).where(DataSourceSchedule.data_source_id == data_source_id))
 
     if not schedule:
@@ -99,34 +123,245 @@ def update_data_source_schedule(
         schedule.enabled = req.enabled
         schedule.interval_type = req.interval_type
         schedule.run_at = req.run_at
+    # 次回の実行予定（スケジューラーはこの時刻を過ぎたものを実行する）
+    schedule.next_run_at = jobs.first_run_at(req.run_at, jobs.utcnow())
 
     db.commit()
     return {"message": "Schedule updated successfully"}
 
 
-@router.get("/data-sources/{data_source_id}/stream")
-def stream_data(
+@router.get("/chunk-cache/stats", response_model=ChunkCacheStatsRead)
+def get_chunk_cache_stats() -> ChunkCacheStatsRead:
+    # このプロセスのデコード済みチャンクのキャッシュ
+    stats = get_chunk_cache().stats()
+    return ChunkCacheStatsRead(
+        entries=stats["entries"],
+        bytes=stats["bytes"],
+        maxBytes=stats["max_bytes"],
+        diskEntries=stats["disk_entries"],
+        diskBytes=stats["disk_bytes"],
+        hits=stats["hits"],
+        diskHits=stats["disk_hits"],
+        misses=stats["misses"],
+        evictions=stats["evictions"],
+        evictedBytes=stats["evicted_bytes"],
+        hitRate=stats["hit_rate"],
+    )
+
+
+@router.get("/data-sources/{data_source_id}/jobs", response_model=list[DataSourceJobRead])
+def list_data_source_jobs(
     data_source_id: UUID,
-    start: datetime,
-    end: datetime,
+    limit: int = Query(50, ge=1, le=1000),
     db: Session = Depends(get_db),
-) -> StreamingResponse:
+) -> list[DataSourceJobRead]:
     query = (
-        db.query(DataChunk)
-        .filter(
-            DataChunk.data_source_id == data_source_id,
-            DataChunk.is_active.is_(True),
+        db.query(DataSourceJob)
+        .filter(DataSourceJob.data_source_id == data_source_id)
+        .order_by(DataSourceJob.started_at.desc())
+        .limit(limit)
+    )
+    return [
+        DataSourceJobRead(
+            id=job.id,
+            dataSourceId=job.data_source_id,
+            status=job.status,
+            startedAt=job.started_at,
+            finishedAt=job.finished_at,
+            durationMs=job.duration_ms,
+            fetchedRows=job.fetched_rows,
+            chunkCount=job.chunk_count,
+            retriedChunks=job.retried_chunks,
+            rowsPerSecond=job.rows_per_second,
+            error=job.error,
         )
-        .order_by(DataChunk.start_time)
+        for job in query
+    ]
+
+
+@router.get("/data-sources/{data_source_id}/chunks", response_model=list[DataChunkRead])
+def list_data_chunks(
+    data_source_id: UUID,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    complete_only: bool = False,
+    db: Session = Depends(get_db),
+) -> list[DataChunkRead]:
+    # 本体 (data) は読み込まず、インデックスで絞り込んだメタデータだけを返す
+    query = db.query(DataChunk).filter(
+        DataChunk.data_source_id == data_source_id,
+        DataChunk.is_active.is_(True),
     )
     if start:
         query = query.filter(DataChunk.end_time >= start)
     if end:
         query = query.filter(DataChunk.start_time <= end)
+    if complete_only:
+        query = query.filter(DataChunk.is_complete.is_(True))
+    return [
+        DataChunkRead(
+            id=chunk.id,
+            dataSourceId=chunk.data_source_id,
+            startAt=chunk.start_time,
+            endAt=chunk.end_time,
+            version=chunk.version,
+            format=chunk.format.value,
+            codec=chunk.codec,
+            fileSize=chunk.size,
+            isActive=chunk.is_active,
+            isComplete=chunk.is_complete,
+            completenessRatio=chunk.completeness_ratio,
+        )
+        for chunk in query.order_by(DataChunk.start_time)
+    ]
+
+
+@router.get("/data-sources/{data_source_id}/stream")
+def stream_data(
+    data_source_id: UUID,
+    start: datetime,
+    end: datetime,
+    timeframe: str | None = None,
+    fmt: str = Query("csv", alias="format"),
+    max_points: int | None = Query(None, ge=3),
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    # 足種の指定があれば、集計済みの上位足を優先して OHLC に変換して返す
+    try:
+        if timeframe and not is_tick_timeframe(timeframe):
+            timeframe_seconds(timeframe)
+        media_type = get_media_type(fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    def generate() -> Generator[bytes, None, None]:
+        # 送信が終わるまで次のチャンクを読まない（クライアントの受信速度に合わせる）
+        try:
+            yield from stream_data_chunks(db, data_source_id, start, end, timeframe, fmt, max_points)
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type=media_type)
+
+
+@router.post("/data-sources/{data_source_id}/upload", response_model=UploadResultRead, status_code=201)
+async def upload_data(
+    data_source_id: UUID,
+    request: Request,
+    file_name: str | None = None,
+    uploaded_by: str = "api",
+    db: Session = Depends(get_db),
+) -> UploadResultRead:
+    ds = db.get(DataSource, data_source_id)
+    if not ds:
+        raise HTTPException(status_code=404, detail="DataSource not found")
+
+    # multipart の file フィールド、またはリクエスト本文そのものを CSV (gzip 可) として受け取る
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=400, detail="file field is required")
+        file, file_name = upload.file, file_name or upload.filename
+    else:
+        file = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+        async for part in request.stream():
+            file.write(part)
+        file.seek(0)
+
+    try:
+        with locks.hold_lock(db, ds.id):
+            result = await run_in_threadpool(importer.import_csv, db, ds, file, file_name, uploaded_by)
+    except locks.DataSourceBusy as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    finally:
+        file.close()
+
+    return UploadResultRead(
+        uploadHistoryId=result.history.id,
+        version=result.history.version,
+        rowCount=result.row_count,
+        chunkCount=result.chunk_count,
+        mergedChunks=result.merge.deactivated_chunks,
+        duplicateRows=result.merge.duplicate_rows,
+        durationMs=int(result.seconds * 1000),
+        rowsPerSecond=result.rows_per_second,
+    )
+
+
+@router.post("/data-sources/{data_source_id}/merge", response_model=MergeResultRead)
+def merge_data_chunks(
+    data_source_id: UUID,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+) -> MergeResultRead:
+    ds = db.get(DataSource, data_source_id)
+    if not ds:
+        raise HTTPException(status_code=404, detail="DataSource not found")
+    try:
+        with locks.hold_lock(db, ds.id):
+            result = merge.merge_chunks(db, ds, start, end)
+            if result.groups:
+                rollup.update_rollups(db, ds, start, end)
+                cache.invalidate_data_source(db, ds.id)
+                db.commit()
+    except locks.DataSourceBusy as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    return MergeResultRead(
+        groups=result.groups,
+        deactivatedChunks=result.deactivated_chunks,
+        createdChunks=result.created_chunks,
+        duplicateRows=result.duplicate_rows,
+    )
+
+
+@router.post("/data-sources/{data_source_id}/rollups", response_model=dict[str, int])
+def rebuild_rollups(
+    data_source_id: UUID,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+) -> dict[str, int]:
+    ds = db.get(DataSource, data_source_id)
+    if not ds:
+        raise HTTPException(status_code=404, detail="DataSource not found")
+    return rollup.update_rollups(db, ds, start, end)
 
-    def stream_data_chunks() -> Generator[bytes, None, None]:
-        for chunk in query.all():
-            yield chunk.data
 
-    generator = stream_data_chunks()
-    return StreamingResponse(generator, media_type="text/plain")
+@router.get("/data-sources/{data_source_id}/gaps", response_model=list[DataGapRead])
+def list_data_gaps(
+    data_source_id: UUID,
+    start: datetime,
+    end: datetime,
+    db: Session = Depends(get_db),
+) -> list[DataGapRead]:
+    # 開場中でデータのない時間はビットマップから、不完全なチャンクはインデックスから探す（本体は読まない）
+    gaps = [
+        DataGapRead(startAt=gap_start, endAt=gap_end, kind="missing")
+        for gap_start, gap_end in coverage.find_missing_ranges(db, data_source_id, start, end)
+    ]
+    gaps += [
+        DataGapRead(
+            startAt=chunk.start_time,
+            endAt=chunk.end_time,
+            kind="incomplete",
+            completenessRatio=chunk.completeness_ratio,
+        )
+        for chunk in coverage.find_incomplete_chunks(db, data_source_id, start, end)
+    ]
+    return sorted(gaps, key=lambda gap: gap.startAt)
+
+
+@router.post("/data-sources/{data_source_id}/coverage", response_model=CoverageRead)
+def rebuild_coverage(
+    data_source_id: UUID,
+    db: Session = Depends(get_db),
+) -> CoverageRead:
+    ds = db.get(DataSource, data_source_id)
+    if not ds:
+        raise HTTPException(status_code=404, detail="DataSource not found")
+    covered_hours, incomplete_chunks = coverage.rebuild_coverage(db, ds)
+    return CoverageRead(coveredHours=covered_hours, incompleteChunks=incomplete_chunks)
@@ -27,6 +27,20 @@ class DataSourceScheduleUpdateRequest(BaseModel):
     run_at: time
 
 
+class DataSourceJobRead(BaseModel):
+    id: UUID
+    dataSourceId: UUID
+    status: str
+    startedAt: datetime
+    finishedAt: datetime | None
+    durationMs: int | None
+    fetchedRows: int
+    chunkCount: int
+    retriedChunks: int
+    rowsPerSecond: float | None
+    error: str | None
+
+
 class UploadHistoryRead(BaseModel):
     id: UUID
     dataSourceId: UUID
@@ -35,6 +49,50 @@ class UploadHistoryRead(BaseModel):
     message: str | None
 
 
+class UploadResultRead(BaseModel):
+    uploadHistoryId: UUID
+    version: int
+    rowCount: int
+    chunkCount: int
+    mergedChunks: int
+    duplicateRows: int
+    durationMs: int
+    rowsPerSecond: float
+
+
+class MergeResultRead(BaseModel):
+    groups: int
+    deactivatedChunks: int
+    createdChunks: int
+    duplicateRows: int
+
+
+class DataGapRead(BaseModel):
+    startAt: datetime
+    endAt: datetime
+    kind: str  # missing: データなし / incomplete: 不完全なチャンク
+    completenessRatio: float | None = None
+
+
+class CoverageRead(BaseModel):
+    coveredHours: int
+    incompleteChunks: int
+
+
+class ChunkCacheStatsRead(BaseModel):
+    entries: int
+    bytes: int
+    maxBytes: int
+    diskEntries: int
+    diskBytes: int
+    hits: int
+    diskHits: int
+    misses: int
+    evictions: int
+    evictedBytes: int
+    hitRate: float
+
+
 class DataChunkCreate(BaseModel):
     startAt: datetime
     endAt: datetime
@@ -49,13 +107,15 @@ class ImportRequest(BaseModel):
 class DataChunkRead(BaseModel):
     id: UUID
     dataSourceId: UUID
-    uploadHistoryId: UUID
     startAt: datetime
     endAt: datetime
-    fileSize: int
+    version: int
+    format: str
+    codec: str
+    fileSize: int | None
     isActive: bool
-    priority: int
-    uploadedAt: datetime
+    isComplete: bool
+    completenessRatio: float | None
 
 
 class DataChunkUpdate(BaseModel):
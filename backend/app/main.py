@@ -1,7 +1,7 @@
 import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
-from multiprocessing import Process, Queue
+from multiprocessing import Semaphore
 
 from fastapi import FastAPI
 
@@ -10,12 +10,14 @@ from app.features.backtesting.main import app as backtesting_app
 from app.features.blobs.main import app as blobs_app
 from app.features.datasources.main import app as datasources_app
 from app.features.strategies.main import app as strategies_app
-from app.workers.task_queue import set_task_queue
-from app.workers.worker_process import run_worker
+from app.workers.data_scheduler import DataScheduler
+from app.workers.task_queue import recover_pending_runs, set_task_signal
+from app.workers.worker_pool import WorkerPool, get_worker_count, set_worker_pool
 
-# グローバルでプロセス・キューを持つ
-task_queue: Queue[str] = Queue()
-worker_process: Process | None = None
+# グローバルでプロセス・タスク通知を持つ（タスク本体はDBに保存する）
+task_signal = Semaphore(0)
+worker_pool: WorkerPool | None = None
+data_scheduler: DataScheduler | None = None
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.DEBUG,
@@ -25,27 +27,40 @@ logging.basicConfig(
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
-    global worker_process
+    global worker_pool, data_scheduler
 
     # DB初期化
     init_db()
 
-    # タスクキュー登録
-    set_task_queue(task_queue)
+    # タスク通知を登録し、前回終了時に残っていた未完了のバックテストを再登録
+    set_task_signal(task_signal)
+    recovered = recover_pending_runs()
+    logger.info(f"[Main] Recovered {recovered} pending backtests.")
 
-    # ワーカープロセス起動
-    worker_process = Process(target=run_worker, args=(task_queue,))
-    worker_process.start()
-    logger.info("[Main] Worker process started.")
+    # ワーカープロセス起動（BACKTEST_WORKERS 未指定時はCPUコア数）
+    worker_pool = WorkerPool(task_signal, size=get_worker_count())
+    set_worker_pool(worker_pool)
+    worker_pool.start()
+    logger.info("[Main] Worker pool started.")
+
+    # データソースのスケジュール実行を開始
+    data_scheduler = DataScheduler()
+    data_scheduler.start()
+    logger.info("[Main] Data scheduler started.")
 
     yield
 
-    # アプリ終了時にプロセス終了
-    if worker_process is not None:
-        logger.info("[Main] Terminating worker process...")
-        worker_process.terminate()
-        worker_process.join()
-        logger.info("[Main] Worker process stopped.")
+    if data_scheduler is not None:
+        logger.info("[Main] Stopping data scheduler...")
+        await data_scheduler.stop()
+        data_scheduler = None
+
+    # アプリ終了時は実行中のタスク完了を待ってから停止
+    if worker_pool is not None:
+        logger.info("[Main] Stopping worker pool...")
+        worker_pool.stop()
+        set_worker_pool(None)
+        logger.info("[Main] Worker pool stopped.")
 
 
 # FastAPIアプリ定義
@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from uuid import UUID
+
+import numpy as np
+
+from app.services.chunk_codec import decode_columns, encode_columns
+
+logger = logging.getLogger(__name__)
+
+ChunkKey = tuple[UUID, int]
+
+
+def get_cache_bytes() -> int:
+    # 0 でキャッシュを無効化
+    return int(os.getenv("DATA_CHUNK_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+
+def get_disk_dir() -> str | None:
+    # 指定したときだけディスクにも保存する（再起動後も使える）
+    return os.getenv("DATA_CHUNK_CACHE_DIR") or None
+
+
+def get_disk_bytes() -> int:
+    return int(os.getenv("DATA_CHUNK_CACHE_DISK_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+
+def columns_nbytes(columns: dict[str, np.ndarray]) -> int:
+    return sum(values.nbytes for values in columns.values())
+
+
+class ChunkCache:
+    # デコード済みのチャンク（時刻順の列の配列）をチャンクID・バージョンごとに保持する（容量を超えたら古いものから捨てる）
+    def __init__(self, max_bytes: int, disk_dir: str | Path | None = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[ChunkKey, dict[str, np.ndarray]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        self._disk_max_bytes = disk_max_bytes
+        self._disk: OrderedDict[ChunkKey, int] = OrderedDict()
+        self._disk_bytes = 0
+        if self._disk_dir is not None:
+            self._load_disk_index()
+
+    def get(self, key: ChunkKey) -> dict[str, np.ndarray] | None:
+        with self._lock:
+            columns = self._entries.get(key)
+            if columns is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return columns
+        columns = self._read_disk(key)
+        with self._lock:
+            if columns is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put_memory(key, columns)
+        return columns
+
+    def peek(self, key: ChunkKey) -> dict[str, np.ndarray] | None:
+        # 一括の読み込み用：メモリにあれば使うが、LRU の順序は変えずディスクからも読み込まない
+        with self._lock:
+            columns = self._entries.get(key)
+            if columns is not None:
+                self.hits += 1
+            return columns
+
+    def put(self, key: ChunkKey, columns: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        # 共有するので書き換えられないようにする
+        for values in columns.values():
+            values.flags.writeable = False
+        self._put_memory(key, columns)
+        self._write_disk(key, columns)
+        return columns
+
+    def invalidate(self, chunk_ids: Iterable[UUID]) -> int:
+        ids = set(chunk_ids)
+        removed = 0
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in ids]:
+                self._bytes -= columns_nbytes(self._entries.pop(key))
+                removed += 1
+            disk_keys = [key for key in self._disk if key[0] in ids]
+            for key in disk_keys:
+                self._disk_bytes -= self._disk.pop(key)
+        for key in disk_keys:
+            self._disk_path(key).unlink(missing_ok=True)
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _put_memory(self, key: ChunkKey, columns: dict[str, np.ndarray]) -> None:
+        size = columns_nbytes(columns)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= columns_nbytes(previous)
+            self._entries[key] = columns
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                evicted_size = columns_nbytes(evicted)
+                self._bytes -= evicted_size
+                self.evictions += 1
+                self.evicted_bytes += evicted_size
+
+    def _disk_path(self, key: ChunkKey) -> Path:
+        return self._disk_dir / f"{key[0]}-{key[1]}.bin"
+
+    def _load_disk_index(self) -> None:
+        # 前回までに保存したファイルを古い順に登録する
+        self._disk_dir.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self._disk_dir.glob("*.bin"), key=lambda p: p.stat().st_mtime):
+            chunk_id, _, version = path.stem.rpartition("-")
+            try:
+                key = (UUID(chunk_id), int(version))
+            except ValueError:
+                continue
+            size = path.stat().st_size
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key: ChunkKey) -> dict[str, np.ndarray] | None:
+        if self._disk_dir is None:
+            return None
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            columns = decode_columns(self._disk_path(key).read_bytes(), "none")
+        except (OSError, ValueError) as e:
+            logger.warning(f"[ChunkCache] Dropping unreadable cache file for {key}: {e}")
+            self.invalidate([key[0]])
+            return None
+        for values in columns.values():
+            values.flags.writeable = False
+        return columns
+
+    def _write_disk(self, key: ChunkKey, columns: dict[str, np.ndarray]) -> None:
+        if self._disk_dir is None:
+            return
+        # 圧縮せずに保存し、読み込みはデコードだけで済ませる（書き込み途中のファイルは読ませない）
+        payload, _ = encode_columns(columns, "none")
+        path = self._disk_path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"[ChunkCache] Failed to write cache file for {key}: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        removed = []
+        with self._lock:
+            self._disk_bytes += len(payload) - self._disk.pop(key, 0)
+            self._disk[key] = len(payload)
+            while self._disk_bytes > self._disk_max_bytes and len(self._disk) > 1:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                removed.append(old_key)
+        for old_key in removed:
+            self._disk_path(old_key).unlink(missing_ok=True)
+
+
+_cache: ChunkCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_chunk_cache() -> ChunkCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChunkCache(get_cache_bytes(), get_disk_dir(), get_disk_bytes())
+        return _cache
+
+
+def reset_chunk_cache() -> None:
+    # 設定を読み直す（テスト用）
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,139 @@
+import io
+import os
+import struct
+import zlib
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # 任意の依存
+    zstandard = None
+
+# 旧形式（CSVテキストをそのまま保存）
+CSV_CODEC = "csv"
+
+# バイナリ列形式: ヘッダ（マジック・形式バージョン・行数・列数）と列定義の後に、圧縮した列データを続ける
+MAGIC = b"STCC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBIH")
+COLUMN = struct.Struct("<BB")
+
+KIND_TIME = 0
+KIND_FLOAT = 1
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+CODECS: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "none": (bytes, bytes),
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+
+
+def get_default_codec() -> str:
+    codec = os.getenv("DATA_CHUNK_CODEC", "zstd" if "zstd" in CODECS else "zlib")
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported chunk codec: {codec}")
+    return codec
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    # 同じ桁のバイトを並べて圧縮しやすくする
+    return np.ascontiguousarray(values).view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def _unshuffle(buffer: bytes, offset: int, rows: int, dtype: np.dtype) -> np.ndarray:
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=rows * dtype.itemsize, offset=offset)
+    return raw.reshape(dtype.itemsize, rows).T.copy().view(dtype).reshape(rows)
+
+
+def _time_deltas(times: np.ndarray) -> tuple[np.ndarray, np.dtype]:
+    # 先頭の時刻と差分で保持し、差分が収まれば 4 バイトにする
+    ns = times.astype("datetime64[ns]").view(np.int64)
+    deltas = np.diff(ns, prepend=np.int64(0))
+    if len(deltas) > 1 and 0 <= deltas[1:].min() and deltas[1:].max() <= np.iinfo(np.uint32).max:
+        return deltas, np.dtype(np.uint32)
+    return deltas, np.dtype(np.int64)
+
+
+def encode_columns(columns: dict[str, np.ndarray], codec: str | None = None) -> tuple[bytes, str]:
+    codec = codec or get_default_codec()
+    compress, _ = CODECS[codec]
+    rows = len(columns["time"])
+
+    header = [HEADER.pack(MAGIC, FORMAT_VERSION, rows, len(columns))]
+    body = []
+    for name, values in columns.items():
+        encoded = name.encode()
+        if name == "time":
+            deltas, dtype = _time_deltas(values)
+            header.append(COLUMN.pack(KIND_TIME, dtype.itemsize))
+            # 先頭の時刻は差分の型に関わらず 8 バイトで保持する
+            body.append(deltas[:1].tobytes())
+            body.append(_shuffle(deltas[1:].astype(dtype)))
+        else:
+            header.append(COLUMN.pack(KIND_FLOAT, 8))
+            body.append(_shuffle(np.asarray(values, dtype=np.float64)))
+        header.append(struct.pack("<B", len(encoded)) + encoded)
+
+    return b"".join(header) + compress(b"".join(body)), codec
+
+
+def decode_columns(data: bytes, codec: str) -> dict[str, np.ndarray]:
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported chunk codec: {codec}")
+    magic, version, rows, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Unsupported chunk format")
+
+    offset = HEADER.size
+    layout = []
+    for _ in range(count):
+        kind, itemsize = COLUMN.unpack_from(data, offset)
+        offset += COLUMN.size
+        length = data[offset]
+        name = bytes(data[offset + 1 : offset + 1 + length]).decode()
+        offset += 1 + length
+        layout.append((name, kind, itemsize))
+
+    _, decompress = CODECS[codec]
+    # mmap したファイルからもコピーせずに展開する
+    body = decompress(memoryview(data)[offset:])
+
+    columns: dict[str, np.ndarray] = {}
+    pos = 0
+    for name, kind, itemsize in layout:
+        if kind == KIND_TIME:
+            if rows == 0:
+                columns[name] = np.array([], dtype="datetime64[ns]")
+                continue
+            first = np.frombuffer(body, dtype=np.int64, count=1, offset=pos)
+            pos += 8
+            dtype = np.dtype(np.uint32 if itemsize == 4 else np.int64)
+            deltas = _unshuffle(body, pos, rows - 1, dtype)
+            pos += (rows - 1) * itemsize
+            columns[name] = np.cumsum(np.r_[first, deltas.astype(np.int64)]).view("datetime64[ns]")
+        else:
+            columns[name] = _unshuffle(body, pos, rows, np.dtype(np.float64))
+            pos += rows * itemsize
+    return columns
+
+
+def columns_to_csv(columns: dict[str, np.ndarray]) -> bytes:
+    # 旧形式と同じ CSV テキストに戻す（配信用）
+    df = pd.DataFrame({name: values for name, values in columns.items() if name != "time"})
+    df.insert(0, "time", np.datetime_as_string(columns["time"], unit="us") + "Z")
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, lineterminator="\n")
+    return buffer.getvalue().encode()
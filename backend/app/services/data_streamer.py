@@ -1,28 +1,196 @@
-from collections.abc import Iterator
-from datetime import datetime
+import io
+import itertools
+from collections.abc import Callable, Iterator
+from datetime import datetime, timedelta
 from uuid import UUID
 
+import numpy as np
+import pandas as pd
 from sqlalchemy.orm import Session
 
 from app.features.datasources.models import DataChunk
+from app.services.chunk_codec import columns_to_csv
+from app.services.downsample import downsample_parts
+from app.services.market_data import (
+    load_bars,
+    load_decoded_chunks,
+    resample_ticks,
+    to_utc_naive,
+    trim_columns,
+)
+from app.services.timeframes import is_tick_timeframe, timeframe_seconds
 
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+except ImportError:  # 任意の依存
+    pa = None
 
-def stream_data_chunks(
+# DB から一度に取り出すチャンク数（カーソルで少しずつ読み進める）
+STREAM_YIELD_PER = 8
+# 足の配信で一度に集計する本数
+STREAM_WINDOW_BARS = 50000
+EPOCH = datetime(1970, 1, 1)
+
+
+def iter_chunk_columns(
     db: Session,
     data_source_id: UUID,
     start: datetime,
     end: datetime,
-) -> Iterator[str]:
-    chunks = (
-        db.query(DataChunk)
+) -> Iterator[dict[str, np.ndarray]]:
+    # チャンクを数件ずつ取り出し、[start, end] に切り詰めて返す（保持するのは常に数チャンク分だけ）
+    # メタデータだけをカーソルで読み、本体はキャッシュにないものだけ読み込む
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    query = (
+        db.query(DataChunk.id, DataChunk.version, DataChunk.codec)
         .filter(
             DataChunk.data_source_id == data_source_id,
+            DataChunk.is_active.is_(True),
             DataChunk.start_time <= end,
             DataChunk.end_time >= start,
         )
         .order_by(DataChunk.start_time)
-        .all()
+        .execution_options(yield_per=STREAM_YIELD_PER)
     )
+    rows = iter(query)
+    while batch := [tuple(row) for row in itertools.islice(rows, STREAM_YIELD_PER)]:
+        for decoded in load_decoded_chunks(db, batch):
+            columns = trim_columns(decoded, start, end)
+            if len(columns["time"]):
+                yield columns
+
+
+def iter_bar_columns(
+    db: Session,
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+) -> Iterator[dict[str, np.ndarray]]:
+    if is_tick_timeframe(timeframe):
+        for columns in iter_chunk_columns(db, data_source_id, start, end):
+            yield resample_ticks(columns, timeframe)
+        return
+
+    # 足の境界に揃えた期間ごとに集計し、全期間の足を一度に保持しない
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    step = timedelta(seconds=timeframe_seconds(timeframe))
+    cursor = start
+    while cursor <= end:
+        window_end = EPOCH + (cursor + step * STREAM_WINDOW_BARS - EPOCH) // step * step
+        if window_end > end:
+            bars = load_bars(db, data_source_id, timeframe, cursor, end)
+        else:
+            bars = load_bars(db, data_source_id, timeframe, cursor, window_end, end_exclusive=True)
+        if len(bars["time"]):
+            yield bars
+        cursor = window_end
+
+
+def align_columns(parts: Iterator[dict[str, np.ndarray]]) -> Iterator[dict[str, np.ndarray]]:
+    # 先頭の部分の列に揃える（どの形式でも列の並びを固定する）
+    names: list[str] | None = None
+    for columns in parts:
+        if names is None:
+            names = list(columns)
+            yield columns
+            continue
+        count = len(columns["time"])
+        yield {name: columns[name] if name in columns else np.full(count, np.nan) for name in names}
+
+
+def render_csv(parts: Iterator[dict[str, np.ndarray]]) -> Iterator[bytes]:
+    # ヘッダは1度だけ出力する
+    first = True
+    for columns in parts:
+        csv = columns_to_csv(columns)
+        yield csv if first else csv.partition(b"\n")[2]
+        first = False
+
+
+def render_ndjson(parts: Iterator[dict[str, np.ndarray]]) -> Iterator[bytes]:
+    for columns in parts:
+        df = pd.DataFrame({name: values for name, values in columns.items() if name != "time"})
+        df.insert(0, "time", np.datetime_as_string(columns["time"], unit="us") + "Z")
+        yield df.to_json(orient="records", lines=True).encode()
 
-    for chunk in chunks:
-        yield chunk.data.decode()
+
+def render_sse(parts: Iterator[dict[str, np.ndarray]]) -> Iterator[bytes]:
+    # 1行を1イベントとし、先頭で列名を、最後に終了を通知する
+    first = True
+    for columns in parts:
+        header, _, body = columns_to_csv(columns).partition(b"\n")
+        if first:
+            yield b"event: columns\ndata: " + header + b"\n\n"
+            first = False
+        lines = body.splitlines()
+        if lines:
+            yield b"".join(b"data: " + line + b"\n\n" for line in lines)
+    yield b"event: end\ndata: \n\n"
+
+
+def render_arrow(parts: Iterator[dict[str, np.ndarray]]) -> Iterator[bytes]:
+    # 列の配列をテキストにせず、そのまま Arrow IPC のレコードバッチとして送る
+    buffer = io.BytesIO()
+    writer = None
+    for columns in parts:
+        batch = pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()], names=list(columns))
+        if writer is None:
+            writer = pa.ipc.new_stream(buffer, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(buffer)
+    if writer is not None:
+        writer.close()
+        yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+# 形式 -> (変換関数, Content-Type)
+STREAM_FORMATS: dict[str, tuple[Callable[[Iterator[dict[str, np.ndarray]]], Iterator[bytes]], str]] = {
+    "csv": (render_csv, "text/plain"),
+    "ndjson": (render_ndjson, "application/x-ndjson"),
+    "sse": (render_sse, "text/event-stream"),
+}
+if pa is not None:
+    STREAM_FORMATS["arrow"] = (render_arrow, "application/vnd.apache.arrow.stream")
+
+
+def get_media_type(fmt: str) -> str:
+    if fmt == "arrow" and pa is None:
+        raise ValueError("Arrow format requires pyarrow")
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {fmt}")
+    return STREAM_FORMATS[fmt][1]
+
+
+def stream_data_chunks(
+    db: Session,
+    data_source_id: UUID,
+    start: datetime,
+    end: datetime,
+    timeframe: str | None = None,
+    fmt: str = "csv",
+    max_points: int | None = None,
+) -> Iterator[bytes]:
+    # どの形式も同じ列の配列の流れから作る
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {fmt}")
+    render, _ = STREAM_FORMATS[fmt]
+    if timeframe:
+        parts = iter_bar_columns(db, data_source_id, timeframe, start, end)
+    else:
+        parts = iter_chunk_columns(db, data_source_id, start, end)
+    parts = align_columns(parts)
+    if max_points:
+        # 表示できる点数まで間引いてから変換する
+        parts = downsample_parts(parts, start, end, max_points)
+    return render(parts)
@@ -0,0 +1,212 @@
+import bisect
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+import numpy as np
+
+from app.services.market_data import concat_columns, to_utc_naive
+
+OHLC_NAMES = ("open", "high", "low", "close")
+
+
+def is_ohlc(columns: dict[str, np.ndarray]) -> bool:
+    return all(name in columns for name in OHLC_NAMES)
+
+
+def value_column(columns: dict[str, np.ndarray]) -> str:
+    # 折れ線として間引くときに形を保つ列（終値、なければ先頭の値の列）
+    if "close" in columns:
+        return "close"
+    return next(name for name in columns if name != "time")
+
+
+def aggregate_ohlc(columns: dict[str, np.ndarray], starts: np.ndarray) -> dict[str, np.ndarray]:
+    # starts から始まる行のまとまりを1本の足にまとめる
+    ends = np.r_[starts[1:], len(columns["time"])] - 1
+    result: dict[str, np.ndarray] = {}
+    for name, values in columns.items():
+        if name in ("time", "open"):
+            result[name] = values[starts]
+        elif name == "high":
+            result[name] = np.maximum.reduceat(values, starts)
+        elif name == "low":
+            result[name] = np.minimum.reduceat(values, starts)
+        elif name == "volume":
+            result[name] = np.add.reduceat(values, starts)
+        else:
+            result[name] = values[ends]
+    return result
+
+
+def lttb_select(
+    x: np.ndarray,
+    y: np.ndarray,
+    starts: np.ndarray,
+    previous: tuple[float, float],
+    last: tuple[float, float],
+) -> list[int]:
+    # Largest-Triangle-Three-Buckets: 各区間から、直前に選んだ点と次の区間の平均点とで作る三角形が最大になる点を選ぶ
+    ends = np.r_[starts[1:], len(x)]
+    counts = ends - starts
+    mean_x = np.add.reduceat(x, starts) / counts
+    mean_y = np.add.reduceat(y, starts) / counts
+    next_x = np.r_[mean_x[1:], last[0]]
+    next_y = np.r_[mean_y[1:], last[1]]
+
+    selected = []
+    ax, ay = previous
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist(), strict=True)):
+        seg_x, seg_y = x[start:end], y[start:end]
+        area = np.abs((ax - next_x[i]) * (seg_y - ay) - (ax - seg_x) * (next_y[i] - ay))
+        index = start + int(np.argmax(area))
+        selected.append(index)
+        ax, ay = x[index], y[index]
+    return selected
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    count = len(x)
+    if count <= max_points or max_points < 3:
+        return np.arange(count)
+    # 先頭と末尾は必ず残し、間を max_points - 2 個の区間に分ける
+    starts = np.unique(np.linspace(1, count - 1, max_points - 1).astype(np.int64)[:-1])
+    interior = lttb_select(x[: count - 1], y[: count - 1], starts, (x[0], y[0]), (x[-1], y[-1]))
+    return np.array([0, *interior, count - 1])
+
+
+def downsample_points(
+    points: Iterable[dict], max_points: int, total: int | None = None, key: str = "equity"
+) -> Iterator[dict]:
+    # チャートの点（time / equity などの dict）を、形を保ったまま max_points 点程度に間引く
+    # total（点の数）が分かっていれば、区間を2つ先読みするだけで読み進める（全点をメモリに持たない）
+    # key の値がない点は間引かずにそのまま残す
+    if total is None:
+        points = list(points)
+        total = len(points)
+    if total <= max_points or max_points < 3:
+        yield from points
+        return
+    # lttb_indices と同じく、先頭と末尾の点は必ず残し、間を max_points - 2 個の区間に分ける
+    starts = np.unique(np.linspace(1, total - 1, max_points - 1).astype(np.int64)[:-1]).tolist()
+    previous: tuple[float, float] | None = None
+
+    def valued(bucket: list[tuple[int, dict]]) -> tuple[np.ndarray, np.ndarray]:
+        rows = [(i, point[key]) for i, point in bucket if point.get(key) is not None]
+        return np.array([i for i, _ in rows], dtype=np.float64), np.array([v for _, v in rows], dtype=np.float64)
+
+    def mean_of(bucket: list[tuple[int, dict]]) -> tuple[float, float] | None:
+        x, y = valued(bucket)
+        return (x.mean(), y.mean()) if len(x) else None
+
+    def select(bucket: list[tuple[int, dict]], following: tuple[float, float] | None) -> Iterator[dict]:
+        nonlocal previous
+        x, y = valued(bucket)
+        chosen = None
+        if len(x):
+            ax, ay = previous or (x[0], y[0])
+            nx, ny = following or (x.mean(), ay)
+            k = int(np.argmax(np.abs((ax - nx) * (y - ay) - (ax - x) * (ny - ay))))
+            chosen = int(x[k])
+            previous = (x[k], y[k])
+        for i, point in bucket:
+            if i == chosen or point.get(key) is None:
+                yield point
+
+    pending: list[list[tuple[int, dict]]] = []
+    pending_index = -1
+    held: tuple[int, dict] | None = None
+    for i, point in enumerate(points):
+        if i == 0:
+            if point.get(key) is not None:
+                previous = (0.0, float(point[key]))
+            yield point
+            continue
+        if held is not None:
+            index = max(0, bisect.bisect_right(starts, held[0]) - 1)
+            if index != pending_index:
+                pending.append([])
+                pending_index = index
+            pending[-1].append(held)
+            # 次の区間の平均が確定した区間から順に点を選ぶ
+            while len(pending) > 2:
+                yield from select(pending.pop(0), mean_of(pending[0]))
+        held = (i, point)
+
+    last = None
+    if held is not None and held[1].get(key) is not None:
+        last = (float(held[0]), float(held[1][key]))
+    while pending:
+        bucket = pending.pop(0)
+        yield from select(bucket, mean_of(pending[0]) if pending else last)
+    if held is not None:
+        yield held[1]
+
+
+def downsample_parts(
+    parts: Iterator[dict[str, np.ndarray]],
+    start: datetime,
+    end: datetime,
+    max_points: int,
+) -> Iterator[dict[str, np.ndarray]]:
+    # 期間を max_points 個の時間の区間に分け、区間ごとに足をまとめる（OHLC）か LTTB で1点を選ぶ
+    # 区間が部分をまたぐことがあるので、まだ終わっていない区間の行だけを次の部分に持ち越す
+    start_ns = np.datetime64(to_utc_naive(start), "ns").astype(np.int64)
+    end_ns = np.datetime64(to_utc_naive(end), "ns").astype(np.int64)
+    width = max(1, -(-(end_ns - start_ns + 1) // max(1, max_points - 2)))
+
+    carry: dict[str, np.ndarray] | None = None
+    previous: tuple[float, float] | None = None
+    ohlc: bool | None = None
+    for part in parts:
+        if ohlc is None:
+            ohlc = is_ohlc(part)
+        columns = concat_columns([carry, part]) if carry is not None else part
+        if not ohlc and previous is None:
+            # LTTB では先頭の点は必ず残す
+            x, y = lttb_axes(columns, start_ns)
+            previous = (x[0], y[0])
+            yield {name: values[:1] for name, values in columns.items()}
+            columns = {name: values[1:] for name, values in columns.items()}
+
+        starts = bucket_starts(columns, start_ns, width)
+        # OHLC は最後の区間を、LTTB は次の区間の平均が確定するまで最後の2区間を持ち越す
+        keep = 1 if ohlc else 2
+        if len(starts) <= keep:
+            carry = columns
+            continue
+        cut = int(starts[-keep])
+        done = {name: values[:cut] for name, values in columns.items()}
+        carry = {name: values[cut:] for name, values in columns.items()}
+        if ohlc:
+            yield aggregate_ohlc(done, starts[:-keep])
+            continue
+        x, y = lttb_axes(columns, start_ns)
+        following = int(starts[-1])
+        next_mean = (x[cut:following].mean(), y[cut:following].mean())
+        selected = lttb_select(x[:cut], y[:cut], starts[:-keep], previous, next_mean)
+        previous = (x[selected[-1]], y[selected[-1]])
+        yield {name: values[selected] for name, values in done.items()}
+
+    if carry is None or not len(carry["time"]):
+        return
+    if ohlc:
+        yield aggregate_ohlc(carry, bucket_starts(carry, start_ns, width))
+        return
+    # 末尾の点は必ず残す
+    x, y = lttb_axes(carry, start_ns)
+    rest = {name: values[:-1] for name, values in carry.items()}
+    if len(rest["time"]):
+        selected = lttb_select(x[:-1], y[:-1], bucket_starts(rest, start_ns, width), previous, (x[-1], y[-1]))
+        yield {name: values[selected] for name, values in rest.items()}
+    yield {name: values[-1:] for name, values in carry.items()}
+
+
+def bucket_starts(columns: dict[str, np.ndarray], start_ns: int, width: int) -> np.ndarray:
+    buckets = (columns["time"].astype("datetime64[ns]").astype(np.int64) - start_ns) // width
+    return np.r_[0, np.flatnonzero(np.diff(buckets)) + 1] if len(buckets) else np.array([], dtype=np.int64)
+
+
+def lttb_axes(columns: dict[str, np.ndarray], start_ns: int) -> tuple[np.ndarray, np.ndarray]:
+    # 時刻は期間の先頭からの差にして、浮動小数点の桁落ちを避ける
+    x = (columns["time"].astype("datetime64[ns]").astype(np.int64) - start_ns).astype(np.float64)
+    return x, np.asarray(columns[value_column(columns)], dtype=np.float64)
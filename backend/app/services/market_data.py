@@ -0,0 +1,471 @@
+import io
+from collections.abc import Iterable, Sequence
+from datetime import UTC, datetime
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session, undefer
+
+from app.db.session import SessionLocal
+from app.features.datasources.models import DataChunk, DataFormat, RollupChunk
+from app.services.chunk_cache import get_chunk_cache
+from app.services.chunk_codec import CSV_CODEC, decode_columns
+from app.services.storage import get_blob_client
+from app.services.timeframes import is_tick_timeframe, timeframe_seconds
+
+OHLC_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    # DBの日時はタイムゾーンなしのUTCとして扱う
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+def empty_columns(names: Iterable[str]) -> dict[str, np.ndarray]:
+    columns = {"time": np.array([], dtype="datetime64[ns]")}
+    columns.update({name: np.array([], dtype=np.float64) for name in names if name != "time"})
+    return columns
+
+
+def parse_iso_times(values: np.ndarray) -> np.ndarray:
+    # 同一桁数の ISO8601 文字列（例: 2024-01-01T00:00:00.1234567+00:00）を数値演算で一括変換する
+    raw = np.asarray(values).astype("S")
+    n = len(raw)
+    if n == 0:
+        return np.array([], dtype="datetime64[ns]")
+    width = raw.dtype.itemsize
+    m = raw.view(np.uint8).reshape(n, width)
+    if width < 19 or (m[:, -1] == 0).any():
+        return _parse_iso_times_fallback(values)
+
+    def is_char(p: int, *chars: str) -> bool:
+        return bool(np.isin(m[:, p], [ord(c) for c in chars]).all())
+
+    def is_digits(positions: Iterable[int]) -> bool:
+        block = m[:, list(positions)]
+        return bool(((block >= ord("0")) & (block <= ord("9"))).all())
+
+    def number(*positions: int) -> np.ndarray:
+        weights = 10 ** np.arange(len(positions) - 1, -1, -1, dtype=np.int64)
+        return (m[:, list(positions)].astype(np.int64) - ord("0")) @ weights
+
+    if not (
+        is_char(4, "-")
+        and is_char(7, "-")
+        and is_char(10, "T", " ")
+        and is_char(13, ":")
+        and is_char(16, ":")
+        and is_digits([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])
+    ):
+        return _parse_iso_times_fallback(values)
+
+    pos = 19
+    frac = np.zeros(n, dtype=np.int64)
+    if width > pos and is_char(pos, "."):
+        end = pos + 1
+        while end < width and ord("0") <= m[0, end] <= ord("9"):
+            end += 1
+        if not is_digits(range(pos + 1, end)):
+            return _parse_iso_times_fallback(values)
+        # ナノ秒より細かい桁は切り捨て
+        count = min(end - pos - 1, 9)
+        frac = number(*range(pos + 1, pos + 1 + count)) * 10 ** (9 - count)
+        pos = end
+
+    offset = np.zeros(n, dtype=np.int64)
+    suffix = width - pos
+    if (
+        suffix == 6
+        and is_char(pos, "+", "-")
+        and is_char(pos + 3, ":")
+        and is_digits([pos + 1, pos + 2, pos + 4, pos + 5])
+    ):
+        sign = np.where(m[:, pos] == ord("-"), -1, 1)
+        offset = sign * (number(pos + 1, pos + 2) * 3600 + number(pos + 4, pos + 5) * 60)
+    elif not (suffix == 0 or (suffix == 1 and is_char(pos, "Z"))):
+        return _parse_iso_times_fallback(values)
+
+    year, month, day = number(0, 1, 2, 3), number(5, 6), number(8, 9)
+    months = (year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)
+    days = months.astype("datetime64[D]").view(np.int64) + (day - 1)
+    # 時分秒は 10時間,1時間,10分,1分,10秒,1秒 の桁を秒数に重み付けして合算
+    clock = (m[:, [11, 12, 14, 15, 17, 18]].astype(np.int64) - ord("0")) @ np.array([36000, 3600, 600, 60, 10, 1])
+    seconds = days * 86400 + clock - offset
+    return (seconds * 1_000_000_000 + frac).view("datetime64[ns]")
+
+
+def _parse_iso_times_fallback(values: np.ndarray) -> np.ndarray:
+    times = pd.to_datetime(pd.Series(values), format="ISO8601", utc=True)
+    return times.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def parse_csv_payloads(payloads: Iterable[bytes | str]) -> dict[str, np.ndarray]:
+    # ヘッダが同じチャンクは本体を連結し、まとめて1回でパースする
+    groups: list[tuple[bytes, list[bytes]]] = []
+    for payload in payloads:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        header, _, body = payload.partition(b"\n")
+        header = header.strip().lower()
+        if not header:
+            continue
+        if not body.endswith(b"\n"):
+            body += b"\n"
+        if groups and groups[-1][0] == header:
+            groups[-1][1].append(body)
+        else:
+            groups.append((header, [body]))
+
+    if not groups:
+        return empty_columns(())
+
+    parts = []
+    for header, bodies in groups:
+        names = header.decode().split(",")
+        df = pd.read_csv(
+            io.BytesIO(b"".join(bodies)),
+            header=None,
+            names=names,
+            dtype={name: np.float64 for name in names if name != "time"},
+            engine="c",
+        )
+        parts.append(df)
+    df = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+    columns = {"time": parse_iso_times(df["time"].to_numpy())}
+    for name in df.columns:
+        if name != "time":
+            columns[name] = df[name].to_numpy(dtype=np.float64)
+    return columns
+
+
+def concat_columns(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    parts = [part for part in parts if len(part["time"])]
+    if not parts:
+        return empty_columns(())
+    if len(parts) == 1:
+        return parts[0]
+    names = list(dict.fromkeys(name for part in parts for name in part))
+    # 列が欠けているチャンクは NaN で埋める
+    return {
+        name: np.concatenate([part[name] if name in part else np.full(len(part["time"]), np.nan) for part in parts])
+        for name in names
+    }
+
+
+def decode_payload(codec: str, data: bytes) -> dict[str, np.ndarray]:
+    if codec == CSV_CODEC:
+        return parse_csv_payloads([bytes(data)])
+    return decode_columns(data, codec)
+
+
+def decode_chunk_payload(codec: str, data: bytes, content_hash: str | None) -> dict[str, np.ndarray]:
+    # ファイルに置いたチャンクは mmap して展開する（DB の data は空）
+    if content_hash is None:
+        return decode_payload(codec, data)
+    with get_blob_client().map_content(content_hash) as payload:
+        return decode_payload(codec, payload)
+
+
+def load_decoded_chunks(
+    db: Session, chunks: Sequence[tuple[UUID, int, str]], use_cache: bool = True
+) -> list[dict[str, np.ndarray]]:
+    # (id, version, codec) のチャンクをデコード済みの列で返す（キャッシュにないものだけ本体を読み込む）
+    # use_cache=False はマージ・上位足の作り直しなど一度しか読まない走査用で、キャッシュは参照だけして追加しない
+    # （よく使うチャンクを追い出したり、全期間をディスクに書き出したりしない）
+    cache = get_chunk_cache()
+    lookup = cache.get if use_cache else cache.peek
+    decoded = [lookup((chunk_id, version)) for chunk_id, version, _ in chunks]
+    missing = [i for i, columns in enumerate(decoded) if columns is None]
+    if missing:
+        ids = [chunks[i][0] for i in missing]
+        payloads = {
+            row.id: (row.data, row.content_hash)
+            for row in db.query(DataChunk.id, DataChunk.data, DataChunk.content_hash).filter(DataChunk.id.in_(ids))
+        }
+        for i in missing:
+            chunk_id, version, codec = chunks[i]
+            columns = sort_by_time(decode_chunk_payload(codec, *payloads[chunk_id]))
+            decoded[i] = cache.put((chunk_id, version), columns) if use_cache else columns
+    return decoded
+
+
+def sort_by_time(columns: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    times = columns["time"]
+    if len(times) < 2 or not (times[1:] < times[:-1]).any():
+        return columns
+    order = np.argsort(times, kind="stable")
+    return {name: values[order] for name, values in columns.items()}
+
+
+def trim_columns(columns: dict[str, np.ndarray], start: datetime, end: datetime) -> dict[str, np.ndarray]:
+    # 時刻順に並んでいる前提で [start, end] をスライス（コピーなし）
+    times = columns["time"]
+    lo = np.searchsorted(times, np.datetime64(to_utc_naive(start), "ns"), side="left")
+    hi = np.searchsorted(times, np.datetime64(to_utc_naive(end), "ns"), side="right")
+    return {name: values[lo:hi] for name, values in columns.items()}
+
+
+def _price_column(columns: dict[str, np.ndarray]) -> np.ndarray:
+    if "bid" in columns:
+        return columns["bid"]
+    if "close" in columns:
+        return columns["close"]
+    return next(values for name, values in columns.items() if name != "time")
+
+
+def resample_ticks(columns: dict[str, np.ndarray], timeframe: str) -> dict[str, np.ndarray]:
+    times = columns["time"]
+    if len(times) == 0:
+        return empty_columns(OHLC_COLUMNS)
+    price = _price_column(columns)
+
+    if is_tick_timeframe(timeframe):
+        volume = columns["volume"] if "volume" in columns else np.ones(len(times))
+        return {"time": times, "open": price, "high": price, "low": price, "close": price, "volume": volume}
+
+    starts, ends, bucket_times = _bucket_bounds(times, timeframe)
+    if "volume" in columns:
+        volume = np.add.reduceat(columns["volume"], starts)
+    else:
+        # 出来高がない場合はティック数を出来高とする
+        volume = (ends - starts).astype(np.float64)
+    return {
+        "time": bucket_times,
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends - 1],
+        "volume": volume,
+    }
+
+
+def resample_ohlc(columns: dict[str, np.ndarray], timeframe: str) -> dict[str, np.ndarray]:
+    times = columns["time"]
+    if len(times) == 0:
+        return empty_columns(OHLC_COLUMNS)
+    if is_tick_timeframe(timeframe):
+        raise ValueError("Cannot convert OHLC data to tick timeframe")
+
+    starts, ends, bucket_times = _bucket_bounds(times, timeframe)
+    volume = columns["volume"] if "volume" in columns else np.zeros(len(times))
+    return {
+        "time": bucket_times,
+        "open": columns["open"][starts],
+        "high": np.maximum.reduceat(columns["high"], starts),
+        "low": np.minimum.reduceat(columns["low"], starts),
+        "close": columns["close"][ends - 1],
+        "volume": np.add.reduceat(volume, starts),
+    }
+
+
+def _bucket_bounds(times: np.ndarray, timeframe: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    step = timeframe_seconds(timeframe) * 1_000_000_000
+    ns = times.astype("datetime64[ns]").view(np.int64)
+    buckets = ns - ns % step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ns)]
+    return starts, ends, buckets[starts].view("datetime64[ns]")
+
+
+def to_dataframe(columns: dict[str, np.ndarray]) -> pd.DataFrame:
+    index = pd.DatetimeIndex(columns["time"], name="datetime")
+    return pd.DataFrame({name: columns[name] for name in OHLC_COLUMNS}, index=index)
+
+
+def load_chunk_columns(
+    db: Session,
+    data_source_id: UUID,
+    start: datetime,
+    end: datetime,
+    use_cache: bool = True,
+) -> tuple[dict[str, np.ndarray], DataFormat | None]:
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    chunks = (
+        db.query(DataChunk.id, DataChunk.version, DataChunk.codec, DataChunk.format)
+        .filter(
+            DataChunk.data_source_id == data_source_id,
+            DataChunk.is_active.is_(True),
+            DataChunk.start_time <= end,
+            DataChunk.end_time >= start,
+        )
+        .order_by(DataChunk.start_time)
+        .all()
+    )
+    if not chunks:
+        return empty_columns(()), None
+
+    decoded = load_decoded_chunks(db, [(chunk.id, chunk.version, chunk.codec) for chunk in chunks], use_cache)
+    columns = sort_by_time(concat_columns(decoded))
+    return trim_columns(columns, start, end), chunks[0].format
+
+
+def resample_base(
+    columns: dict[str, np.ndarray], data_format: DataFormat | None, timeframe: str
+) -> dict[str, np.ndarray]:
+    if data_format == DataFormat.ohlc:
+        return resample_ohlc(columns, timeframe)
+    return resample_ticks(columns, timeframe)
+
+
+def load_base_bars(
+    db: Session,
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    end_exclusive: bool = False,
+    use_cache: bool = True,
+) -> dict[str, np.ndarray]:
+    columns, data_format = load_chunk_columns(db, data_source_id, start, end, use_cache)
+    bars = resample_base(columns, data_format, timeframe)
+    if end_exclusive:
+        # end ちょうどのデータから作られた足は含めない
+        keep = bars["time"] < np.datetime64(to_utc_naive(end), "ns")
+        bars = {name: values[keep] for name, values in bars.items()}
+    return bars
+
+
+def pick_rollup_timeframe(db: Session, data_source_id: UUID, timeframe: str) -> str | None:
+    # 要求された足を割り切れる集計済みの足のうち、最も粗いものを使う
+    if is_tick_timeframe(timeframe):
+        return None
+    seconds = timeframe_seconds(timeframe)
+    levels = [
+        level
+        for (level,) in db.query(RollupChunk.timeframe).filter(RollupChunk.data_source_id == data_source_id).distinct()
+    ]
+    usable = [level for level in levels if seconds % timeframe_seconds(level) == 0]
+    return max(usable, key=timeframe_seconds, default=None)
+
+
+def load_rollup_columns(
+    db: Session,
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+) -> dict[str, np.ndarray]:
+    # [start, end) の集計済みの足を読み込む
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    chunks = (
+        db.query(RollupChunk)
+        .options(undefer(RollupChunk.data))
+        .filter(
+            RollupChunk.data_source_id == data_source_id,
+            RollupChunk.timeframe == timeframe,
+            RollupChunk.start_time < end,
+            RollupChunk.end_time > start,
+        )
+        .order_by(RollupChunk.start_time)
+        .all()
+    )
+    columns = concat_columns([decode_columns(chunk.data, chunk.codec) for chunk in chunks])
+    if not len(columns["time"]):
+        return empty_columns(OHLC_COLUMNS)
+    times = columns["time"]
+    keep = (times >= np.datetime64(start, "ns")) & (times < np.datetime64(end, "ns"))
+    return {name: values[keep] for name, values in columns.items()}
+
+
+def _ns_to_datetime(ns: int) -> datetime:
+    return np.int64(ns).view("datetime64[ns]").astype("datetime64[us]").item()
+
+
+def rollup_segments(
+    db: Session, data_source_id: UUID, level: str, start_ns: int, end_ns: int, step: int
+) -> list[tuple[int, int, bool]]:
+    # [start_ns, end_ns) を、集計済みのチャンクがある区間（足の境界に内側で揃える）とない区間に分ける
+    ranges = (
+        db.query(RollupChunk.start_time, RollupChunk.end_time)
+        .filter(
+            RollupChunk.data_source_id == data_source_id,
+            RollupChunk.timeframe == level,
+            RollupChunk.start_time < _ns_to_datetime(end_ns),
+            RollupChunk.end_time > _ns_to_datetime(start_ns),
+        )
+        .order_by(RollupChunk.start_time)
+        .all()
+    )
+    segments: list[tuple[int, int, bool]] = []
+    cursor = start_ns
+    for chunk_start, chunk_end in ranges:
+        lo = max(int(np.datetime64(chunk_start, "ns").view(np.int64)), cursor)
+        hi = min(int(np.datetime64(chunk_end, "ns").view(np.int64)), end_ns)
+        lo += (-lo) % step
+        hi -= hi % step
+        if hi <= lo:
+            continue
+        if lo > cursor:
+            segments.append((cursor, lo, False))
+        if segments and segments[-1][2] and segments[-1][1] == lo:
+            segments[-1] = (segments[-1][0], hi, True)
+        else:
+            segments.append((lo, hi, True))
+        cursor = hi
+    if cursor < end_ns:
+        segments.append((cursor, end_ns, False))
+    return segments
+
+
+def load_bars(
+    db: Session,
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    end_exclusive: bool = False,
+) -> dict[str, np.ndarray]:
+    level = pick_rollup_timeframe(db, data_source_id, timeframe)
+    if level is None:
+        return load_base_bars(db, data_source_id, timeframe, start, end, end_exclusive)
+
+    # 足の境界に揃った中間部分は集計済みの足から、端の半端な部分は下位のデータから作る
+    step = timeframe_seconds(timeframe) * 1_000_000_000
+    start_ns = np.datetime64(to_utc_naive(start), "ns").view(np.int64)
+    end_ns = np.datetime64(to_utc_naive(end), "ns").view(np.int64)
+    head_end = start_ns + (-start_ns) % step
+    tail_start = end_ns - end_ns % step
+    if head_end >= tail_start:
+        return load_base_bars(db, data_source_id, timeframe, start, end, end_exclusive)
+
+    parts = []
+    if head_end > start_ns:
+        parts.append(
+            load_base_bars(db, data_source_id, timeframe, start, _ns_to_datetime(head_end), end_exclusive=True)
+        )
+    # 集計済みの足がない期間（集計より前に保存したチャンクなど）は下位のデータから作る
+    for segment_start, segment_end, covered in rollup_segments(db, data_source_id, level, head_end, tail_start, step):
+        segment_start_time, segment_end_time = _ns_to_datetime(segment_start), _ns_to_datetime(segment_end)
+        if covered:
+            middle = load_rollup_columns(db, data_source_id, level, segment_start_time, segment_end_time)
+            parts.append(resample_ohlc(middle, timeframe) if len(middle["time"]) else middle)
+        else:
+            parts.append(
+                load_base_bars(db, data_source_id, timeframe, segment_start_time, segment_end_time, end_exclusive=True)
+            )
+    if not (end_exclusive and tail_start == end_ns):
+        parts.append(load_base_bars(db, data_source_id, timeframe, _ns_to_datetime(tail_start), end, end_exclusive))
+    bars = concat_columns(parts)
+    return bars if len(bars["time"]) else empty_columns(OHLC_COLUMNS)
+
+
+def fetch_ohlcv_data(
+    data_source_id: UUID,
+    timeframe: str,
+    start: datetime,
+    end: datetime,
+    db: Session | None = None,
+) -> pd.DataFrame:
+    session = db or SessionLocal()
+    try:
+        bars = load_bars(session, data_source_id, timeframe, start, end)
+    finally:
+        if db is None:
+            session.close()
+    return to_dataframe(bars)
@@ -0,0 +1,30 @@
+import numpy as np
+
+HOUR_NS = 3600 * 1_000_000_000
+WEEK_NS = 7 * 24 * HOUR_NS
+# FX 市場は日曜 22:00 (UTC) に開き、金曜 21:00 (UTC) に閉じるものとする
+# （夏時間・冬時間のどちらでも開いている時間帯だけを取り、休場中のデータを想定しない）
+WEEK_OPEN_NS = (3 * 24 + 22) * HOUR_NS  # 1970-01-04 (日) 22:00
+OPEN_NS = (4 * 24 + 23) * HOUR_NS
+
+
+def open_ns_until(ns: np.ndarray) -> np.ndarray:
+    # エポックから各時刻までの開場時間の累計（週単位の周期で計算する）
+    offset = np.asarray(ns, dtype=np.int64) - WEEK_OPEN_NS
+    weeks, rest = np.divmod(offset, WEEK_NS)
+    return weeks * OPEN_NS + np.minimum(rest, OPEN_NS)
+
+
+def open_ns_between(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # [start, end) の開場時間をまとめて計算する
+    return open_ns_until(ends) - open_ns_until(starts)
+
+
+def is_open(ns: np.ndarray) -> np.ndarray:
+    rest = (np.asarray(ns, dtype=np.int64) - WEEK_OPEN_NS) % WEEK_NS
+    return rest < OPEN_NS
+
+
+def expected_slots(starts: np.ndarray, ends: np.ndarray, slot: int) -> np.ndarray:
+    # 開場時間に含まれる足（または slot 単位の区間）の数
+    return np.rint(open_ns_between(starts, ends) / slot).astype(np.int64)
@@ -1,8 +1,35 @@
+import hashlib
+import io
+import logging
+import mmap
 import os
-import shutil
+import tempfile
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import BinaryIO
 
-from app.db.session import get_db
-from app.features.blobs.models import Blob
+import anyio
+from sqlalchemy.orm import Session
+
+from app.features.blobs import crud
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def get_gc_grace_seconds() -> float:
+    return float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+
+def hash_stream(stream: BinaryIO) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(COPY_BUFFER_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
 
 
 class BlobStorageException(Exception):
@@ -13,12 +40,100 @@ class BlobStorageClient:
     def read_blob(self, container_name: str, blob_name: str) -> bytes:
         raise NotImplementedError()
 
-    def upload_file(self, local_path: str, container_name: str, blob_name: str) -> int:
+    def get_blob_path(self, container_name: str, blob_name: str) -> str | None:
+        # ローカルのファイルとして読めるときはそのパス（ファイルのまま返せる）
+        return None
+
+    def read_content(self, content_hash: str) -> bytes:
         raise NotImplementedError()
 
-    def upload_blob(self, container_name: str, blob_name: str, data: bytes) -> int:
+    def get_content_path(self, content_hash: str) -> str | None:
+        return None
+
+    @contextmanager
+    def map_content(self, content_hash: str) -> Iterator[bytes | mmap.mmap]:
+        yield self.read_content(content_hash)
+
+    def put_content(self, db: Session, stream: BinaryIO) -> tuple[str, int]:
+        # 書き込みながらハッシュを求め、内容の参照を取ってから本体を保存する（同じ内容がすでにあれば保存しない）
+        # 参照は呼び出し側のトランザクションに含まれ、コミットで確定する
         raise NotImplementedError()
 
+    def put_file(self, db: Session, local_path: str) -> tuple[str, int]:
+        with open(local_path, "rb") as f:
+            return self.put_content(db, f)
+
+    def delete_content(self, content_hash: str) -> None:
+        raise NotImplementedError()
+
+    def upload_stream(
+        self,
+        db: Session,
+        container_name: str,
+        blob_name: str,
+        stream: BinaryIO,
+        content_type: str = "application/octet-stream",
+    ) -> tuple[str, int]:
+        content_hash, size = self.put_content(db, stream)
+        return self._put_blob(db, container_name, blob_name, content_hash, size, content_type)
+
+    def upload_file(
+        self,
+        db: Session,
+        local_path: str,
+        container_name: str,
+        blob_name: str,
+        content_type: str = "application/octet-stream",
+    ) -> tuple[str, int]:
+        content_hash, size = self.put_file(db, local_path)
+        return self._put_blob(db, container_name, blob_name, content_hash, size, content_type)
+
+    def upload_blob(
+        self,
+        db: Session,
+        container_name: str,
+        blob_name: str,
+        data: bytes,
+        content_type: str = "application/octet-stream",
+    ) -> tuple[str, int]:
+        return self.upload_stream(db, container_name, blob_name, io.BytesIO(data), content_type)
+
+    def delete_blob(self, db: Session, container_name: str, blob_name: str) -> bool:
+        # 参照を外すだけで、本体は collect_garbage で削除する
+        blob = crud.get_blob_by_name(container_name, blob_name, db)
+        if blob is None:
+            return False
+        crud.delete_blob(db, blob)
+        db.commit()
+        return True
+
+    def collect_garbage(self, db: Session, grace_seconds: float | None = None) -> int:
+        # 参照されなくなってから猶予を過ぎた内容だけを削除する（直前に同じ内容を書き込んだアップロードを壊さない）
+        grace = get_gc_grace_seconds() if grace_seconds is None else grace_seconds
+        released_before = datetime.now() - timedelta(seconds=grace)
+        removed = 0
+        for content_hash in crud.find_unreferenced_contents(db, released_before):
+            if not crud.remove_content(db, content_hash, released_before):
+                continue
+            # 行を消したトランザクションのままファイルを消す（同じ内容の参照を取るアップロードはコミットまで待ち、
+            # その後に本体がなければ保存し直す）
+            try:
+                self.delete_content(content_hash)
+            except Exception:
+                db.rollback()
+                raise
+            db.commit()
+            removed += 1
+        logger.info(f"[BlobStorage] Removed {removed} unreferenced contents")
+        return removed
+
+    def _put_blob(
+        self, db: Session, container_name: str, blob_name: str, content_hash: str, size: int, content_type: str
+    ) -> tuple[str, int]:
+        blob = crud.put_blob(db, container_name, blob_name, content_hash, size, {"Content-Type": content_type})
+        db.commit()
+        return blob.blob_path, size
+
 
 class LocalBlobStorageClient(BlobStorageClient):
     def __init__(self):
@@ -26,58 +141,193 @@ class LocalBlobStorageClient(BlobStorageClient):
 
     def read_blob(self, container_name: str, blob_name: str) -> bytes:
         try:
-            with open(
-                os.path.join(self._base_path, container_name.lstrip("/"), blob_name),
-                "rb",
-            ) as f:
+            with open(self.get_blob_path(container_name, blob_name), "rb") as f:
                 return f.read()
         except Exception as e:
             raise BlobStorageException(e) from e
 
-    def upload_file(
-        self, local_path: str, container_name: str, blob_name: str
-    ) -> tuple[str, int]:
-        db = get_db()
+    def get_blob_path(self, container_name: str, blob_name: str) -> str:
+        base = os.path.realpath(self._base_path)
+        path = os.path.realpath(os.path.join(base, container_name.lstrip("/"), blob_name))
+        # ストレージの外のファイルは返さない
+        if os.path.commonpath([base, path]) != base:
+            raise BlobStorageException(f"Invalid blob path: {container_name}/{blob_name}")
+        return path
+
+    def read_content(self, content_hash: str) -> bytes:
         try:
-            blob_path = os.path.join(container_name.lstrip("/"), blob_name)
-            db.add(
-                Blob(
-                    container_name=container_name,
-                    blob_name=blob_name,
-                    meta_data={"Content-Type": "application/octet-stream"},
-                    blob_path=f"/blobs/{blob_path}",
-                )
-            )
-
-            path = os.path.join(self._base_path, blob_path)
-            os.makedirs(os.path.dirname(path))
-            with open(path, "wb") as rf:
-                with open(local_path, "rb") as lf:
-                    shutil.copyfileobj(lf, rf)
-            return f"/blobs/{blob_path}", os.path.getsize(local_path)
+            with open(self.get_content_path(content_hash), "rb") as f:
+                return f.read()
         except Exception as e:
             raise BlobStorageException(e) from e
 
-    def upload_blob(self, container_name: str, blob_name: str, data: bytes) -> int:
-        db = get_db()
+    def get_content_path(self, content_hash: str) -> str:
+        # {base}/objects/ab/cdef... （1 ディレクトリのファイル数を抑える）
+        if len(content_hash) != 64 or not all(c in "0123456789abcdef" for c in content_hash):
+            raise BlobStorageException(f"Invalid content hash: {content_hash}")
+        return os.path.join(self._base_path, "objects", content_hash[:2], content_hash[2:])
+
+    @contextmanager
+    def map_content(self, content_hash: str) -> Iterator[bytes | mmap.mmap]:
+        # ページキャッシュをそのまま参照し、本体をバイト列にコピーしない
         try:
-            blob_path = os.path.join(container_name.lstrip("/"), blob_name)
-            db.add(
-                Blob(
-                    container_name=container_name,
-                    blob_name=blob_name,
-                    meta_data={"Content-Type": "application/octet-stream"},
-                    blob_path=f"/blobs/{blob_path}",
-                )
-            )
-
-            path = os.path.join(self._base_path, blob_path)
-            os.makedirs(os.path.dirname(path))
-            with open(path, "wb") as f:
-                f.write(data)
-            return f"/blobs/{blob_path}", len(data)
-        except Exception as e:
+            f = open(self.get_content_path(content_hash), "rb")
+        except OSError as e:
+            raise BlobStorageException(e) from e
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def put_content(self, db: Session, stream: BinaryIO) -> tuple[str, int]:
+        tmp_path, content_hash, size = self.write_temp(stream)
+        try:
+            self.store_temp(db, tmp_path, content_hash, size)
+            return content_hash, size
+        except OSError as e:
+            raise BlobStorageException(e) from e
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, db: Session, local_path: str) -> tuple[str, int]:
+        # ローカルのファイルは先にハッシュだけ求め、新しい内容のときだけコピーする
+        try:
+            with open(local_path, "rb") as f:
+                content_hash, size = hash_stream(f)
+            crud.acquire_content(db, content_hash, size)
+            if os.path.exists(self.get_content_path(content_hash)):
+                return content_hash, size
+            with open(local_path, "rb") as f:
+                tmp_path, _, _ = self.write_temp(f)
+        except OSError as e:
+            raise BlobStorageException(e) from e
+        try:
+            self._place(tmp_path, content_hash)
+            return content_hash, size
+        except OSError as e:
             raise BlobStorageException(e) from e
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_temp(self, stream: BinaryIO) -> tuple[str, str, int]:
+        # 書きながらハッシュを求める
+        fd, tmp_path = self.create_temp()
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                while chunk := stream.read(COPY_BUFFER_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except OSError as e:
+            os.remove(tmp_path)
+            raise BlobStorageException(e) from e
+        return tmp_path, digest.hexdigest(), size
+
+    def create_temp(self) -> tuple[int, str]:
+        # 書き込み途中のファイルは objects/ の外に置く
+        tmp_dir = os.path.join(self._base_path, "tmp")
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            return tempfile.mkstemp(dir=tmp_dir)
+        except OSError as e:
+            raise BlobStorageException(e) from e
+
+    def store_temp(self, db: Session, tmp_path: str, content_hash: str, size: int) -> None:
+        # 参照を取ってから本体の有無を確かめる（GC は参照の削除とファイルの削除を1トランザクションで行うので、
+        # 参照を取った内容の本体は消されない）。一時ファイルの削除は呼び出し側で行う
+        crud.acquire_content(db, content_hash, size)
+        self._place(tmp_path, content_hash)
+
+    def _place(self, tmp_path: str, content_hash: str) -> None:
+        # 同じ内容がすでにあれば一時ファイルは使わない
+        path = self.get_content_path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+
+    def delete_content(self, content_hash: str) -> None:
+        try:
+            os.remove(self.get_content_path(content_hash))
+        except FileNotFoundError:
+            pass
+
+
+class AsyncBlobStorageClient:
+    # リクエストハンドラーから使う非同期版（本体はチャンクごとの非同期イテレーターで受け渡し、スレッドを占有しない）
+    def read_blob_stream(self, container_name: str, blob_name: str) -> AsyncIterator[bytes]:
+        raise NotImplementedError()
+
+    def read_content_stream(self, content_hash: str) -> AsyncIterator[bytes]:
+        raise NotImplementedError()
+
+    async def put_content_stream(self, db: Session, chunks: AsyncIterable[bytes]) -> tuple[str, int]:
+        # 同期版の put_content と同じく、参照を取ってから本体を保存する
+        raise NotImplementedError()
+
+    async def upload_stream(
+        self,
+        db: Session,
+        container_name: str,
+        blob_name: str,
+        chunks: AsyncIterable[bytes],
+        content_type: str = "application/octet-stream",
+    ) -> tuple[str, int]:
+        content_hash, size = await self.put_content_stream(db, chunks)
+
+        def put() -> str:
+            blob = crud.put_blob(db, container_name, blob_name, content_hash, size, {"Content-Type": content_type})
+            db.commit()
+            return blob.blob_path
+
+        return await anyio.to_thread.run_sync(put), size
+
+
+class AsyncLocalBlobStorageClient(AsyncBlobStorageClient):
+    def __init__(self):
+        # パスの決め方・保存先は同期版と共有する
+        self._local = LocalBlobStorageClient()
+
+    async def read_blob_stream(self, container_name: str, blob_name: str) -> AsyncIterator[bytes]:
+        async for chunk in self._read_file(self._local.get_blob_path(container_name, blob_name)):
+            yield chunk
+
+    async def read_content_stream(self, content_hash: str) -> AsyncIterator[bytes]:
+        async for chunk in self._read_file(self._local.get_content_path(content_hash)):
+            yield chunk
+
+    async def put_content_stream(self, db: Session, chunks: AsyncIterable[bytes]) -> tuple[str, int]:
+        fd, tmp_path = await anyio.to_thread.run_sync(self._local.create_temp)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with await anyio.open_file(fd, "wb") as f:
+                async for chunk in chunks:
+                    # ハッシュの計算も書き込みと一緒にスレッドで行う
+                    await anyio.to_thread.run_sync(digest.update, chunk)
+                    await f.write(chunk)
+                    size += len(chunk)
+            content_hash = digest.hexdigest()
+            await anyio.to_thread.run_sync(self._local.store_temp, db, tmp_path, content_hash, size)
+            return content_hash, size
+        except OSError as e:
+            raise BlobStorageException(e) from e
+        finally:
+            await anyio.Path(tmp_path).unlink(missing_ok=True)
+
+    async def _read_file(self, path: str) -> AsyncIterator[bytes]:
+        try:
+            f = await anyio.open_file(path, "rb")
+        except OSError as e:
+            raise BlobStorageException(e) from e
+        async with f:
+            while chunk := await f.read(COPY_BUFFER_SIZE):
+                yield chunk
 
 
 # Blob client factory
@@ -87,3 +337,11 @@ def get_blob_client() -> BlobStorageClient:
         return LocalBlobStorageClient()
     else:
         raise ValueError(f"Unknown BLOB_MODE: {mode}")
+
+
+def get_async_blob_client() -> AsyncBlobStorageClient:
+    mode = os.getenv("BLOB_MODE", "local")
+    if mode == "local":
+        return AsyncLocalBlobStorageClient()
+    else:
+        raise ValueError(f"Unknown BLOB_MODE: {mode}")
@@ -0,0 +1,23 @@
+import re
+from datetime import timedelta
+
+TIMEFRAME_PATTERN = re.compile(r"^(\d+)(m|h|d)$")
+UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def is_tick_timeframe(timeframe: str) -> bool:
+    return timeframe == "tick"
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    m = TIMEFRAME_PATTERN.match(timeframe)
+    if not m:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    return int(m.group(1)) * UNIT_SECONDS[m.group(2)]
+
+
+def chunk_span(timeframe: str) -> timedelta:
+    # tick / 1分足以下は1時間、それより上位の足は1日単位でチャンク化する
+    if is_tick_timeframe(timeframe) or timeframe_seconds(timeframe) <= 60:
+        return timedelta(hours=1)
+    return timedelta(days=1)
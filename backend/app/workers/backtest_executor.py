@@ -2,15 +2,31 @@ import json
 import logging
 import subprocess
 import tempfile
+import time
 import traceback
+from datetime import datetime
 from pathlib import Path
+from uuid import UUID
 
 import pandas as pd
 
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
+from app.features.backtesting import cache
+from app.features.backtesting.logic import derive_group_status, with_default_parameters
 from app.features.backtesting.models import BacktestRun
 from app.features.backtesting.schemas import BacktestStatus
 from app.features.strategies.models import StrategyVersion
+from app.services.market_data import fetch_ohlcv_data, to_utc_naive
+from app.workers.data_loader import COLUMNAR_DIR, CSV_FILE, get_data_format, load_data, write_columns
+from app.workers.datasets import link_dataset, prepare_shared_dataset, remove_shared_dataset
+from app.workers.output_ingest import OutputWriter, clear_outputs, follow_outputs, ingest_json_arrays
+from app.workers.strategy_runner import run_strategy
+from app.workers.vector_engine import UnsupportedTemplate, get_engine_mode, run_vector_backtest
+
+
+class StrategyError(Exception):
+    # 戦略側の問題で、再試行しても結果が変わらない失敗
+    pass
 
 
 def write_json(obj: dict | list, path: Path):
@@ -18,25 +34,108 @@ def write_json(obj: dict | list, path: Path):
         json.dump(obj, f, indent=2, ensure_ascii=False)
 
 
-def write_dataframe(df: pd.DataFrame, path: Path):
-    df.to_csv(path, index=True)
+def write_dataframe(df: pd.DataFrame, work_dir: Path, fmt: str = "npy"):
+    if fmt == "csv":
+        df.to_csv(work_dir / CSV_FILE, index=True)
+    else:
+        write_columns(df, work_dir / COLUMNAR_DIR)
+
+
+def shared_dataset_scope(run: BacktestRun) -> tuple[str, datetime, datetime] | None:
+    # 最適化の各組み合わせ・ウォークフォワードの各ウィンドウは同じデータを使うため、1度だけ準備して共有する
+    if run.optimization_id is not None:
+        return f"opt_{run.optimization_id}", run.start_time, run.end_time
+    if run.walk_forward_id is not None:
+        wf = run.walk_forward
+        return f"wf_{wf.id}", wf.start_time, wf.end_time
+    return None
+
+
+def release_shared_dataset(backtest_id: UUID) -> None:
+    # 最適化・ウォークフォワードの最後の実行が終わったら共有データセットを削除する（状態の取得を待たない）
+    # 再試行を待つ実行が残っているうちは削除しない
+    with SessionLocal() as db:
+        run = db.get(BacktestRun, backtest_id)
+        scope = shared_dataset_scope(run) if run is not None else None
+        if scope is None:
+            return
+        group = run.optimization or run.walk_forward
+        _, completed_at = derive_group_status(group.runs)
+        if completed_at is not None:
+            remove_shared_dataset(scope[0])
+
+
+def prepare_input_data(run: BacktestRun, db, work_dir: Path):
+    scope = shared_dataset_scope(run)
+    key, start, end = scope or (None, run.start_time, run.end_time)
+
+    # データ取得 (tick → OHLC変換済みのDataFrameを想定)
+    def load() -> pd.DataFrame:
+        return fetch_ohlcv_data(
+            data_source_id=run.data_source_id,
+            timeframe=run.timeframe,
+            start=start,
+            end=end,
+            db=db,
+        )
+
+    fmt = get_data_format()
+    if key is None:
+        write_dataframe(load(), work_dir, fmt)
+        return
+
+    dataset_dir = prepare_shared_dataset(key, load)
+    # ウィンドウの期間だけを参照する（最適化では全範囲）
+    link_dataset(dataset_dir, work_dir, to_utc_naive(run.start_time), to_utc_naive(run.end_time))
+    if fmt == "csv":
+        write_dataframe(load_data(work_dir), work_dir, fmt)
+
+
+def run_template_backtest(template: dict | None, work_dir: Path, params: dict) -> tuple | None:
+    # テンプレートがベクトル化エンジンに対応していればプロセス内で実行する
+    mode = get_engine_mode()
+    if mode == "backtrader" or not template:
+        return None
+    data = load_data(work_dir)
+    try:
+        return run_vector_backtest(template, data, params)
+    except UnsupportedTemplate:
+        if mode == "vector":
+            raise
+        return None
+    except Exception as e:
+        # テンプレートの計算中のエラーは同じデータで再実行しても変わらない
+        raise StrategyError(f"Vector engine failed: {e}") from e
+
+
+def read_result(work_dir: Path) -> dict:
+    try:
+        with open(work_dir / "result.json") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        raise StrategyError(f"Invalid result.json: {e}") from e
 
 
-def execute_backtest(backtest_id: str, logger: logging.Logger):
+def execute_backtest(backtest_id: UUID, logger: logging.Logger):
     db = next(get_db())
 
     run: BacktestRun = db.query(BacktestRun).filter_by(id=backtest_id).first()
     if not run:
         logger.info(f"[Executor] Backtest {backtest_id} not found")
         return
+    if run.status in (BacktestStatus.success, BacktestStatus.failed):
+        # リース切れで再配信されたタスクなど、完了済みのものは実行しない
+        logger.info(f"[Executor] Backtest {backtest_id} already finished")
+        return
 
     strategy_version: StrategyVersion = run.strategy_version
-    if not strategy_version or not strategy_version.generated_code:
+    if not strategy_version or not (strategy_version.generated_code or strategy_version.template_json):
         run.status = BacktestStatus.failed
         run.error_message = "No strategy code found"
         db.commit()
         return
 
+    started = time.monotonic()
     try:
         logger.info(f"[Executor] Starting backtest: {backtest_id}")
         run.status = BacktestStatus.running
@@ -47,41 +146,74 @@ def execute_backtest(backtest_id: str, logger: logging.Logger):
 
         # 入力ファイルを書き出し
         code_path = work_dir / "strategy.py"
-        code_path.write_text(strategy_version.generated_code, encoding="utf-8")
+        code_path.write_text(strategy_version.generated_code or "", encoding="utf-8")
 
-        params = run.parameters or {}
-        params["initial_cash"] = params.get("initial_cash", 100000)
+        params = with_default_parameters(run.parameters)
         write_json(params, work_dir / "params.json")
 
-        # データ取得 (tick → OHLC変換済みのDataFrameを想定)
-        df = fetch_ohlcv_data(
-            data_source_id=run.data_source_id,
-            timeframe=run.timeframe,
-            start=run.start_time,
-            end=run.end_time,
-        )
-        write_dataframe(df, work_dir / "data.csv")
-
-        # 実行
-        result = subprocess.run(
-            ["python", str(code_path), "--input-dir", str(work_dir)],
-            capture_output=True,
-            text=True,
-            timeout=60,
+        # 実行時点のチャンクのバージョンでキーを計算し直す
+        run.cache_key = cache.compute_cache_key(
+            db,
+            cache.strategy_source(strategy_version),
+            run.data_source_id,
+            run.timeframe,
+            run.start_time,
+            run.end_time,
+            params,
         )
 
-        if result.returncode != 0:
-            run.status = BacktestStatus.failed
-            run.error_message = f"Execution failed: {result.stderr}"
+        prepare_input_data(run, db, work_dir)
+        # 出力の取り込みは別セッションで行うため、ここで書き込みトランザクションを閉じる
+        db.commit()
+        clear_outputs(db, run.id)
+
+        summary = None
+        counts = {"trades": 0, "chart_data": 0}
+        outputs = run_template_backtest(strategy_version.template_json, work_dir, params)
+        if outputs is not None:
+            # trades / chart_data はジェネレータで、読み進めながらバッチごとに書き込む
+            summary, trades, chart_data = outputs
+            counts["trades"] = OutputWriter(db, run.id, "trades").write_all(trades)
+            counts["chart_data"] = OutputWriter(db, run.id, "chart_data").write_all(chart_data)
         else:
+            if not strategy_version.generated_code:
+                raise UnsupportedTemplate("Template is not supported by the vector engine and no strategy code exists")
+
+            # 実行（BACKTEST_RUNNER_MODE で事前起動ランナー / サブプロセスを切替）
+            # trades.jsonl / chart_data.jsonl は実行中からバッチで取り込む
+            with follow_outputs(run.id, work_dir) as counts:
+                result = run_strategy(code_path, work_dir, timeout=60)
+            if result.returncode != 0:
+                run.status = BacktestStatus.failed
+                run.error_message = f"Execution failed: {result.stderr}"
+            else:
+                summary = read_result(work_dir)
+                ingest_json_arrays(db, run.id, work_dir, counts)
+
+        if summary is not None:
             run.status = BacktestStatus.success
-            run.result_summary = json.load(open(work_dir / "result.json"))
-            run.log = json.load(open(work_dir / "trades.json"))
-            run.chart_data = json.load(open(work_dir / "chart_data.json"))
+            run.result_summary = summary
+            run.trade_count = counts["trades"]
+            run.chart_point_count = counts["chart_data"]
+            cache.store_result(db, run.cache_key, run.data_source_id, run.result_summary, run.id)
 
+        run.completed_at = datetime.now()
+        run.duration_ms = int((time.monotonic() - started) * 1000)
         db.commit()
 
-    except Exception as e:
+    except (UnsupportedTemplate, StrategyError, subprocess.TimeoutExpired) as e:
+        # 戦略側の問題（未対応のテンプレート・計算エラー・タイムアウト・不正な結果）は
+        # 再試行しても結果が変わらないので、そのまま失敗とする
+        db.rollback()
         run.status = BacktestStatus.failed
         run.error_message = f"Exception: {str(e)}\n{traceback.format_exc()}"
+        run.completed_at = datetime.now()
+        run.duration_ms = int((time.monotonic() - started) * 1000)
+        db.commit()
+    except Exception as e:
+        # データ取得・DB・ファイルの一時的な失敗はワーカーに再試行させる（上限に達したらキューが失敗にする）
+        db.rollback()
+        run.status = BacktestStatus.pending
+        run.error_message = f"Exception: {str(e)}\n{traceback.format_exc()}"
         db.commit()
+        raise
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import TextIO
+
+import numpy as np
+import pandas as pd
+
+# npy: 列ごとの .npy + manifest.json（mmapで読み込む） / csv: data.csv（互換用）
+DATA_FORMATS = ("npy", "csv")
+
+COLUMNAR_DIR = "data"
+MANIFEST_FILE = "manifest.json"
+CSV_FILE = "data.csv"
+
+
+def get_data_format() -> str:
+    fmt = os.getenv("BACKTEST_DATA_FORMAT", "npy")
+    if fmt not in DATA_FORMATS:
+        raise ValueError(f"Unknown BACKTEST_DATA_FORMAT: {fmt}")
+    return fmt
+
+
+def get_input_dir(argv: list[str] | None = None) -> Path:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", default=".")
+    args, _ = parser.parse_known_args(argv)
+    return Path(args.input_dir)
+
+
+def load_params(input_dir: Path) -> dict:
+    with open(input_dir / "params.json") as f:
+        return json.load(f)
+
+
+def open_output(input_dir: Path, kind: str) -> TextIO:
+    # trades / chart_data を1件1行の JSON Lines で追記する（実行中からバッチで取り込まれる）
+    return open(input_dir / f"{kind}.jsonl", "a", encoding="utf-8", buffering=1)
+
+
+def write_output(output: TextIO, record: dict) -> None:
+    output.write(json.dumps(record, default=str) + "\n")
+
+
+def write_columns(df: pd.DataFrame, data_dir: Path) -> None:
+    data_dir.mkdir(parents=True, exist_ok=True)
+    index_name = df.index.name or "datetime"
+    columns = [{"name": index_name, "file": f"{index_name}.npy"}]
+    np.save(data_dir / f"{index_name}.npy", df.index.to_numpy(dtype="datetime64[ns]"))
+    for name in df.columns:
+        values = df[name].to_numpy()
+        np.save(data_dir / f"{name}.npy", values)
+        columns.append({"name": str(name), "file": f"{name}.npy"})
+
+    manifest = {
+        "format": "npy",
+        "rows": len(df),
+        "index": index_name,
+        "columns": columns,
+    }
+    # manifest は最後に書き、読み手が書きかけのデータを見ないようにする
+    tmp_path = data_dir / f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, data_dir / MANIFEST_FILE)
+
+
+def read_manifest(data_dir: Path) -> dict:
+    with open(data_dir / MANIFEST_FILE) as f:
+        return json.load(f)
+
+
+def write_linked_manifest(source_dir: Path, data_dir: Path, start_row: int = 0, stop_row: int | None = None) -> None:
+    # 共有データセットの列ファイルを参照する manifest だけを書く（データはコピーしない）
+    manifest = read_manifest(source_dir)
+    stop_row = manifest["rows"] if stop_row is None else stop_row
+    manifest["source"] = str(source_dir.resolve())
+    manifest["start_row"] = start_row
+    manifest["rows"] = stop_row - start_row
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_dir / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_columns(input_dir: Path) -> dict[str, np.ndarray]:
+    data_dir = input_dir / COLUMNAR_DIR
+    manifest = read_manifest(data_dir)
+    source_dir = Path(manifest.get("source", data_dir))
+    start = manifest.get("start_row", 0)
+    stop = start + manifest["rows"]
+    return {c["name"]: np.load(source_dir / c["file"], mmap_mode="r")[start:stop] for c in manifest["columns"]}
+
+
+def load_data(input_dir: Path) -> pd.DataFrame:
+    manifest_path = input_dir / COLUMNAR_DIR / MANIFEST_FILE
+    if not manifest_path.exists():
+        df = pd.read_csv(input_dir / CSV_FILE, index_col=0, parse_dates=True)
+        df.index.name = "datetime"
+        return df
+
+    index_name = read_manifest(manifest_path.parent)["index"]
+    columns = load_columns(input_dir)
+    index = pd.DatetimeIndex(columns.pop(index_name), name="datetime", copy=False)
+    # mmap した配列をコピーせずにそのまま列として使う
+    return pd.DataFrame(columns, index=index, copy=False)
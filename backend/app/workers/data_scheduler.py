@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.features.datasources.jobs import following_run_at, run_data_source_job, utcnow
+from app.features.datasources.locks import DataSourceBusy, get_lock_seconds, hold_lock
+from app.features.datasources.models import DataSourceJob, DataSourceSchedule
+
+logger = logging.getLogger(__name__)
+
+
+def get_poll_seconds() -> float:
+    return float(os.getenv("DATA_SCHEDULER_POLL_SECONDS", "60"))
+
+
+def get_concurrency() -> int:
+    return int(os.getenv("DATA_SCHEDULER_CONCURRENCY", "4"))
+
+
+def _due(now: datetime):
+    return and_(
+        DataSourceSchedule.enabled.is_(True),
+        DataSourceSchedule.next_run_at <= now,
+        or_(DataSourceSchedule.is_running.is_(False), DataSourceSchedule.locked_until < now),
+    )
+
+
+def find_due_schedules(limit: int, now: datetime | None = None) -> list[UUID]:
+    # 実行予定を過ぎたスケジュールを1回のクエリで探す（enabled・next_run_at のインデックスを使う）
+    now = now or utcnow()
+    with SessionLocal() as db:
+        rows = (
+            db.query(DataSourceSchedule.id)
+            .filter(_due(now))
+            .order_by(DataSourceSchedule.next_run_at)
+            .limit(limit)
+            .all()
+        )
+        return [row.id for row in rows]
+
+
+def claim_schedule(schedule_id: UUID, now: datetime | None = None) -> bool:
+    # 条件付き UPDATE が1行更新できたときだけ実行する（同じデータソースのジョブを重ねない）
+    now = now or utcnow()
+    with SessionLocal() as db:
+        updated = (
+            db.query(DataSourceSchedule)
+            .filter(DataSourceSchedule.id == schedule_id, _due(now))
+            .update(
+                {
+                    DataSourceSchedule.is_running: True,
+                    DataSourceSchedule.locked_until: now + timedelta(seconds=get_lock_seconds()),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return bool(updated)
+
+
+def run_schedule(schedule_id: UUID) -> DataSourceJob | None:
+    with SessionLocal() as db:
+        schedule = db.get(DataSourceSchedule, schedule_id)
+        if schedule is None:
+            return None
+
+        def extend_claim(renew_db: Session) -> None:
+            # データソースのロックと一緒にスケジュールの実行中の印も延長する
+            renew_db.query(DataSourceSchedule).filter(DataSourceSchedule.id == schedule_id).update(
+                {DataSourceSchedule.locked_until: utcnow() + timedelta(seconds=get_lock_seconds())},
+                synchronize_session=False,
+            )
+
+        try:
+            with hold_lock(db, schedule.data_source_id, extend_claim):
+                try:
+                    job = run_data_source_job(db, schedule.data_source)
+                finally:
+                    # 次回の予定を決めてロックを外す
+                    now = utcnow()
+                    schedule.is_running = False
+                    schedule.locked_until = None
+                    schedule.last_run_at = now
+                    schedule.next_run_at = following_run_at(schedule.next_run_at or now, schedule.interval_type, now)
+                    db.commit()
+        except DataSourceBusy:
+            # アップロード・マージの実行中は次回の確認で実行し直す（次回の予定は変えない）
+            logger.info(f"[Scheduler] Data source {schedule.data_source_id} is busy, retrying later")
+            schedule.is_running = False
+            schedule.locked_until = None
+            db.commit()
+            return None
+        return job
+
+
+class DataScheduler:
+    def __init__(self, concurrency: int | None = None, poll_seconds: float | None = None):
+        self.concurrency = concurrency or get_concurrency()
+        self.poll_seconds = poll_seconds if poll_seconds is not None else get_poll_seconds()
+        self._running: set[asyncio.Task] = set()
+        self._stop = asyncio.Event()
+        self._loop_task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        # 空いている枠の数だけ取得する（ロックを取ったまま待たせない）
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        started = 0
+        for schedule_id in await asyncio.to_thread(find_due_schedules, free):
+            if not await asyncio.to_thread(claim_schedule, schedule_id):
+                continue
+            task = asyncio.create_task(self._run(schedule_id))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            started += 1
+        return started
+
+    async def wait_idle(self) -> None:
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self, schedule_id: UUID) -> None:
+        # DB・ファイル I/O はスレッドで実行し、データソース間で並行に進める
+        try:
+            await asyncio.to_thread(run_schedule, schedule_id)
+        except Exception:
+            logger.exception(f"[Scheduler] Schedule {schedule_id} failed")
+
+    async def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("[Scheduler] Polling failed")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.poll_seconds)
+            except TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        # 新しいジョブは始めず、実行中のジョブの完了を待つ
+        self._stop.set()
+        if self._loop_task is not None:
+            await self._loop_task
+            self._loop_task = None
+        await self.wait_idle()
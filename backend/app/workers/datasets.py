@@ -0,0 +1,63 @@
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.workers.data_loader import COLUMNAR_DIR, MANIFEST_FILE, read_manifest, write_columns, write_linked_manifest
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_dataset_root() -> Path:
+    root = Path(os.getenv("BACKTEST_DATASET_DIR", os.path.join(tempfile.gettempdir(), "stratrack_datasets")))
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def prepare_shared_dataset(key: str, load: Callable[[], pd.DataFrame]) -> Path:
+    # 同じキーのデータセットは最初の1プロセスだけが作成し、他はロック解放を待って再利用する
+    root = get_dataset_root()
+    dataset_dir = root / key
+    with open(root / f"{key}.lock", "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not (dataset_dir / MANIFEST_FILE).exists():
+                logger.info(f"[Dataset] Preparing shared dataset: {key}")
+                write_columns(load(), dataset_dir)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return dataset_dir
+
+
+def link_dataset(
+    dataset_dir: Path,
+    work_dir: Path,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> None:
+    # 共有データセットのうち [start, end] の行範囲だけを作業ディレクトリから参照させる
+    manifest = read_manifest(dataset_dir)
+    index_file = next(c["file"] for c in manifest["columns"] if c["name"] == manifest["index"])
+    index = np.load(dataset_dir / index_file, mmap_mode="r")
+    start_row = 0 if start is None else int(np.searchsorted(index, np.datetime64(start, "ns"), side="left"))
+    stop_row = len(index) if end is None else int(np.searchsorted(index, np.datetime64(end, "ns"), side="right"))
+    write_linked_manifest(dataset_dir, work_dir / COLUMNAR_DIR, start_row, stop_row)
+
+
+def remove_shared_dataset(key: str) -> None:
+    root = get_dataset_root()
+    shutil.rmtree(root / key, ignore_errors=True)
+    (root / f"{key}.lock").unlink(missing_ok=True)
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from uuid import UUID
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.features.backtesting.models import BacktestChartPoint, BacktestTrade
+
+logger = logging.getLogger(__name__)
+
+# 戦略が書き出す出力（JSON Lines は実行中から取り込む。JSON 配列は旧形式として実行後に取り込む）
+OUTPUT_TABLES = {"trades": BacktestTrade, "chart_data": BacktestChartPoint}
+
+READ_CHUNK_SIZE = 1 << 20
+WHITESPACE = re.compile(r"\s*")
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def get_batch_size() -> int:
+    return int(os.getenv("BACKTEST_OUTPUT_BATCH_SIZE", "5000"))
+
+
+def iter_json_array(path: Path, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    # ファイル全体を読み込まずに、JSON 配列の要素を1件ずつ取り出す
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer, pos, eof, started = "", 0, False, False
+        while True:
+            pos = (SEPARATORS if started else WHITESPACE).match(buffer, pos).end()
+            if pos < len(buffer):
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"{path.name} is not a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # 末尾の数値などは続きがあるかもしれないので読み足してから判定する
+                    if end < len(buffer) or eof:
+                        yield item
+                        pos = end
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                if started:
+                    raise ValueError(f"{path.name} ends before the array is closed")
+                return
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def tail_json_lines(
+    path: Path,
+    stop: threading.Event,
+    interval: float = 0.2,
+    on_idle: Callable[[], None] | None = None,
+) -> Iterator[dict]:
+    # stop が立つまでファイルの追記を追いかけ、完結した行だけを返す
+    handle = None
+    pending = ""
+    while True:
+        stopping = stop.is_set()
+        if handle is None and path.exists():
+            handle = open(path, encoding="utf-8")
+        while handle is not None:
+            chunk = handle.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            *lines, pending = (pending + chunk).split("\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if stopping:
+            break
+        if on_idle is not None:
+            on_idle()
+        stop.wait(interval)
+    if handle is not None:
+        if pending.strip():
+            yield json.loads(pending)
+        handle.close()
+
+
+class OutputWriter:
+    def __init__(self, db: Session, backtest_id: UUID, kind: str, batch_size: int | None = None):
+        self._db = db
+        self._backtest_id = backtest_id
+        self._table = OUTPUT_TABLES[kind]
+        self._batch_size = batch_size or get_batch_size()
+        self._rows: list[dict] = []
+        self.count = 0
+
+    def write(self, item: dict) -> None:
+        self._rows.append({"backtest_id": self._backtest_id, "seq": self.count, "data": item})
+        self.count += 1
+        if len(self._rows) >= self._batch_size:
+            self.flush()
+
+    def write_all(self, items: Iterable[dict]) -> int:
+        for item in items:
+            self.write(item)
+        self.flush()
+        return self.count
+
+    def flush(self) -> None:
+        # バッチごとにコミットし、メモリに保持する件数を抑える
+        if not self._rows:
+            return
+        self._db.execute(insert(self._table), self._rows)
+        self._db.commit()
+        self._rows = []
+
+
+def clear_outputs(db: Session, backtest_id: UUID) -> None:
+    # 再実行時に前回途中まで取り込んだ出力を削除する
+    for table in OUTPUT_TABLES.values():
+        db.query(table).filter(table.backtest_id == backtest_id).delete(synchronize_session=False)
+    db.commit()
+
+
+@contextmanager
+def follow_outputs(backtest_id: UUID, work_dir: Path) -> Iterator[dict[str, int]]:
+    # 実行中に trades.jsonl / chart_data.jsonl を取り込み、終了時に残りを取り込む
+    counts = {kind: 0 for kind in OUTPUT_TABLES}
+    stop = threading.Event()
+    errors: list[Exception] = []
+
+    def follow(kind: str) -> None:
+        try:
+            with SessionLocal() as db:
+                writer = OutputWriter(db, backtest_id, kind)
+                # 追記が途切れたらバッチに満たなくても書き込む
+                writer.write_all(tail_json_lines(work_dir / f"{kind}.jsonl", stop, on_idle=writer.flush))
+                counts[kind] = writer.count
+        except Exception as e:
+            logger.error(f"[Output] Failed to ingest {kind} for {backtest_id}: {e}")
+            errors.append(e)
+
+    threads = [threading.Thread(target=follow, args=(kind,), daemon=True) for kind in OUTPUT_TABLES]
+    for thread in threads:
+        thread.start()
+    try:
+        yield counts
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+
+def ingest_json_arrays(db: Session, backtest_id: UUID, work_dir: Path, counts: dict[str, int]) -> None:
+    # JSON Lines で出力しなかった戦略の JSON 配列ファイルを取り込む
+    for kind in OUTPUT_TABLES:
+        path = work_dir / f"{kind}.json"
+        if counts[kind] == 0 and path.exists():
+            counts[kind] = OutputWriter(db, backtest_id, kind).write_all(iter_json_array(path))
@@ -0,0 +1,191 @@
+import importlib
+import logging
+import multiprocessing
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import traceback
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# ランナーで事前に読み込んでおくモジュール
+PRELOAD_MODULES = ("pandas", "backtrader", "app.workers.data_loader")
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def get_runner_mode() -> str:
+    # fork が使える環境では事前起動済みランナーを既定とする
+    default = "prefork" if "fork" in multiprocessing.get_all_start_methods() else "subprocess"
+    return os.getenv("BACKTEST_RUNNER_MODE", default)
+
+
+def warm_up() -> None:
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"[Runner] Failed to preload {name}: {e}")
+
+
+def _read_output(path: Path) -> str:
+    try:
+        return path.read_text(encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        return ""
+
+
+def _execute(code_path: str, work_dir: str) -> int:
+    os.chdir(work_dir)
+
+    # 標準出力・標準エラーを作業ディレクトリのファイルに付け替える
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open("stdout.log", "wb") as out, open("stderr.log", "wb") as err:
+        os.dup2(out.fileno(), 1)
+        os.dup2(err.fileno(), 2)
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False)
+
+    sys.argv = [code_path, "--input-dir", work_dir]
+    sys.path.insert(0, os.path.dirname(code_path))
+    try:
+        runpy.run_path(code_path, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _zygote_main(conn: Connection, parent_conn: Connection) -> None:
+    # 読み込み済みのモジュールを引き継いだまま、ジョブごとに自分から fork してランナーにする
+    # （スレッドを持たないこのプロセスだけが fork するので、ロックを持ったままのスレッドを子に引き継がない）
+    parent_conn.close()
+
+    # 親から引き継いだDB接続は使わない
+    from app.db.session import engine
+
+    engine.dispose(close=False)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        code_path, work_dir = job
+        pid = os.fork()
+        if pid == 0:
+            returncode = 1
+            try:
+                conn.close()
+                returncode = _execute(code_path, work_dir)
+            finally:
+                os._exit(returncode)
+        conn.send(pid)
+        _, status = os.waitpid(pid, 0)
+        conn.send(os.waitstatus_to_exitcode(status))
+
+
+class PreforkRunnerPool:
+    def __init__(self) -> None:
+        self._ctx = multiprocessing.get_context("fork")
+        self._process: BaseProcess | None = None
+        self._conn: Connection | None = None
+        self._start()
+
+    def _start(self) -> None:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_zygote_main, args=(child_conn, parent_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+
+    def _stop(self) -> None:
+        self._conn.close()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+
+    def run(self, code_path: Path, work_dir: Path, timeout: float) -> subprocess.CompletedProcess[str]:
+        args = [str(code_path), "--input-dir", str(work_dir)]
+        if not self._process.is_alive():
+            logger.warning("[Runner] Zygote process exited; restarting")
+            self._stop()
+            self._start()
+
+        try:
+            self._conn.send((str(code_path), str(work_dir)))
+            pid = self._conn.recv()
+            if not self._conn.poll(timeout):
+                os.kill(pid, signal.SIGKILL)
+                # zygote がランナーを回収して終了コードを返すまで待つ
+                self._conn.recv()
+                raise subprocess.TimeoutExpired(
+                    args,
+                    timeout,
+                    output=_read_output(work_dir / "stdout.log"),
+                    stderr=_read_output(work_dir / "stderr.log"),
+                )
+            returncode = self._conn.recv()
+        except (EOFError, OSError):
+            # zygote 自体が異常終了した場合（次回の実行で起動し直す）
+            returncode = -1
+
+        return subprocess.CompletedProcess(
+            args,
+            returncode,
+            stdout=_read_output(work_dir / "stdout.log"),
+            stderr=_read_output(work_dir / "stderr.log"),
+        )
+
+    def close(self) -> None:
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._stop()
+
+
+# ワーカープロセスごとに1つ持つ（スレッドを起動する前に get_runner_pool で作る）
+runner_pool: PreforkRunnerPool | None = None
+
+
+def get_runner_pool() -> PreforkRunnerPool:
+    global runner_pool
+    if runner_pool is None:
+        warm_up()
+        runner_pool = PreforkRunnerPool()
+    return runner_pool
+
+
+def run_strategy(code_path: Path, work_dir: Path, timeout: float = 60) -> subprocess.CompletedProcess[str]:
+    if get_runner_mode() == "prefork":
+        return get_runner_pool().run(code_path, work_dir, timeout)
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(PROJECT_ROOT), env.get("PYTHONPATH")) if p)
+    return subprocess.run(
+        ["python", str(code_path), "--input-dir", str(work_dir)],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        env=env,
+    )
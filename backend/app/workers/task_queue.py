@@ -1,26 +1,245 @@
 from __future__ import annotations
 
-from multiprocessing import Queue
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from multiprocessing.synchronize import Semaphore
+from uuid import UUID
 
-# プロセス間で共有可能なキュー（起動元で渡す）
-task_queue: Queue[str] | None = None
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
 
+from app.db.session import SessionLocal
+from app.features.backtesting.models import BacktestRun, BacktestStatus, BacktestTask, TaskStatus
 
-def set_task_queue(queue: Queue[str]) -> None:
-    global task_queue
-    task_queue = queue
+logger = logging.getLogger(__name__)
 
+# タスクはDBに保存し、セマフォは待機中のワーカーを起こす通知にだけ使う（起動元で渡す）
+task_signal: Semaphore | None = None
 
-def enqueue_backtest(backtest_id: str) -> None:
-    if task_queue is None:
-        raise RuntimeError("Task queue not set")
-    task_queue.put(backtest_id)
+# 取得競合時の再試行回数
+CLAIM_RETRIES = 5
 
 
-def dequeue_backtest() -> str | None:
-    if task_queue is None:
-        raise RuntimeError("Task queue not set")
+def set_task_signal(signal: Semaphore | None) -> None:
+    global task_signal
+    task_signal = signal
+
+
+def get_lease_seconds() -> float:
+    return float(os.getenv("BACKTEST_TASK_LEASE_SECONDS", "120"))
+
+
+def get_max_attempts() -> int:
+    return int(os.getenv("BACKTEST_TASK_MAX_ATTEMPTS", "3"))
+
+
+def get_retry_backoff(attempts: int) -> timedelta:
+    # 指数バックオフ（上限5分）
+    base = float(os.getenv("BACKTEST_TASK_RETRY_BACKOFF", "5"))
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 300))
+
+
+def _notify(count: int) -> None:
+    if task_signal is None:
+        return
+    for _ in range(count):
+        task_signal.release()
+
+
+def enqueue_backtests(backtest_ids: Iterable[UUID], priority: int = 0, db: Session | None = None) -> None:
+    session = db or SessionLocal()
+    try:
+        tasks = [BacktestTask(backtest_id=backtest_id, priority=priority) for backtest_id in backtest_ids]
+        session.add_all(tasks)
+        session.commit()
+    finally:
+        if db is None:
+            session.close()
+    _notify(len(tasks))
+
+
+def enqueue_backtest(backtest_id: UUID, priority: int = 0, db: Session | None = None) -> None:
+    enqueue_backtests([backtest_id], priority, db)
+
+
+def _ready(now: datetime):
+    return or_(
+        and_(BacktestTask.status == TaskStatus.queued, BacktestTask.available_at <= now),
+        and_(BacktestTask.status == TaskStatus.leased, BacktestTask.lease_expires_at < now),
+    )
+
+
+def claim_task(owner: str) -> BacktestTask | None:
+    with SessionLocal() as db:
+        for _ in range(CLAIM_RETRIES):
+            now = datetime.now()
+            candidate = (
+                db.query(BacktestTask.id)
+                .filter(_ready(now))
+                .order_by(BacktestTask.priority.desc(), BacktestTask.created_at)
+                .limit(1)
+                .scalar()
+            )
+            if candidate is None:
+                return None
+
+            # 条件付き UPDATE が1行更新できたワーカーだけがリースを得る
+            updated = (
+                db.query(BacktestTask)
+                .filter(BacktestTask.id == candidate, _ready(now))
+                .update(
+                    {
+                        BacktestTask.status: TaskStatus.leased,
+                        BacktestTask.lease_owner: owner,
+                        BacktestTask.lease_expires_at: now + timedelta(seconds=get_lease_seconds()),
+                        BacktestTask.attempts: BacktestTask.attempts + 1,
+                        BacktestTask.updated_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if not updated:
+                continue
+
+            task = db.get(BacktestTask, candidate)
+            if task.attempts > get_max_attempts():
+                # リース切れ（ワーカー異常終了など）を繰り返したタスクは失敗とする
+                _give_up(db, task, task.last_error or "Lease expired too many times")
+                continue
+            return task
+    return None
+
+
+def dequeue_backtest(owner: str, timeout: float = 1.0) -> BacktestTask | None:
+    # 通知は登録したタスク1件につき1つ。待たずに取得できたときも1つ消費し、通知が溜まって
+    # 待機中のワーカーが空振りの取得を繰り返さないようにする
+    task = claim_task(owner)
+    if task is not None:
+        if task_signal is not None:
+            task_signal.acquire(False)
+        return task
+    # 新しいタスクの通知を待つ（バックオフ中のタスクはタイムアウト後の再確認で拾う）
+    if task_signal is None:
+        time.sleep(timeout)
+        return claim_task(owner)
+    notified = task_signal.acquire(timeout=timeout)
+    task = claim_task(owner)
+    if task is not None and not notified:
+        task_signal.acquire(False)
+    return task
+
+
+def extend_lease(task_id: UUID, owner: str) -> bool:
+    with SessionLocal() as db:
+        updated = (
+            db.query(BacktestTask)
+            .filter(
+                BacktestTask.id == task_id,
+                BacktestTask.status == TaskStatus.leased,
+                BacktestTask.lease_owner == owner,
+            )
+            .update(
+                {BacktestTask.lease_expires_at: datetime.now() + timedelta(seconds=get_lease_seconds())},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return bool(updated)
+
+
+@contextmanager
+def lease_heartbeat(task_id: UUID, owner: str) -> Iterator[None]:
+    # 実行中はリース期限の1/3ごとに期限を延長する
+    stop = threading.Event()
+    interval = get_lease_seconds() / 3
+
+    def beat() -> None:
+        while not stop.wait(interval):
+            try:
+                if not extend_lease(task_id, owner):
+                    logger.warning(f"[Queue] Lost lease for task {task_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"[Queue] Failed to extend lease for task {task_id}: {e}")
+
+    thread = threading.Thread(target=beat, name=f"lease-{task_id}", daemon=True)
+    thread.start()
     try:
-        return task_queue.get(timeout=1)
-    except Exception:
-        return None
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def complete_task(task_id: UUID) -> None:
+    with SessionLocal() as db:
+        db.query(BacktestTask).filter(BacktestTask.id == task_id).delete(synchronize_session=False)
+        db.commit()
+
+
+def fail_task(task_id: UUID, error: str) -> None:
+    with SessionLocal() as db:
+        task = db.get(BacktestTask, task_id)
+        if task is None:
+            return
+        if task.attempts >= get_max_attempts():
+            _give_up(db, task, error)
+            return
+        backoff = get_retry_backoff(task.attempts)
+        logger.info(f"[Queue] Retrying task {task_id} in {backoff.total_seconds()}s (attempt {task.attempts})")
+        task.status = TaskStatus.queued
+        task.lease_owner = None
+        task.lease_expires_at = None
+        task.available_at = datetime.now() + backoff
+        task.last_error = error
+        db.commit()
+
+
+def _give_up(db: Session, task: BacktestTask, error: str) -> None:
+    logger.error(f"[Queue] Task {task.id} failed after {task.attempts} attempts: {error}")
+    task.status = TaskStatus.failed
+    task.lease_owner = None
+    task.lease_expires_at = None
+    task.last_error = error
+    run = db.get(BacktestRun, task.backtest_id)
+    if run is not None and run.status not in (BacktestStatus.success, BacktestStatus.failed):
+        run.status = BacktestStatus.failed
+        run.error_message = error
+        run.completed_at = datetime.now()
+    db.commit()
+
+
+def recover_pending_runs() -> int:
+    # 起動時に呼び出す。前回のプロセスが持っていたリースを解放し、タスクのない未完了の実行を再登録する
+    with SessionLocal() as db:
+        db.query(BacktestTask).filter(BacktestTask.status == TaskStatus.leased).update(
+            {
+                BacktestTask.status: TaskStatus.queued,
+                BacktestTask.lease_owner: None,
+                BacktestTask.lease_expires_at: None,
+            },
+            synchronize_session=False,
+        )
+        active = db.query(BacktestTask.backtest_id).filter(BacktestTask.status == TaskStatus.queued)
+        orphans = (
+            db.query(BacktestRun)
+            .filter(
+                BacktestRun.status.in_([BacktestStatus.pending, BacktestStatus.running]),
+                BacktestRun.id.not_in(active),
+            )
+            .all()
+        )
+        for run in orphans:
+            run.status = BacktestStatus.pending
+            db.add(BacktestTask(backtest_id=run.id))
+        db.commit()
+        queued = db.query(BacktestTask).filter(BacktestTask.status == TaskStatus.queued).count()
+
+    _notify(queued)
+    return len(orphans)
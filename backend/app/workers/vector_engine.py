@@ -0,0 +1,405 @@
+import os
+from collections.abc import Callable, Iterator
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# auto: テンプレートが対応していればベクトル化エンジン / vector: 常に使用 / backtrader: 使用しない
+ENGINE_MODES = ("auto", "vector", "backtrader")
+
+# chart_data の時刻を文字列にするバー数
+LABEL_BATCH = 10000
+
+SUPPORTED_AGGREGATIONS = ("sma", "ema", "rma", "smma", "lwma", "sum", "max", "min", "std", "median")
+
+COMPARISON_OPERATORS: dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    ">": np.greater,
+    "<": np.less,
+    ">=": np.greater_equal,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+BINARY_OPERATORS: dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    "max": np.maximum,
+    "min": np.minimum,
+}
+
+
+class UnsupportedTemplate(Exception):
+    pass
+
+
+class Series(NamedTuple):
+    values: np.ndarray
+    # 値が有効になる最初のバー（backtrader の minperiod 相当）
+    start: int
+
+
+def get_engine_mode() -> str:
+    mode = os.getenv("BACKTEST_ENGINE", "auto")
+    if mode not in ENGINE_MODES:
+        raise ValueError(f"Unknown BACKTEST_ENGINE: {mode}")
+    return mode
+
+
+def _shift(series: Series, bars: int) -> Series:
+    if bars == 0:
+        return series
+    values = series.values
+    fill = False if values.dtype == bool else np.nan
+    shifted = np.full(len(values), fill, dtype=values.dtype)
+    shifted[bars:] = values[:-bars]
+    return Series(shifted, series.start + bars)
+
+
+def _rolling(values: np.ndarray, period: int, method: str) -> np.ndarray:
+    rolling = pd.Series(values).rolling(period)
+    if method == "std":
+        # backtrader の StdDev と同じ母標準偏差
+        return rolling.std(ddof=0).to_numpy()
+    return getattr(rolling, method)().to_numpy()
+
+
+def _smoothed(values: np.ndarray, period: int, alpha: float) -> np.ndarray:
+    # 最初の period 本の単純平均を初期値とする指数平滑（backtrader の EMA / SMMA と同じ）
+    result = np.full(len(values), np.nan)
+    if len(values) < period:
+        return result
+    seeded = values[period - 1 :].copy()
+    seeded[0] = values[:period].mean()
+    result[period - 1 :] = pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return result
+
+
+def _lwma(values: np.ndarray, period: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) < period:
+        return result
+    weights = np.arange(1, period + 1, dtype=np.float64)
+    result[period - 1 :] = np.convolve(values, weights[::-1], mode="valid") / weights.sum()
+    return result
+
+
+def aggregate(values: np.ndarray, method: str, period: int) -> np.ndarray:
+    if method not in SUPPORTED_AGGREGATIONS:
+        raise UnsupportedTemplate(f"Unsupported aggregation: {method}")
+    if method == "sma":
+        return _rolling(values, period, "mean")
+    if method == "ema":
+        return _smoothed(values, period, 2 / (period + 1))
+    if method in ("rma", "smma"):
+        return _smoothed(values, period, 1 / period)
+    if method == "lwma":
+        return _lwma(values, period)
+    return _rolling(values, period, method)
+
+
+class TemplateEvaluator:
+    def __init__(self, template: dict, columns: dict[str, np.ndarray], params: dict):
+        self.columns = columns
+        self.params = params
+        self.definitions = {v["name"]: v for v in template.get("variables") or []}
+        self.variables: dict[str, Series] = {}
+        self.length = len(columns["close"])
+
+    def param(self, name: str) -> Any:
+        if name not in self.params:
+            raise UnsupportedTemplate(f"Parameter '{name}' is not set")
+        return self.params[name]
+
+    def number(self, expr: dict) -> float:
+        # 期間・シフト数など、バーごとに変わらない値
+        if expr["type"] == "constant":
+            return expr["value"]
+        if expr["type"] == "param":
+            return self.param(expr["name"])
+        raise UnsupportedTemplate(f"Expected a constant value: {expr['type']}")
+
+    def bars(self, expr: dict | None) -> int:
+        value = 0 if expr is None else self.number(expr)
+        if int(value) != value or value < 0:
+            raise UnsupportedTemplate(f"Invalid bar count: {value}")
+        return int(value)
+
+    def price(self, source: str) -> np.ndarray:
+        c = self.columns
+        if source in ("open", "high", "low", "close", "volume"):
+            return c[source]
+        if source == "bid":
+            return c["close"]
+        if source == "tick_volume":
+            return c["volume"]
+        if source == "median":
+            return (c["high"] + c["low"]) / 2
+        if source == "typical":
+            return (c["high"] + c["low"] + c["close"]) / 3
+        if source == "weighted":
+            return (c["high"] + c["low"] + 2 * c["close"]) / 4
+        raise UnsupportedTemplate(f"Unsupported price source: {source}")
+
+    def variable(self, name: str) -> Series:
+        if name not in self.variables:
+            definition = self.definitions.get(name)
+            if definition is None:
+                raise UnsupportedTemplate(f"Unknown variable: {name}")
+            if definition.get("timeframe") or definition.get("invalidPeriod") or definition.get("fallback"):
+                raise UnsupportedTemplate(f"Variable '{name}' uses unsupported options")
+            # 循環参照の検出用に先に登録しておく
+            self.variables[name] = None  # type: ignore[assignment]
+            self.variables[name] = self.series(definition["expression"])
+        series = self.variables[name]
+        if series is None:
+            raise UnsupportedTemplate(f"Circular variable reference: {name}")
+        return series
+
+    def series(self, expr: dict) -> Series:
+        kind = expr["type"]
+        if expr.get("timeframe") or expr.get("fallback"):
+            raise UnsupportedTemplate(f"'{kind}' with timeframe or fallback is not supported")
+
+        if kind in ("constant", "param"):
+            return Series(np.full(self.length, float(self.number(expr))), 0)
+        if kind in ("price", "scalar_price"):
+            return _shift(Series(self.price(expr["source"]).astype(np.float64), 0), self.bars(expr.get("shiftBars")))
+        if kind == "variable":
+            return self.variable(expr["name"])
+        if kind == "bar_shift":
+            return _shift(self.series(expr["source"]), self.bars(expr.get("shiftBars")))
+        if kind == "aggregation":
+            method = expr["method"]
+            name = method["value"] if method["type"] == "aggregationType" else self.param(method["name"])
+            period = self.bars(expr["period"])
+            if period < 1:
+                raise UnsupportedTemplate(f"Invalid period: {period}")
+            source = self.series(expr["source"])
+            # 入れ子の集計ではソースが有効になったバーから計算する
+            values = np.full(self.length, np.nan)
+            values[source.start :] = aggregate(source.values[source.start :], name, period)
+            return Series(values, source.start + period - 1)
+        if kind == "unary_op":
+            operand = self.series(expr["operand"])
+            values = -operand.values if expr["operator"] == "-" else np.abs(operand.values)
+            return Series(values, operand.start)
+        if kind == "binary_op":
+            left, right = self.series(expr["left"]), self.series(expr["right"])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = BINARY_OPERATORS[expr["operator"]](left.values, right.values)
+            return Series(values, max(left.start, right.start))
+        if kind == "ternary":
+            cond = self.condition(expr["condition"])
+            t, f = self.series(expr["trueExpr"]), self.series(expr["falseExpr"])
+            return Series(np.where(cond.values, t.values, f.values), max(cond.start, t.start, f.start))
+        raise UnsupportedTemplate(f"Unsupported expression: {kind}")
+
+    def condition(self, cond: dict) -> Series:
+        kind = cond["type"]
+        if kind == "comparison":
+            left, right = self.series(cond["left"]), self.series(cond["right"])
+            values = COMPARISON_OPERATORS[cond["operator"]](left.values, right.values)
+            return Series(values, max(left.start, right.start))
+        if kind == "cross":
+            left, right = self.series(cond["left"]), self.series(cond["right"])
+            prev_left, prev_right = _shift(left, 1), _shift(right, 1)
+            if cond["direction"] == "cross_over":
+                values = (prev_left.values < prev_right.values) & (left.values > right.values)
+            else:
+                values = (prev_left.values > prev_right.values) & (left.values < right.values)
+            return Series(values, max(prev_left.start, prev_right.start))
+        if kind == "state":
+            operand = self.series(cond["operand"])
+            compare = np.greater if cond["state"] == "rising" else np.less
+            step = Series(compare(operand.values, _shift(operand, 1).values), operand.start + 1)
+            return self._all_bars(step, abs(cond.get("consecutiveBars") or 1))
+        if kind == "continue":
+            inner = self.condition(cond["condition"])
+            if cond["continue"] == "false":
+                inner = Series(~inner.values, inner.start)
+            return self._all_bars(inner, abs(cond.get("consecutiveBars") or 2))
+        if kind == "change":
+            inner = self.condition(cond["condition"])
+            before = cond.get("preconditionBars") or 1
+            after = cond.get("confirmationBars") or 1
+            if cond["change"] == "to_false":
+                inner = Series(~inner.values, inner.start)
+            # 直近 after 本は成立し、その前の before 本は不成立
+            confirmed = self._all_bars(inner, after)
+            precondition = self._all_bars(Series(~inner.values, inner.start), before)
+            shifted = _shift(precondition, after)
+            return Series(confirmed.values & shifted.values, max(confirmed.start, shifted.start))
+        if kind == "group":
+            parts = [self.condition(c) for c in cond["conditions"]]
+            if not parts:
+                raise UnsupportedTemplate("Empty condition group")
+            reduce = np.logical_and if cond["operator"] == "and" else np.logical_or
+            return Series(reduce.reduce([p.values for p in parts]), max(p.start for p in parts))
+        raise UnsupportedTemplate(f"Unsupported condition: {kind}")
+
+    def _all_bars(self, cond: Series, bars: int) -> Series:
+        values = cond.values.copy()
+        start = cond.start
+        for i in range(1, bars):
+            shifted = _shift(cond, i)
+            values &= shifted.values
+            start = shifted.start
+        return Series(values, start)
+
+
+class Signals(NamedTuple):
+    # 0: なし / 1: 買い / -1: 売り（テンプレートで先に定義された条件を優先）
+    entry: np.ndarray
+    long_exit: np.ndarray
+    short_exit: np.ndarray
+    start: int
+
+
+def check_template(template: dict) -> None:
+    if not template.get("entry"):
+        raise UnsupportedTemplate("Template has no entry conditions")
+    position = template.get("positionManagement") or {}
+    if any((position.get(key) or {}).get("enabled") for key in ("trailingStop", "takeProfit", "stopLoss")):
+        raise UnsupportedTemplate("Position management is not supported")
+    if (template.get("timingControl") or {}).get("allowedTradingPeriods"):
+        raise UnsupportedTemplate("Timing control is not supported")
+    multi = template.get("multiPositionControl") or {}
+    if (multi.get("maxPositions") or 1) > 1 or multi.get("allowHedging"):
+        raise UnsupportedTemplate("Multiple positions are not supported")
+    filters = template.get("environmentFilter") or {}
+    if any(filters.values()):
+        raise UnsupportedTemplate("Environment filters are not supported")
+    risk = template.get("riskManagement") or {"type": "fixed", "lotSize": 1}
+    if risk.get("type") not in ("fixed", "percentage"):
+        raise UnsupportedTemplate(f"Unsupported risk management: {risk.get('type')}")
+
+
+def build_signals(template: dict, columns: dict[str, np.ndarray], params: dict) -> Signals:
+    check_template(template)
+    evaluator = TemplateEvaluator(template, columns, params)
+    length = evaluator.length
+
+    try:
+        entries = [(1 if e["type"] == "long" else -1, evaluator.condition(e["condition"])) for e in template["entry"]]
+        exits = [(e["type"], evaluator.condition(e["condition"])) for e in template.get("exit") or []]
+    except KeyError as e:
+        raise UnsupportedTemplate(f"Malformed template: missing {e}") from e
+    start = max(c.start for _, c in entries + exits)
+
+    entry = np.zeros(length, dtype=np.int8)
+    for side, cond in reversed(entries):
+        entry = np.where(cond.values, side, entry).astype(np.int8)
+    long_exit = np.zeros(length, dtype=bool)
+    short_exit = np.zeros(length, dtype=bool)
+    for side, cond in exits:
+        if side == "long":
+            long_exit |= cond.values
+        else:
+            short_exit |= cond.values
+    return Signals(entry, long_exit, short_exit, start)
+
+
+def label_times(times: np.ndarray) -> Iterator[str]:
+    # 時刻の文字列はバッチごとに作り、全バー分のリストを持たない
+    for i in range(0, len(times), LABEL_BATCH):
+        yield from np.datetime_as_string(times[i : i + LABEL_BATCH], unit="s").tolist()
+
+
+def iter_trades(times: np.ndarray, close: np.ndarray, trades: list[tuple[int, int, float]]) -> Iterator[dict]:
+    for entry_index, exit_index, size in trades:
+        entry_price = float(close[entry_index])
+        exit_price = float(close[exit_index])
+        yield {
+            "side": "long" if size > 0 else "short",
+            "size": abs(size),
+            "entry_time": str(np.datetime_as_string(times[entry_index], unit="s")),
+            "entry_price": entry_price,
+            "exit_time": str(np.datetime_as_string(times[exit_index], unit="s")),
+            "exit_price": exit_price,
+            "pnl": size * (exit_price - entry_price),
+        }
+
+
+def iter_chart_data(times: np.ndarray, equity: np.ndarray) -> Iterator[dict]:
+    for t, v in zip(label_times(times), equity, strict=True):
+        yield {"time": t, "equity": float(v)}
+
+
+def simulate(
+    times: np.ndarray,
+    close: np.ndarray,
+    signals: Signals,
+    risk: dict,
+    initial_cash: float,
+) -> tuple[dict, Iterator[dict], Iterator[dict]]:
+    # 約定はシグナル足の終値（cheat-on-close）。最終足のシグナルは約定しない
+    # trades / chart_data は書き込み側が読み進めるときに1件ずつ作る（出力の件数分のリストを持たない）
+    n = len(close)
+    active = np.zeros(n, dtype=bool)
+    active[signals.start : n - 1] = True
+    entry = np.where(active, signals.entry, 0)
+    long_exit = signals.long_exit & active
+    short_exit = signals.short_exit & active
+
+    cash = float(initial_cash)
+    size = 0.0
+    entry_index = 0
+    changes: list[tuple[int, float, float]] = []
+    # (建玉のバー, 決済のバー, 数量)
+    trades: list[tuple[int, int, float]] = []
+    wins = 0
+    # シグナルのあるバーだけを順に処理する
+    for i in np.flatnonzero((entry != 0) | long_exit | short_exit).tolist():
+        price = float(close[i])
+        if size == 0:
+            side = entry[i]
+            if side == 0:
+                continue
+            if risk.get("type") == "percentage":
+                qty = cash * float(risk["percent"]) / 100 / price
+            else:
+                qty = float(risk.get("lotSize", 1))
+            size = side * qty
+            cash -= size * price
+            entry_index = i
+            changes.append((i, size, cash))
+        elif (size > 0 and long_exit[i]) or (size < 0 and short_exit[i]):
+            cash += size * price
+            trades.append((entry_index, i, size))
+            if size * (price - float(close[entry_index])) > 0:
+                wins += 1
+            size = 0.0
+            changes.append((i, 0.0, cash))
+
+    # 保有数量・現金を変化点から全バーに展開して評価額を計算する
+    change_index = np.array([c[0] for c in changes], dtype=np.int64)
+    last_change = np.searchsorted(change_index, np.arange(n), side="right") - 1
+    sizes = np.array([0.0] + [c[1] for c in changes])
+    cashes = np.array([float(initial_cash)] + [c[2] for c in changes])
+    equity = cashes[last_change + 1] + sizes[last_change + 1] * close
+
+    peak = np.maximum.accumulate(equity) if n else equity
+    drawdown = float(((peak - equity) / peak).max() * 100) if n else 0.0
+    final_value = float(equity[-1]) if n else float(initial_cash)
+    summary = {
+        "engine": "vector",
+        "initial_cash": float(initial_cash),
+        "final_value": final_value,
+        "net_profit": final_value - float(initial_cash),
+        "trade_count": len(trades),
+        "win_rate": wins / len(trades) if trades else 0.0,
+        "max_drawdown": drawdown,
+    }
+    return summary, iter_trades(times, close, trades), iter_chart_data(times, equity)
+
+
+def run_vector_backtest(template: dict, df: pd.DataFrame, params: dict) -> tuple[dict, Iterator[dict], Iterator[dict]]:
+    columns = {name: df[name].to_numpy(dtype=np.float64) for name in ("open", "high", "low", "close", "volume")}
+    signals = build_signals(template, columns, params)
+    risk = template.get("riskManagement") or {"type": "fixed", "lotSize": 1}
+    times = df.index.to_numpy(dtype="datetime64[ns]")
+    return simulate(times, columns["close"], signals, risk, params.get("initial_cash", 100000))
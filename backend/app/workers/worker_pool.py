@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime
+from multiprocessing import Event, Process, Queue
+from multiprocessing.synchronize import Semaphore
+from queue import Empty
+from typing import Any
+
+from app.workers.worker_process import WorkerState, run_worker
+
+logger = logging.getLogger(__name__)
+
+# プロセス内で共有するプール（起動元で設定する）
+worker_pool: WorkerPool | None = None
+
+
+def set_worker_pool(pool: WorkerPool | None) -> None:
+    global worker_pool
+    worker_pool = pool
+
+
+def get_worker_pool() -> WorkerPool | None:
+    return worker_pool
+
+
+def get_worker_count() -> int:
+    # BACKTEST_WORKERS 未指定時はCPUコア数
+    value = os.getenv("BACKTEST_WORKERS")
+    if value:
+        return max(1, int(value))
+    return os.cpu_count() or 1
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        task_signal: Semaphore,
+        size: int | None = None,
+        supervise_interval: float = 1.0,
+    ):
+        self._task_signal = task_signal
+        self._size = size or get_worker_count()
+        self._supervise_interval = supervise_interval
+        self._stop_event = Event()
+        self._status_queue: Queue[tuple[int, int, str, str | None, datetime]] = Queue()
+        self._processes: dict[int, Process] = {}
+        self._states: dict[int, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._supervisor: threading.Thread | None = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def start(self) -> None:
+        for worker_id in range(self._size):
+            self._spawn(worker_id)
+        self._supervisor = threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True)
+        self._supervisor.start()
+        logger.info(f"[Pool] {self._size} worker processes started.")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        logger.info("[Pool] Stopping worker processes...")
+        self._stop_event.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+
+        with self._lock:
+            for worker_id in self._processes:
+                self._states[worker_id]["state"] = WorkerState.stopping.value
+
+        # 実行中のバックテストが終わるまで待ち、期限を過ぎたものは強制終了する
+        for worker_id, process in self._processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"[Pool] Worker-{worker_id} did not stop in time. Terminating.")
+                process.terminate()
+                process.join()
+
+        self._drain_status()
+        with self._lock:
+            for state in self._states.values():
+                state["state"] = WorkerState.stopped.value
+        logger.info("[Pool] Worker processes stopped.")
+
+    def states(self) -> list[dict[str, Any]]:
+        self._drain_status()
+        with self._lock:
+            return [dict(state) for _, state in sorted(self._states.items())]
+
+    def _spawn(self, worker_id: int) -> None:
+        # 戦略ランナーの子プロセスを持てるよう daemon にはしない
+        process = Process(
+            target=run_worker,
+            args=(self._task_signal, worker_id, self._stop_event, self._status_queue),
+            name=f"backtest-worker-{worker_id}",
+        )
+        process.start()
+        with self._lock:
+            previous = self._states.get(worker_id)
+            self._processes[worker_id] = process
+            self._states[worker_id] = {
+                "worker_id": worker_id,
+                "pid": process.pid,
+                "state": WorkerState.starting.value,
+                "task_id": None,
+                "restarts": previous["restarts"] + 1 if previous else 0,
+                "updated_at": datetime.now(),
+            }
+
+    def _supervise(self) -> None:
+        while not self._stop_event.wait(self._supervise_interval):
+            self._drain_status()
+            for worker_id, process in list(self._processes.items()):
+                if process.is_alive() or self._stop_event.is_set():
+                    continue
+                task_id = self._states[worker_id]["task_id"]
+                logger.error(
+                    f"[Pool] Worker-{worker_id} (pid={process.pid}) exited with code {process.exitcode}"
+                    + (f" while executing {task_id}" if task_id else "")
+                    + ". Restarting."
+                )
+                process.join()
+                self._spawn(worker_id)
+
+    def _drain_status(self) -> None:
+        while True:
+            try:
+                worker_id, pid, state, task_id, updated_at = self._status_queue.get_nowait()
+            except Empty:
+                return
+            except (OSError, ValueError):
+                return
+            with self._lock:
+                current = self._states.get(worker_id)
+                # 再起動前のプロセスからの古い通知は無視する
+                if current is None or current["pid"] != pid:
+                    continue
+                current["state"] = state
+                current["task_id"] = task_id
+                current["updated_at"] = updated_at
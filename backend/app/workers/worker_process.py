@@ -1,25 +1,98 @@
+from __future__ import annotations
+
+import enum
 import logging
-import time
+import os
+import signal
+from datetime import datetime
 from multiprocessing import Queue
+from multiprocessing.synchronize import Event, Semaphore
 
-from app.workers.backtest_executor import execute_backtest
-from app.workers.task_queue import dequeue_backtest, set_task_queue
+from app.features.backtesting.models import BacktestTask
+from app.workers.backtest_executor import execute_backtest, release_shared_dataset
+from app.workers.strategy_runner import get_runner_mode, get_runner_pool
+from app.workers.task_queue import (
+    complete_task,
+    dequeue_backtest,
+    fail_task,
+    lease_heartbeat,
+    set_task_signal,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def run_worker(queue: Queue):
-    set_task_queue(queue)
-    logger.info("[Worker] Started.")
-    while True:
-        task_id = dequeue_backtest()
-        if task_id:
-            logger.info(f"[Worker] Executing: {task_id}")
-            try:
-                execute_backtest(task_id, logger)
-                logger.info("[Worker] Finished.")
-            except Exception as e:
-                logger.error(f"[Worker] Error: {e}")
-                logger.exception(e, exc_info=True)
-        else:
-            time.sleep(0.5)
+class WorkerState(str, enum.Enum):
+    starting = "starting"
+    idle = "idle"
+    busy = "busy"
+    stopping = "stopping"
+    stopped = "stopped"
+
+
+def report_state(
+    status_queue: Queue | None,
+    worker_id: int,
+    state: WorkerState,
+    task_id: str | None = None,
+) -> None:
+    if status_queue is None:
+        return
+    try:
+        status_queue.put_nowait((worker_id, os.getpid(), state.value, task_id, datetime.now()))
+    except Exception:
+        # 状態通知の失敗でワーカーを止めない
+        pass
+
+
+def run_task(task: BacktestTask, owner: str, worker_id: int = 0) -> bool:
+    # 実行が例外で終わったタスクはバックオフ後に再試行する（回数の上限は fail_task が判定する）
+    logger.info(f"[Worker-{worker_id}] Executing: {task.backtest_id} (attempt {task.attempts})")
+    try:
+        with lease_heartbeat(task.id, owner):
+            execute_backtest(task.backtest_id, logger)
+    except Exception as e:
+        logger.error(f"[Worker-{worker_id}] Error: {e}")
+        logger.exception(e, exc_info=True)
+        fail_task(task.id, str(e))
+        release_shared_dataset(task.backtest_id)
+        return False
+    complete_task(task.id)
+    release_shared_dataset(task.backtest_id)
+    logger.info(f"[Worker-{worker_id}] Finished.")
+    return True
+
+
+def run_worker(
+    task_signal: Semaphore | None,
+    worker_id: int = 0,
+    stop_event: Event | None = None,
+    status_queue: Queue | None = None,
+):
+    # Ctrl+C は親プロセスが受け取り、停止はstop_event経由で行う
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # 親から引き継いだDB接続は使わない
+    from app.db.session import engine
+
+    engine.dispose(close=False)
+
+    # ランナーを fork する zygote は、ハートビートなどのスレッドを起動する前に用意する
+    if get_runner_mode() == "prefork":
+        get_runner_pool()
+
+    set_task_signal(task_signal)
+    owner = f"worker-{worker_id}:{os.getpid()}"
+    logger.info(f"[Worker-{worker_id}] Started.")
+    report_state(status_queue, worker_id, WorkerState.idle)
+    while stop_event is None or not stop_event.is_set():
+        task = dequeue_backtest(owner)
+        if task is None:
+            continue
+
+        report_state(status_queue, worker_id, WorkerState.busy, str(task.backtest_id))
+        run_task(task, owner, worker_id)
+        report_state(status_queue, worker_id, WorkerState.idle)
+
+    report_state(status_queue, worker_id, WorkerState.stopped)
+    logger.info(f"[Worker-{worker_id}] Stopped.")
@@ -0,0 +1,109 @@
+import unittest
+
+from sqlalchemy import StaticPool, create_engine, inspect, text
+
+import app.db.init_db  # noqa: F401
+from app.db.base import Base
+from app.db.migrations import migrate
+
+
+class TestMigrations(unittest.TestCase):
+    def test_adds_missing_columns_and_indexes(self) -> None:
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        # 列・インデックス追加前のテーブル
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE data_sources (id CHAR(32) PRIMARY KEY, name VARCHAR NOT NULL)"))
+            conn.execute(
+                text(
+                    "CREATE TABLE data_chunks (id CHAR(32) PRIMARY KEY, data_source_id CHAR(32) NOT NULL, "
+                    "start_time DATETIME NOT NULL, end_time DATETIME NOT NULL, version INTEGER NOT NULL, "
+                    "format VARCHAR(4) NOT NULL, data BLOB NOT NULL)"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO data_chunks VALUES ('c1', 's1', '2024-01-01 00:00:00', '2024-01-01 01:00:00', 1, "
+                    "'tick', x'00')"
+                )
+            )
+
+        migrate(engine)
+        migrate(engine)
+
+        inspector = inspect(engine)
+        columns = {column["name"] for column in inspector.get_columns("data_chunks")}
+        self.assertTrue({"codec", "is_active", "size"} <= columns)
+        indexes = {index["name"] for index in inspector.get_indexes("data_chunks")}
+        self.assertTrue({"ix_data_chunks_range", "ix_data_chunks_version"} <= indexes)
+        self.assertIn("rollup_chunks", inspector.get_table_names())
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT codec, is_active FROM data_chunks")).one()
+        self.assertEqual(tuple(row), ("csv", 1))
+
+        # 期間検索でインデックスが使われる
+        with engine.connect() as conn:
+            plan = conn.execute(
+                text(
+                    "EXPLAIN QUERY PLAN SELECT id FROM data_chunks WHERE data_source_id = 's1' AND is_active = 1 "
+                    "AND start_time <= '2024-01-02' AND end_time >= '2024-01-01'"
+                )
+            ).all()
+        self.assertIn("ix_data_chunks_range", " ".join(str(step) for step in plan))
+
+    def test_upgrades_tables_created_before_added_columns(self) -> None:
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        # 列の追加前の DB（データソース・スケジュール・アップロード履歴・バックテスト）
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "CREATE TABLE data_sources (id CHAR(32) PRIMARY KEY, name VARCHAR NOT NULL, symbol VARCHAR NOT NULL, "
+                    "timeframe VARCHAR NOT NULL, source_type VARCHAR NOT NULL, description VARCHAR, is_active BOOLEAN)"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE TABLE data_source_schedules (id CHAR(32) PRIMARY KEY, data_source_id CHAR(32) NOT NULL, "
+                    "enabled BOOLEAN NOT NULL, interval_type VARCHAR NOT NULL, run_at TIME NOT NULL, "
+                    "last_run_at DATETIME, next_run_at DATETIME)"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE TABLE upload_histories (id CHAR(32) PRIMARY KEY, data_source_id CHAR(32) NOT NULL, "
+                    "uploaded_by VARCHAR NOT NULL, uploaded_at DATETIME NOT NULL, file_name VARCHAR, "
+                    "version INTEGER NOT NULL)"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE TABLE backtest_runs (id CHAR(32) PRIMARY KEY, strategy_version_id CHAR(32) NOT NULL, "
+                    "status VARCHAR(7) NOT NULL, started_at DATETIME NOT NULL, completed_at DATETIME, "
+                    "error_message VARCHAR, parameters JSON, data_source_id CHAR(32) NOT NULL, "
+                    "timeframe VARCHAR NOT NULL, start_time DATETIME NOT NULL, end_time DATETIME NOT NULL, "
+                    "result_summary JSON, log JSON, chart_data JSON, created_at DATETIME NOT NULL, "
+                    "updated_at DATETIME NOT NULL)"
+                )
+            )
+            conn.execute(text("INSERT INTO data_sources VALUES ('s1', 'ds', 'USDJPY', '1m', 'csv', NULL, 1)"))
+            conn.execute(
+                text(
+                    "INSERT INTO backtest_runs (id, strategy_version_id, status, started_at, data_source_id, "
+                    "timeframe, start_time, end_time, created_at, updated_at) VALUES ('r1', 'v1', 'completed', "
+                    "'2024-01-01', 's1', '1m', '2024-01-01', '2024-01-02', '2024-01-01', '2024-01-01')"
+                )
+            )
+
+        migrate(engine)
+
+        inspector = inspect(engine)
+        for table in ("data_sources", "data_source_schedules", "upload_histories", "backtest_runs"):
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            self.assertEqual({column.name for column in Base.metadata.tables[table].columns} - columns, set())
+        with engine.connect() as conn:
+            self.assertEqual(tuple(conn.execute(text("SELECT last_version FROM data_sources")).one()), (0,))
+            row = conn.execute(text("SELECT trade_count, chart_point_count FROM backtest_runs")).one()
+        self.assertEqual(tuple(row), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import unittest
+import uuid
+from datetime import datetime
+from typing import Any
+from unittest import mock
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.backtesting import cache, crud
+from app.features.backtesting.schemas import BacktestRequest, BacktestStatus
+from app.features.datasources.models import DataChunk, DataFormat, DataSource
+from app.features.strategies.models import Strategy, StrategyVersion
+
+
+class TestResultCache(unittest.TestCase):
+    engine: Engine
+    SessionLocal: Any
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+        )
+        cls.SessionLocal = sessionmaker(bind=cls.engine)
+
+    def setUp(self) -> None:
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.SessionLocal()
+
+        strategy = Strategy(name="Cache Strategy")
+        self.db.add(strategy)
+        self.db.flush()
+        self.version = StrategyVersion(
+            strategy_id=strategy.id, version_number=1, template_json={}, generated_code="print('hello')"
+        )
+        self.source = DataSource(name="src", symbol="USDJPY", timeframe="tick", source_type="upload")
+        self.db.add_all([self.version, self.source])
+        self.db.flush()
+        self.chunk = DataChunk(
+            data_source_id=self.source.id,
+            start_time=datetime(2024, 1, 1),
+            end_time=datetime(2024, 1, 1, 1),
+            version=1,
+            format=DataFormat.tick,
+            data=b"time,bid,ask\n",
+        )
+        self.db.add(self.chunk)
+        self.db.commit()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+
+    def request(self) -> BacktestRequest:
+        return BacktestRequest(
+            strategyVersionId=self.version.id,
+            parameters={"period": 10},
+            dataSourceId=self.source.id,
+            timeframe="1m",
+            startTime=datetime(2024, 1, 1),
+            endTime=datetime(2024, 1, 1, 1),
+        )
+
+    def key(self) -> str:
+        return cache.compute_cache_key(
+            self.db,
+            "code",
+            self.source.id,
+            "1m",
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 1, 1),
+            {"initial_cash": 100000},
+        )
+
+    def test_key_changes_with_chunk_version(self) -> None:
+        before = self.key()
+        self.assertEqual(before, self.key())
+        self.chunk.version = 2
+        self.db.commit()
+        self.assertNotEqual(before, self.key())
+
+    @mock.patch("app.features.backtesting.crud.enqueue_backtest")
+    def test_hit_completes_without_enqueue(self, enqueue: mock.Mock) -> None:
+        first = crud.create_backtest_run(self.request(), self.db)
+        self.assertEqual(first.status, BacktestStatus.pending)
+        enqueue.assert_called_once()
+
+        first.trade_count = 3
+        cache.store_result(self.db, first.cache_key, self.source.id, {"final_value": 1}, first.id)
+        self.db.commit()
+
+        second = crud.create_backtest_run(self.request(), self.db)
+        self.assertEqual(second.status, BacktestStatus.success)
+        self.assertEqual(second.result_summary, {"final_value": 1})
+        self.assertEqual((second.output_id, second.trade_count), (first.id, 3))
+        self.assertIsNotNone(second.completed_at)
+        enqueue.assert_called_once()
+
+        stats = cache.get_cache_stats(self.db)
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    @mock.patch("app.features.backtesting.crud.enqueue_backtest")
+    def test_lru_eviction_and_invalidation(self, enqueue: mock.Mock) -> None:
+        run_id = crud.create_backtest_run(self.request(), self.db).id
+        with mock.patch.dict(os.environ, {"BACKTEST_CACHE_MAX_ENTRIES": "2"}):
+            for key in ("a", "b"):
+                cache.store_result(self.db, key, self.source.id, {}, run_id)
+            self.assertIsNotNone(cache.lookup_result(self.db, "a"))
+            cache.store_result(self.db, "c", self.source.id, {}, run_id)
+            self.db.commit()
+
+            # 最も長く参照されていない "b" が削除される
+            self.assertIsNone(cache.lookup_result(self.db, "b"))
+            self.assertIsNotNone(cache.lookup_result(self.db, "a"))
+
+            self.assertEqual(cache.invalidate_data_source(self.db, uuid.uuid4()), 0)
+            self.assertEqual(cache.invalidate_data_source(self.db, self.source.id), 2)
+            self.db.commit()
+
+        stats = cache.get_cache_stats(self.db)
+        self.assertEqual((stats["entries"], stats["evictions"], stats["invalidations"]), (0, 1, 2))
+
+    def test_count_recovers_when_stats_row_is_created_concurrently(self) -> None:
+        cache._count(self.db, "hits")
+        self.db.commit()
+        strategy = Strategy(name="Pending")
+        self.db.add(strategy)
+
+        # 別のワーカーが行を作成した直後で、最初の UPDATE では行が見つからなかった場合
+        increment = cache._increment
+        results = iter([lambda *args: 0, increment])
+        with mock.patch.object(cache, "_increment", side_effect=lambda *args: next(results)(*args)):
+            cache._count(self.db, "hits")
+        self.db.commit()
+
+        self.assertEqual(cache.get_cache_stats(self.db)["hits"], 2)
+        # 呼び出し元のトランザクションは戻さない
+        self.assertIsNotNone(self.db.get(Strategy, strategy.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
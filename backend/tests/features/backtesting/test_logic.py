@@ -0,0 +1,102 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from app.features.backtesting.logic import (
+    build_combinations,
+    build_walk_forward_windows,
+    expand_parameter_range,
+    rank_runs,
+    summarize_walk_forward,
+)
+from app.features.backtesting.schemas import BacktestStatus, OptimizationRequest, ParameterRange
+
+
+def make_request(**kwargs) -> OptimizationRequest:
+    return OptimizationRequest(
+        strategyVersionId="00000000-0000-0000-0000-000000000001",
+        dataSourceId="00000000-0000-0000-0000-000000000002",
+        timeframe="1h",
+        startTime="2024-01-01T00:00:00Z",
+        endTime="2024-02-01T00:00:00Z",
+        **kwargs,
+    )
+
+
+class TestOptimizationLogic(unittest.TestCase):
+    def test_expand_parameter_range(self) -> None:
+        self.assertEqual(expand_parameter_range("p", ParameterRange(start=5, stop=20, step=5)), [5, 10, 15, 20])
+        self.assertEqual(expand_parameter_range("p", ParameterRange(start=0.1, stop=0.3, step=0.1)), [0.1, 0.2, 0.3])
+        self.assertEqual(expand_parameter_range("p", ParameterRange(values=["a", "b"])), ["a", "b"])
+        with self.assertRaises(ValueError):
+            expand_parameter_range("p", ParameterRange(start=10, stop=1, step=1))
+
+    def test_build_combinations(self) -> None:
+        request = make_request(
+            parameters={"initial_cash": 5000},
+            parameterRanges={"fast": ParameterRange(start=5, stop=10, step=5), "slow": ParameterRange(values=[20, 30])},
+        )
+        combinations = build_combinations(request)
+        self.assertEqual(len(combinations), 4)
+        self.assertIn({"initial_cash": 5000, "fast": 10, "slow": 20}, combinations)
+
+    def test_too_many_combinations(self) -> None:
+        request = make_request(parameterRanges={"p": ParameterRange(start=1, stop=100, step=1)})
+        with mock.patch.dict(os.environ, {"OPTIMIZATION_MAX_COMBINATIONS": "10"}):
+            with self.assertRaises(ValueError):
+                build_combinations(request)
+
+    def test_rank_runs(self) -> None:
+        runs = [
+            SimpleNamespace(status=BacktestStatus.success, result_summary={"final_value": 100}),
+            SimpleNamespace(status=BacktestStatus.failed, result_summary=None),
+            SimpleNamespace(status=BacktestStatus.success, result_summary={"final_value": 300}),
+        ]
+        ranked = rank_runs(runs, "final_value", maximize=True)
+        self.assertEqual([(rank, score) for rank, _, score in ranked], [(1, 300.0), (2, 100.0), (None, None)])
+
+
+class TestWalkForwardLogic(unittest.TestCase):
+    def test_rolling_windows(self) -> None:
+        windows = build_walk_forward_windows(datetime(2024, 1, 1), datetime(2024, 1, 11), "4d", "2d")
+        self.assertEqual(len(windows), 3)
+        is_start, is_end, oos_start, oos_end = windows[1]
+        self.assertEqual(is_start, datetime(2024, 1, 3))
+        self.assertEqual(oos_start, datetime(2024, 1, 7))
+        self.assertLess(is_end, oos_start)
+        # 次のウィンドウのアウトオブサンプルと重ならない
+        self.assertLess(oos_end, windows[2][2])
+
+    def test_anchored_windows_with_step(self) -> None:
+        windows = build_walk_forward_windows(
+            datetime(2024, 1, 1), datetime(2024, 1, 11), "4d", "2d", "1d", anchored=True
+        )
+        self.assertEqual(len(windows), 5)
+        self.assertTrue(all(window[0] == datetime(2024, 1, 1) for window in windows))
+        self.assertEqual(windows[-1][2] - windows[-2][2], timedelta(days=1))
+
+    def test_invalid_windows(self) -> None:
+        with self.assertRaises(ValueError):
+            build_walk_forward_windows(datetime(2024, 1, 1), datetime(2024, 1, 3), "4d", "2d")
+        with mock.patch.dict(os.environ, {"WALK_FORWARD_MAX_WINDOWS": "2"}):
+            with self.assertRaises(ValueError):
+                build_walk_forward_windows(datetime(2024, 1, 1), datetime(2024, 1, 11), "4d", "2d")
+
+    def test_summarize_walk_forward(self) -> None:
+        summaries = [
+            {"initial_cash": 100, "final_value": 110, "trade_count": 2, "win_rate": 1.0},
+            {"initial_cash": 100, "final_value": 90, "trade_count": 2, "win_rate": 0.0},
+        ]
+        summary = summarize_walk_forward(summaries, [100, 110, 121, 99])
+        self.assertAlmostEqual(summary["final_value"], 99)
+        self.assertEqual(summary["trade_count"], 4)
+        self.assertAlmostEqual(summary["win_rate"], 0.5)
+        self.assertAlmostEqual(summary["max_drawdown"], (121 - 99) / 121 * 100)
+        self.assertEqual(summary["profitable_windows"], 1)
+        self.assertIsNone(summarize_walk_forward([{"final_value": 1}], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import unittest
+from collections.abc import Generator
+from pathlib import Path
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db.base import Base
+from app.db.session import get_db
+from app.features.blobs.main import app as blobs_app
+from app.features.blobs.models import Blob
+from app.features.blobs.responses import ZEROCOPY_EXTENSION, BlobFileResponse
+from app.services.storage import get_blob_client
+
+CONTENT = bytes(range(256)) * 1024
+
+
+class TestBlobRoutes(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = SessionLocal = sessionmaker(bind=engine)
+
+        def override_get_db() -> Generator[Session, None, None]:
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        blobs_app.dependency_overrides[get_db] = override_get_db
+        self.addCleanup(blobs_app.dependency_overrides.clear)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = mock.patch.dict(os.environ, {"BLOB_STORAGE_PATH": directory.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+        (Path(directory.name) / "results" / "run").mkdir(parents=True)
+        (Path(directory.name) / "results" / "run" / "output.bin").write_bytes(CONTENT)
+        with SessionLocal() as db:
+            db.add(
+                Blob(
+                    container_name="results",
+                    blob_name="run/output.bin",
+                    blob_path="/blobs/results/run/output.bin",
+                    meta_data={"Content-Type": "application/x-test"},
+                )
+            )
+            db.commit()
+
+        testapp = FastAPI()
+        testapp.mount("/blobs", blobs_app)
+        self.client = TestClient(testapp)
+        self.url = "/blobs/blobs/results/run/output.bin"
+
+    def test_full_download_with_validators(self) -> None:
+        response = self.client.get(self.url)
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["content-type"] == "application/x-test"
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["etag"]
+        assert response.headers["last-modified"]
+
+    def test_range_request_returns_partial_content(self) -> None:
+        response = self.client.get(self.url, headers={"Range": "bytes=1000-1999"})
+
+        assert response.status_code == 206
+        assert response.content == CONTENT[1000:2000]
+        assert response.headers["content-range"] == f"bytes 1000-1999/{len(CONTENT)}"
+
+        resumed = self.client.get(self.url, headers={"Range": f"bytes={len(CONTENT) - 10}-"})
+        assert resumed.content == CONTENT[-10:]
+
+    def test_conditional_requests(self) -> None:
+        etag = self.client.get(self.url).headers["etag"]
+        last_modified = self.client.get(self.url).headers["last-modified"]
+
+        not_modified = self.client.get(self.url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert self.client.get(self.url, headers={"If-Modified-Since": last_modified}).status_code == 304
+        assert self.client.get(self.url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_content_addressed_blob(self) -> None:
+        with self.SessionLocal() as db:
+            get_blob_client().upload_blob(db, "results", "chart.json", b'{"equity": []}', "application/json")
+
+        response = self.client.get("/blobs/blobs/results/chart.json")
+        assert response.status_code == 200
+        assert response.content == b'{"equity": []}'
+        assert response.headers["etag"] == f'"{hashlib.sha256(response.content).hexdigest()}"'
+
+        assert self.client.delete("/blobs/blobs/results/chart.json").status_code == 204
+        assert self.client.get("/blobs/blobs/results/chart.json").status_code == 404
+
+    def test_streaming_upload(self) -> None:
+        def body():
+            for _ in range(4):
+                yield CONTENT
+
+        response = self.client.put(
+            "/blobs/blobs/results/run/upload.bin", content=body(), headers={"Content-Type": "application/x-test"}
+        )
+        assert response.status_code == 201
+        assert response.json() == {"blobPath": "/blobs/results/run/upload.bin", "size": len(CONTENT) * 4}
+
+        downloaded = self.client.get("/blobs/blobs/results/run/upload.bin", headers={"Range": "bytes=0-9"})
+        assert downloaded.status_code == 206
+        assert downloaded.content == CONTENT[:10]
+        assert downloaded.headers["content-type"] == "application/x-test"
+
+    def test_missing_blob(self) -> None:
+        assert self.client.get("/blobs/blobs/results/run/missing.bin").status_code == 404
+
+    def test_zerocopy_send_when_server_supports_it(self) -> None:
+        path = Path(os.environ["BLOB_STORAGE_PATH"]) / "results" / "run" / "output.bin"
+        messages: list[dict] = []
+
+        async def receive() -> dict:
+            return {"type": "http.request"}
+
+        async def send(message: dict) -> None:
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "headers": [(b"range", b"bytes=10-19")],
+            "extensions": {ZEROCOPY_EXTENSION: {}},
+        }
+        asyncio.run(BlobFileResponse(path)(scope, receive, send))
+
+        assert messages[0]["status"] == 206
+        assert (messages[1]["type"], messages[1]["offset"], messages[1]["count"]) == (ZEROCOPY_EXTENSION, 10, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
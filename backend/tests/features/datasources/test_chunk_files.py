@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.blobs.models import BlobContent
+from app.features.datasources.chunk_files import migrate_chunks
+from app.features.datasources.importer import import_batches
+from app.features.datasources.models import DataChunk, DataSource
+from app.services.chunk_cache import reset_chunk_cache
+from app.services.market_data import load_chunk_columns
+from app.services.storage import get_blob_client
+
+
+def make_batch(hours: int) -> dict[str, np.ndarray]:
+    times = np.datetime64("2024-01-02T00:00", "ns") + np.arange(hours * 60) * np.timedelta64(1, "m")
+    bid = np.arange(len(times), dtype=np.float64)
+    return {"time": times, "bid": bid, "ask": bid + 0.5}
+
+
+class TestChunkFiles(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine("sqlite+pysqlite:///:memory:")
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.addCleanup(self.db.close)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.objects = Path(directory.name) / "objects"
+        env = mock.patch.dict(os.environ, {"BLOB_STORAGE_PATH": directory.name, "DATA_CHUNK_CACHE_BYTES": "0"})
+        env.start()
+        self.addCleanup(env.stop)
+        reset_chunk_cache()
+        self.addCleanup(reset_chunk_cache)
+
+        self.ds = DataSource(name="ticks", symbol="EURUSD", timeframe="tick", source_type="local_file")
+        self.db.add(self.ds)
+        self.db.commit()
+
+    def load(self) -> dict[str, np.ndarray]:
+        columns, _ = load_chunk_columns(self.db, self.ds.id, datetime(2024, 1, 2), datetime(2024, 1, 3))
+        return columns
+
+    def test_blob_mode_keeps_only_metadata_in_db(self) -> None:
+        with mock.patch.dict(os.environ, {"DATA_CHUNK_STORAGE": "blob"}):
+            import_batches(self.db, self.ds, iter([make_batch(3)]), None, "test")
+
+        chunks = self.db.query(DataChunk).filter(DataChunk.is_active.is_(True)).all()
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(chunk.data == b"" and chunk.content_hash for chunk in chunks))
+        self.assertEqual(len([path for path in self.objects.rglob("*") if path.is_file()]), 3)
+        np.testing.assert_array_equal(self.load()["bid"], make_batch(3)["bid"])
+
+    def test_migrate_between_modes(self) -> None:
+        import_batches(self.db, self.ds, iter([make_batch(2)]), None, "test")
+        expected = self.load()
+
+        self.assertEqual(migrate_chunks(self.db, "blob", batch_size=1), 2)
+        self.assertEqual(self.db.query(DataChunk).filter(DataChunk.content_hash.is_(None)).count(), 0)
+        self.assertEqual([content.ref_count for content in self.db.query(BlobContent)], [1, 1])
+        np.testing.assert_array_equal(self.load()["bid"], expected["bid"])
+
+        self.assertEqual(migrate_chunks(self.db, "db"), 2)
+        self.assertEqual(self.db.query(DataChunk).filter(DataChunk.data == b"").count(), 0)
+        self.assertEqual([content.ref_count for content in self.db.query(BlobContent)], [0, 0])
+        np.testing.assert_array_equal(self.load()["ask"], expected["ask"])
+
+    def test_superseded_chunks_release_their_payloads(self) -> None:
+        with mock.patch.dict(os.environ, {"DATA_CHUNK_STORAGE": "blob"}):
+            import_batches(self.db, self.ds, iter([make_batch(3)]), None, "test")
+            # 同じ範囲を別の値で取り込み直すと、前のバージョンのチャンクは置き換えられる
+            batch = make_batch(3)
+            batch["bid"] = batch["bid"] + 1
+            import_batches(self.db, self.ds, iter([batch]), None, "test")
+
+        inactive = self.db.query(DataChunk).filter(DataChunk.is_active.is_(False)).all()
+        self.assertTrue(inactive)
+        self.assertTrue(all(chunk.content_hash is None for chunk in inactive))
+        active = self.db.query(DataChunk).filter(DataChunk.is_active.is_(True)).all()
+        self.assertEqual(sum(content.ref_count for content in self.db.query(BlobContent)), len(active))
+
+        get_blob_client().collect_garbage(self.db, grace_seconds=-1)
+        files = [path for path in self.objects.rglob("*") if path.is_file()]
+        self.assertEqual(len(files), len(active))
+        np.testing.assert_array_equal(self.load()["bid"], batch["bid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
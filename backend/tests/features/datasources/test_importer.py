@@ -0,0 +1,69 @@
+import os
+import unittest
+from collections.abc import Iterator
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources import crud
+from app.features.datasources.chunking import build_chunk, to_ns
+from app.features.datasources.importer import import_batches
+from app.features.datasources.models import DataChunk, DataSource
+
+
+def hour_columns(*hours: int) -> dict[str, np.ndarray]:
+    times = np.array([f"2024-01-02T{hour:02d}:{minute:02d}" for hour in hours for minute in range(60)], "M8[ns]")
+    return {"time": times, "bid": np.ones(len(times)), "ask": np.ones(len(times))}
+
+
+class TestImportVersions(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine, expire_on_commit=False)()
+        self.data_source = DataSource(name="ds", symbol="USDJPY", timeframe="tick", source_type="csv")
+        self.db.add(self.data_source)
+        self.db.commit()
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    def test_versions_are_not_reused(self) -> None:
+        # 列の追加前に作られたチャンクのバージョンの続きから採番する
+        row = build_chunk(self.data_source, to_ns(np.datetime64("2024-01-01T00:00").item()), hour_columns(0), 3)
+        self.db.add(DataChunk(**row))
+        self.db.commit()
+        self.assertEqual(crud.allocate_version(self.db, self.data_source.id), 4)
+        self.assertEqual(crud.allocate_version(self.db, self.data_source.id), 5)
+
+    def test_failed_import_deactivates_only_its_own_chunks(self) -> None:
+        # 同時に動いている別の取り込みのチャンク
+        version = crud.allocate_version(self.db, self.data_source.id)
+        other = build_chunk(self.data_source, to_ns(np.datetime64("2024-01-03T00:00").item()), hour_columns(0), version)
+        self.db.add(DataChunk(**other))
+        self.db.commit()
+
+        def batches() -> Iterator[dict[str, np.ndarray]]:
+            yield hour_columns(0, 1)
+            yield hour_columns(2)
+            raise OSError("connection reset")
+
+        with mock.patch.dict(os.environ, {"DATA_IMPORT_COMMIT_CHUNKS": "1"}):
+            with self.assertRaises(OSError):
+                import_batches(self.db, self.data_source, batches(), None, "test")
+
+        chunks = self.db.query(DataChunk).order_by(DataChunk.start_time).all()
+        self.assertEqual([chunk.is_active for chunk in chunks], [False, False, True])
+        self.assertEqual(chunks[2].id, other["id"])
+        self.assertNotEqual(chunks[0].version, version)
+
+
+if __name__ == "__main__":
+    unittest.main()
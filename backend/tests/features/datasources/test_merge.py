@@ -0,0 +1,33 @@
+import unittest
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from app.features.datasources.merge import dedup_by_time, find_merge_groups
+
+HOUR = 3600 * 1_000_000_000
+
+
+class TestMerge(unittest.TestCase):
+    def test_groups_overlapping_and_misaligned_chunks(self) -> None:
+        a, b, c, d, e = (uuid.uuid4() for _ in range(5))
+        chunks = [
+            (a, datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 1)),
+            (b, datetime(2024, 1, 1, 1), datetime(2024, 1, 1, 2)),
+            (c, datetime(2024, 1, 1, 1), datetime(2024, 1, 1, 2)),
+            # 境界からずれたチャンクは単独でも作り直す
+            (d, datetime(2024, 1, 1, 3, 30), datetime(2024, 1, 1, 4)),
+            (e, datetime(2024, 1, 1, 5), datetime(2024, 1, 1, 6)),
+        ]
+        self.assertEqual(find_merge_groups(chunks, HOUR), [[b, c], [d]])
+
+    def test_dedup_keeps_last_row(self) -> None:
+        times = np.array(["2024-01-01T00:00", "2024-01-01T00:01", "2024-01-01T00:01", "2024-01-01T00:00"], "M8[ns]")
+        columns, duplicates = dedup_by_time({"time": times, "bid": np.array([1.0, 2.0, 3.0, 4.0])})
+        self.assertEqual(duplicates, 2)
+        np.testing.assert_array_equal(columns["bid"], [4.0, 3.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
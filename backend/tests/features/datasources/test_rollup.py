@@ -0,0 +1,102 @@
+import io
+import unittest
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources.importer import import_csv
+from app.features.datasources.models import DataSource, RollupChunk
+from app.services.market_data import fetch_ohlcv_data, pick_rollup_timeframe
+
+
+def tick_csv(start: str, count: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    times = np.datetime64(start, "ns") + np.cumsum(rng.integers(1, 120, count)).astype("timedelta64[s]")
+    bid = 1.1 + np.cumsum(rng.integers(-2, 3, count)) * 1e-5
+    df = pd.DataFrame(
+        {"time": np.datetime_as_string(times, unit="s"), "bid": bid.round(5), "ask": (bid + 2e-4).round(5)}
+    )
+    return df.to_csv(index=False).encode()
+
+
+class TestRollup(unittest.TestCase):
+    engine: Engine
+    SessionLocal: Any
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+        )
+        cls.SessionLocal = sessionmaker(bind=cls.engine)
+
+    def setUp(self) -> None:
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.SessionLocal()
+        self.ds = DataSource(name="ticks", symbol="EURUSD", timeframe="tick", source_type="custom_upload")
+        self.db.add(self.ds)
+        self.db.commit()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+
+    def upload(self, payload: bytes) -> None:
+        import_csv(self.db, self.ds, io.BytesIO(payload), "ticks.csv", "test")
+
+    def assert_same_as_ticks(self, timeframe: str, start: datetime, end: datetime) -> None:
+        from_rollups = fetch_ohlcv_data(self.ds.id, timeframe, start, end, db=self.db)
+        saved = self.db.query(RollupChunk).all()
+        for chunk in saved:
+            self.db.expunge(chunk)
+        self.db.query(RollupChunk).delete()
+        from_ticks = fetch_ohlcv_data(self.ds.id, timeframe, start, end, db=self.db)
+        self.db.rollback()
+        pd.testing.assert_frame_equal(from_rollups, from_ticks)
+
+    def test_serves_higher_timeframes_from_rollups(self) -> None:
+        self.upload(tick_csv("2024-01-01T00:00:00", 5000, 1))
+
+        self.assertEqual(pick_rollup_timeframe(self.db, self.ds.id, "1d"), "1d")
+        self.assertEqual(pick_rollup_timeframe(self.db, self.ds.id, "4h"), "1h")
+        self.assertEqual(pick_rollup_timeframe(self.db, self.ds.id, "15m"), "5m")
+        self.assertIsNone(pick_rollup_timeframe(self.db, self.ds.id, "1m"))
+
+        self.assert_same_as_ticks("1h", datetime(2024, 1, 1), datetime(2024, 1, 5))
+        # 足の境界に揃っていない範囲は端を下位のデータから作る
+        self.assert_same_as_ticks("15m", datetime(2024, 1, 1, 3, 7, 30), datetime(2024, 1, 3, 17, 52))
+        self.assert_same_as_ticks("1d", datetime(2024, 1, 1, 12), datetime(2024, 1, 4, 6))
+
+    def test_falls_back_to_base_data_outside_rollups(self) -> None:
+        self.upload(tick_csv("2024-01-01T00:00:00", 5000, 4))
+        # 集計より前に保存したチャンクのように、2 日目以降は集計済みの足がない
+        self.db.query(RollupChunk).filter(
+            RollupChunk.timeframe == "5m", RollupChunk.start_time >= datetime(2024, 1, 2)
+        ).delete()
+        self.db.commit()
+
+        self.assertEqual(pick_rollup_timeframe(self.db, self.ds.id, "15m"), "5m")
+        self.assert_same_as_ticks("15m", datetime(2024, 1, 1, 3, 7, 30), datetime(2024, 1, 4, 17, 52))
+
+    def test_new_upload_updates_affected_rollups(self) -> None:
+        self.upload(tick_csv("2024-01-01T00:00:00", 3000, 2))
+        before = {(c.timeframe, c.start_time): c.updated_at for c in self.db.query(RollupChunk)}
+
+        # 既存の期間の一部を上書きし、その先にデータを追加する
+        self.upload(tick_csv("2024-01-02T10:00:00", 3000, 3))
+        after = {(c.timeframe, c.start_time): c.updated_at for c in self.db.query(RollupChunk)}
+
+        self.assertEqual(after[("5m", datetime(2024, 1, 1))], before[("5m", datetime(2024, 1, 1))])
+        self.assertNotEqual(after[("5m", datetime(2024, 1, 2))], before[("5m", datetime(2024, 1, 2))])
+        self.assertGreater(len(after), len(before))
+        self.assert_same_as_ticks("1h", datetime(2024, 1, 1), datetime(2024, 1, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
+import gzip
 import unittest
+from unittest import mock
+
+from app.features.datasources import locks
 
 from .test_base import DataSourcesBaseTestCase
 
@@ -54,5 +58,168 @@ class TestCreateDataSource(DataSourcesBaseTestCase):
         assert update_schedule_response.status_code == 200
 
 
+class TestUploadData(DataSourcesBaseTestCase):
+    def create_data_source(self, timeframe: str) -> str:
+        response = self.client.post(
+            "/data-sources/data-sources",
+            json={"name": "Upload", "symbol": "EURUSD", "sourceType": "custom_upload", "timeframe": timeframe},
+        )
+        return response.json()["id"]
+
+    def test_upload_gzip_body_splits_hourly_chunks(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        rows = [f"2024-01-01T{h:02d}:{m:02d}:00Z,{1 + h / 100},{1.0002 + h / 100}\n" for h in range(3) for m in (0, 30)]
+        body = gzip.compress(("time,bid,ask\n" + "".join(rows)).encode())
+
+        response = self.client.post(
+            f"/data-sources/data-sources/{data_source_id}/upload?file_name=ticks.csv.gz",
+            content=body,
+            headers={"content-type": "application/octet-stream"},
+        )
+        assert response.status_code == 201
+        assert response.json()["rowCount"] == 6
+        assert response.json()["chunkCount"] == 3
+        assert response.json()["version"] == 1
+
+        chunks_response = self.client.get(f"/data-sources/data-sources/{data_source_id}/chunks")
+        assert [chunk["startAt"] for chunk in chunks_response.json()] == [
+            "2024-01-01T00:00:00",
+            "2024-01-01T01:00:00",
+            "2024-01-01T02:00:00",
+        ]
+
+        stream_response = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/stream",
+            params={"start": "2024-01-01T00:30:00", "end": "2024-01-01T02:00:00"},
+        )
+        assert stream_response.status_code == 200
+        assert stream_response.text.splitlines() == [
+            "time,bid,ask",
+            "2024-01-01T00:30:00.000000Z,1.0,1.0002",
+            "2024-01-01T01:00:00.000000Z,1.01,1.0102",
+            "2024-01-01T01:30:00.000000Z,1.01,1.0102",
+            "2024-01-01T02:00:00.000000Z,1.02,1.0202",
+        ]
+
+    def test_upload_multipart_ohlc(self) -> None:
+        data_source_id = self.create_data_source("1h")
+        csv = "time,open,high,low,close,volume\n" + "".join(
+            f"2024-01-0{d}T{h:02d}:00:00Z,1,2,0.5,1.5,10\n" for d in (1, 2) for h in range(12)
+        )
+
+        response = self.client.post(
+            f"/data-sources/data-sources/{data_source_id}/upload",
+            files={"file": ("bars.csv", csv.encode(), "text/csv")},
+        )
+        assert response.status_code == 201
+        assert response.json()["rowCount"] == 24
+        assert response.json()["chunkCount"] == 2
+
+    def test_overlapping_upload_replaces_rows(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        url = f"/data-sources/data-sources/{data_source_id}/upload"
+        self.client.post(url, content=b"time,bid\n2024-01-01T00:10:00Z,1.0\n2024-01-01T00:20:00Z,1.1\n")
+
+        response = self.client.post(url, content=b"time,bid\n2024-01-01T00:20:00Z,1.2\n2024-01-01T00:30:00Z,1.3\n")
+        assert response.status_code == 201
+        assert response.json()["version"] == 2
+        assert response.json()["mergedChunks"] == 2
+        assert response.json()["duplicateRows"] == 1
+
+        stream_response = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/stream",
+            params={"start": "2024-01-01T00:00:00", "end": "2024-01-01T00:59:59"},
+        )
+        lines = [line for line in stream_response.text.splitlines() if not line.startswith("time")]
+        assert [line.split(",")[1] for line in lines] == ["1.0", "1.2", "1.3"]
+
+    def test_upload_conflicts_with_running_job(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        # スケジュール実行などがデータソースのロックを持っている
+        with mock.patch.object(locks, "acquire_lock", return_value=None):
+            response = self.client.post(
+                f"/data-sources/data-sources/{data_source_id}/upload",
+                content=b"time,bid\n2024-01-01T00:10:00Z,1.0\n",
+            )
+            assert response.status_code == 409
+            merge_response = self.client.post(f"/data-sources/data-sources/{data_source_id}/merge")
+            assert merge_response.status_code == 409
+
+        response = self.client.get(f"/data-sources/data-sources/{data_source_id}/chunks")
+        assert response.json() == []
+
+    def test_stream_bars_for_timeframe(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        rows = "".join(f"2024-01-01T{h:02d}:{m:02d}:00Z,{1 + m / 1000}\n" for h in range(3) for m in range(0, 60, 10))
+        self.client.post(f"/data-sources/data-sources/{data_source_id}/upload", content=("time,bid\n" + rows).encode())
+
+        response = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/stream",
+            params={"start": "2024-01-01T00:00:00", "end": "2024-01-01T02:59:59", "timeframe": "1h"},
+        )
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert lines[0] == "time,open,high,low,close,volume"
+        assert lines[1:] == [f"2024-01-01T{h:02d}:00:00.000000Z,1.0,1.05,1.0,1.05,6.0" for h in range(3)]
+
+    def test_stream_formats(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        self.client.post(
+            f"/data-sources/data-sources/{data_source_id}/upload",
+            content=b"time,bid\n2024-01-01T00:00:00Z,1.1\n2024-01-01T00:30:00Z,1.2\n",
+        )
+        params = {"start": "2024-01-01T00:00:00", "end": "2024-01-01T01:00:00"}
+
+        ndjson = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/stream", params={**params, "format": "ndjson"}
+        )
+        assert ndjson.headers["content-type"] == "application/x-ndjson"
+        assert ndjson.text.splitlines()[0] == '{"time":"2024-01-01T00:00:00.000000Z","bid":1.1}'
+
+        sse = self.client.get(f"/data-sources/data-sources/{data_source_id}/stream", params={**params, "format": "sse"})
+        assert sse.headers["content-type"].startswith("text/event-stream")
+        assert sse.text.startswith("event: columns\ndata: time,bid\n\n")
+
+        unknown = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/stream", params={**params, "format": "xml"}
+        )
+        assert unknown.status_code == 400
+
+    def test_gaps_from_coverage_and_incomplete_chunks(self) -> None:
+        data_source_id = self.create_data_source("1h")
+        # 2024-01-02 (火) は10時まで、2024-01-03 (水) はデータなし
+        hours = [(1, h) for h in range(24)] + [(2, h) for h in range(10)] + [(4, h) for h in range(24)]
+        csv = "time,open,high,low,close\n" + "".join(f"2024-01-0{d}T{h:02d}:00:00Z,1,2,0.5,1.5\n" for d, h in hours)
+        self.client.post(f"/data-sources/data-sources/{data_source_id}/upload", content=csv.encode())
+
+        chunks = self.client.get(f"/data-sources/data-sources/{data_source_id}/chunks").json()
+        assert [(chunk["isComplete"], round(chunk["completenessRatio"], 3)) for chunk in chunks] == [
+            (True, 1.0),
+            (False, 0.417),
+            (True, 1.0),
+        ]
+
+        response = self.client.get(
+            f"/data-sources/data-sources/{data_source_id}/gaps",
+            params={"start": "2024-01-01T00:00:00", "end": "2024-01-05T00:00:00"},
+        )
+        assert response.status_code == 200
+        assert [(gap["kind"], gap["startAt"], gap["endAt"]) for gap in response.json()] == [
+            ("incomplete", "2024-01-02T00:00:00", "2024-01-03T00:00:00"),
+            ("missing", "2024-01-02T10:00:00", "2024-01-04T00:00:00"),
+        ]
+
+        rebuilt = self.client.post(f"/data-sources/data-sources/{data_source_id}/coverage")
+        assert rebuilt.json() == {"coveredHours": 58, "incompleteChunks": 1}
+
+    def test_upload_without_time_column(self) -> None:
+        data_source_id = self.create_data_source("tick")
+        response = self.client.post(
+            f"/data-sources/data-sources/{data_source_id}/upload",
+            content=b"bid,ask\n1,2\n",
+        )
+        assert response.status_code == 400
+
+
 if __name__ == "__main__":
     unittest.main()
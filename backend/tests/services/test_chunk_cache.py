@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import datetime
+from typing import Any
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources.models import DataChunk, DataFormat, DataSource
+from app.services.chunk_cache import ChunkCache, get_chunk_cache, reset_chunk_cache
+from app.services.chunk_codec import encode_columns
+from app.services.market_data import load_chunk_columns
+
+
+def make_columns(rows: int, offset: float = 0.0) -> dict[str, np.ndarray]:
+    times = np.datetime64("2024-01-01T00:00", "ns") + np.arange(rows) * np.timedelta64(1, "s")
+    return {"time": times, "bid": np.arange(rows, dtype=np.float64) + offset}
+
+
+class TestChunkCache(unittest.TestCase):
+    def test_lru_eviction_by_bytes(self) -> None:
+        # 1 件 100 行 × 2 列 × 8 バイト = 1600 バイト
+        cache = ChunkCache(max_bytes=4000)
+        a, b, c = ((uuid.uuid4(), 1) for _ in range(3))
+        cache.put(a, make_columns(100))
+        cache.put(b, make_columns(100))
+        self.assertIsNotNone(cache.get(a))
+        cache.put(c, make_columns(100))
+
+        self.assertIsNone(cache.get(b))
+        self.assertIsNotNone(cache.get(a))
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["bytes"]), (2, 3200))
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["evicted_bytes"]), (2, 1, 1, 1600))
+
+    def test_cached_arrays_are_read_only_and_invalidated(self) -> None:
+        cache = ChunkCache(max_bytes=10_000)
+        chunk_id = uuid.uuid4()
+        columns = cache.put((chunk_id, 2), make_columns(10))
+        with self.assertRaises(ValueError):
+            columns["bid"][0] = 1.0
+
+        self.assertEqual(cache.invalidate([chunk_id]), 1)
+        self.assertIsNone(cache.get((chunk_id, 2)))
+
+    def test_disk_tier_survives_restart(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            key = (uuid.uuid4(), 1)
+            ChunkCache(max_bytes=10_000, disk_dir=directory, disk_max_bytes=1 << 20).put(key, make_columns(50, 0.5))
+
+            restarted = ChunkCache(max_bytes=10_000, disk_dir=directory, disk_max_bytes=1 << 20)
+            columns = restarted.get(key)
+
+            self.assertIsNotNone(columns)
+            np.testing.assert_array_equal(columns["bid"], make_columns(50, 0.5)["bid"])
+            np.testing.assert_array_equal(columns["time"], make_columns(50)["time"])
+            self.assertEqual((restarted.stats()["disk_hits"], restarted.stats()["entries"]), (1, 1))
+
+            restarted.invalidate([key[0]])
+            self.assertEqual(os.listdir(directory), [])
+
+
+class TestChunkCacheLoading(unittest.TestCase):
+    engine: Engine
+    SessionLocal: Any
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+        cls.SessionLocal = sessionmaker(bind=cls.engine)
+        Base.metadata.create_all(bind=cls.engine)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        Base.metadata.drop_all(bind=cls.engine)
+        cls.engine.dispose()
+
+    def setUp(self) -> None:
+        env = mock.patch.dict(os.environ, {"DATA_CHUNK_CACHE_BYTES": "1000000"})
+        env.start()
+        self.addCleanup(env.stop)
+        reset_chunk_cache()
+        self.addCleanup(reset_chunk_cache)
+        self.db = self.SessionLocal()
+        self.addCleanup(self.db.close)
+
+    def add_chunk(self) -> DataSource:
+        ds = DataSource(name="test", symbol="EURUSD", timeframe="tick", source_type="custom_upload")
+        self.db.add(ds)
+        self.db.flush()
+        payload, codec = encode_columns(make_columns(100), "zlib")
+        self.db.add(
+            DataChunk(
+                data_source_id=ds.id,
+                start_time=datetime(2024, 1, 1),
+                end_time=datetime(2024, 1, 1, 1),
+                version=1,
+                format=DataFormat.tick,
+                codec=codec,
+                data=payload,
+            )
+        )
+        self.db.flush()
+        return ds
+
+    def test_second_load_is_served_from_cache(self) -> None:
+        ds = self.add_chunk()
+
+        first, _ = load_chunk_columns(self.db, ds.id, datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 0, 9))
+        second, _ = load_chunk_columns(self.db, ds.id, datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 0, 9))
+
+        np.testing.assert_array_equal(first["bid"], np.arange(10.0))
+        np.testing.assert_array_equal(second["bid"], first["bid"])
+        stats = get_chunk_cache().stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 1))
+
+    def test_bulk_scan_reads_through_without_filling_cache(self) -> None:
+        ds = self.add_chunk()
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 0, 9)
+
+        scanned, _ = load_chunk_columns(self.db, ds.id, start, end, use_cache=False)
+        np.testing.assert_array_equal(scanned["bid"], np.arange(10.0))
+        self.assertEqual(get_chunk_cache().stats()["entries"], 0)
+
+        # キャッシュ済みのチャンクは一括の読み込みでも使う
+        load_chunk_columns(self.db, ds.id, start, end)
+        load_chunk_columns(self.db, ds.id, start, end, use_cache=False)
+        stats = get_chunk_cache().stats()
+        self.assertEqual((stats["entries"], stats["misses"], stats["hits"]), (1, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from app.services.chunk_codec import CODECS, columns_to_csv, decode_columns, encode_columns
+from app.services.market_data import parse_csv_payloads
+
+
+def tick_columns(n: int) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(0)
+    times = np.datetime64("2024-01-01T00:00:00", "ns") + np.cumsum(rng.integers(1, 5_000_000_000, n)).astype(
+        "timedelta64[ns]"
+    )
+    bid = 1.1 + np.cumsum(rng.integers(-2, 3, n)) * 1e-5
+    return {"time": times, "bid": bid, "ask": bid + 0.0002, "volume": rng.integers(1, 10, n).astype(np.float64)}
+
+
+class TestChunkCodec(unittest.TestCase):
+    def test_round_trip_for_each_codec(self) -> None:
+        columns = tick_columns(1000)
+        for codec in CODECS:
+            with self.subTest(codec=codec):
+                data, used = encode_columns(columns, codec)
+                self.assertEqual(used, codec)
+                decoded = decode_columns(data, codec)
+                self.assertEqual(list(decoded), list(columns))
+                for name, values in columns.items():
+                    np.testing.assert_array_equal(decoded[name], values)
+
+    def test_large_gaps_and_small_chunks(self) -> None:
+        # 差分が 4 バイトに収まらない場合や、0〜1 行のチャンク
+        columns = {
+            "time": np.array(["2020-01-01", "2024-01-01"], dtype="datetime64[ns]"),
+            "bid": np.array([1.0, 2.0]),
+        }
+        for rows in (0, 1, 2):
+            part = {name: values[:rows] for name, values in columns.items()}
+            decoded = decode_columns(*encode_columns(part, "zlib"))
+            np.testing.assert_array_equal(decoded["time"], part["time"])
+            np.testing.assert_array_equal(decoded["bid"], part["bid"])
+
+    def test_compresses_below_csv(self) -> None:
+        columns = tick_columns(10000)
+        csv = columns_to_csv(columns)
+        data, _ = encode_columns(columns, "zlib")
+        self.assertLess(len(data) * 2, len(csv))
+        parsed = parse_csv_payloads([csv])
+        np.testing.assert_array_equal(parsed["time"], columns["time"].astype("datetime64[us]"))
+
+
+if __name__ == "__main__":
+    unittest.main()
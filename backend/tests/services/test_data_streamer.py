@@ -0,0 +1,147 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from typing import Any
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources.models import DataChunk, DataFormat, DataSource
+from app.services import data_streamer
+from app.services.chunk_codec import encode_columns
+from app.services.market_data import load_bars
+
+
+class TestDataStreamer(unittest.TestCase):
+    engine: Engine
+    SessionLocal: Any
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+        )
+        cls.SessionLocal = sessionmaker(bind=cls.engine)
+        Base.metadata.create_all(bind=cls.engine)
+
+    def setUp(self) -> None:
+        self.db = self.SessionLocal()
+        self.ds = DataSource(name="test", symbol="EURUSD", timeframe="1m", source_type="custom_upload")
+        self.db.add(self.ds)
+        self.db.flush()
+        # 1分足を3日分（1日1チャンク）
+        for day in range(3):
+            start = np.datetime64("2024-01-01T00:00", "ns") + np.timedelta64(day, "D")
+            times = start + np.arange(1440) * np.timedelta64(1, "m")
+            close = np.arange(1440, dtype=np.float64) + day * 1440
+            columns = {"time": times, "open": close, "high": close + 0.5, "low": close - 0.5, "close": close}
+            payload, codec = encode_columns(columns, "zlib")
+            self.db.add(
+                DataChunk(
+                    data_source_id=self.ds.id,
+                    start_time=datetime(2024, 1, 1) + timedelta(days=day),
+                    end_time=datetime(2024, 1, 2) + timedelta(days=day),
+                    version=1,
+                    format=DataFormat.ohlc,
+                    codec=codec,
+                    data=payload,
+                )
+            )
+        self.db.flush()
+
+    def tearDown(self) -> None:
+        self.db.rollback()
+        self.db.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        Base.metadata.drop_all(bind=cls.engine)
+        cls.engine.dispose()
+
+    def test_chunks_are_trimmed_to_exact_range(self) -> None:
+        parts = list(
+            data_streamer.iter_chunk_columns(
+                self.db, self.ds.id, datetime(2024, 1, 1, 23, 58), datetime(2024, 1, 3, 0, 1)
+            )
+        )
+
+        self.assertEqual([len(part["time"]) for part in parts], [2, 1440, 2])
+        self.assertEqual(parts[0]["time"][0], np.datetime64("2024-01-01T23:58", "ns"))
+        self.assertEqual(parts[-1]["time"][-1], np.datetime64("2024-01-03T00:01", "ns"))
+
+    def test_csv_has_single_header(self) -> None:
+        text = b"".join(
+            data_streamer.stream_data_chunks(
+                self.db, self.ds.id, datetime(2024, 1, 1, 23, 59), datetime(2024, 1, 2, 0, 0)
+            )
+        ).decode()
+
+        self.assertEqual(
+            text.splitlines(),
+            [
+                "time,open,high,low,close",
+                "2024-01-01T23:59:00.000000Z,1439.0,1439.5,1438.5,1439.0",
+                "2024-01-02T00:00:00.000000Z,1440.0,1440.5,1439.5,1440.0",
+            ],
+        )
+
+    def test_bars_are_streamed_in_windows(self) -> None:
+        start, end = datetime(2024, 1, 1, 0, 7), datetime(2024, 1, 3, 12, 0)
+        expected = load_bars(self.db, self.ds.id, "15m", start, end)
+
+        # 期間を小さな窓に分けて集計しても、一括で集計した結果と一致する
+        with mock.patch.object(data_streamer, "STREAM_WINDOW_BARS", 7):
+            parts = list(data_streamer.iter_bar_columns(self.db, self.ds.id, "15m", start, end))
+
+        self.assertGreater(len(parts), 1)
+        for name, values in expected.items():
+            np.testing.assert_array_equal(np.concatenate([part[name] for part in parts]), values)
+
+    def stream(self, fmt: str) -> bytes:
+        return b"".join(
+            data_streamer.stream_data_chunks(
+                self.db, self.ds.id, datetime(2024, 1, 1, 23, 59), datetime(2024, 1, 2, 0, 0), fmt=fmt
+            )
+        )
+
+    def test_ndjson_rows(self) -> None:
+        rows = [json.loads(line) for line in self.stream("ndjson").splitlines()]
+
+        self.assertEqual(
+            rows[1],
+            {"time": "2024-01-02T00:00:00.000000Z", "open": 1440.0, "high": 1440.5, "low": 1439.5, "close": 1440.0},
+        )
+        self.assertEqual(len(rows), 2)
+
+    def test_sse_events(self) -> None:
+        events = self.stream("sse").decode().split("\n\n")
+
+        self.assertEqual(
+            events,
+            [
+                "event: columns\ndata: time,open,high,low,close",
+                "data: 2024-01-01T23:59:00.000000Z,1439.0,1439.5,1438.5,1439.0",
+                "data: 2024-01-02T00:00:00.000000Z,1440.0,1440.5,1439.5,1440.0",
+                "event: end\ndata: ",
+                "",
+            ],
+        )
+
+    @unittest.skipIf(data_streamer.pa is None, "pyarrow is not installed")
+    def test_arrow_record_batches(self) -> None:
+        table = data_streamer.pa.ipc.open_stream(self.stream("arrow")).read_all()
+
+        self.assertEqual(table.column_names, ["time", "open", "high", "low", "close"])
+        self.assertEqual(table.column("close").to_pylist(), [1439.0, 1440.0])
+
+    def test_unknown_format(self) -> None:
+        with self.assertRaises(ValueError):
+            data_streamer.get_media_type("xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from app.services.downsample import downsample_parts, downsample_points, lttb_indices
+from app.services.market_data import concat_columns
+
+
+def split(columns: dict[str, np.ndarray], size: int) -> list[dict[str, np.ndarray]]:
+    return [
+        {name: values[i : i + size] for name, values in columns.items()} for i in range(0, len(columns["time"]), size)
+    ]
+
+
+def concat(parts) -> dict[str, np.ndarray]:
+    return concat_columns(list(parts))
+
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self) -> None:
+        count = 10000
+        self.times = np.datetime64("2024-01-01T00:00", "ns") + np.arange(count) * np.timedelta64(1, "m")
+        self.values = np.sin(np.arange(count) / 200.0)
+        # 形を保つ間引きなら、目立つ1点の山は残る
+        self.values[4321] = 5.0
+
+    def test_lttb_keeps_endpoints_and_peaks(self) -> None:
+        x = np.arange(len(self.values), dtype=np.float64)
+        indices = lttb_indices(x, self.values, 100)
+
+        self.assertEqual(len(indices), 100)
+        self.assertEqual((indices[0], indices[-1]), (0, len(x) - 1))
+        self.assertIn(4321, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+
+    def test_streamed_lines_are_reduced_across_parts(self) -> None:
+        columns = {"time": self.times, "bid": self.values}
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 7, 22, 39)
+
+        parts = list(downsample_parts(iter(split(columns, 777)), start, end, 200))
+        times = np.concatenate([part["time"] for part in parts])
+        values = np.concatenate([part["bid"] for part in parts])
+
+        self.assertLessEqual(len(times), 200)
+        self.assertEqual((times[0], times[-1]), (self.times[0], self.times[-1]))
+        self.assertIn(5.0, values)
+        self.assertTrue(np.all(np.diff(times.astype(np.int64)) > 0))
+
+    def test_streamed_candles_do_not_depend_on_part_boundaries(self) -> None:
+        columns = {
+            "time": self.times,
+            "open": self.values,
+            "high": self.values + 1,
+            "low": self.values - 1,
+            "close": self.values,
+            "volume": np.ones(len(self.times)),
+        }
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 7, 22, 39)
+
+        whole = concat(downsample_parts(iter([columns]), start, end, 50))
+        parts = concat(downsample_parts(iter(split(columns, 333)), start, end, 50))
+
+        self.assertLessEqual(len(whole["time"]), 50)
+        self.assertEqual(whole["volume"].sum(), len(self.times))
+        self.assertEqual(whole["high"].max(), 6.0)
+        for name, values in whole.items():
+            np.testing.assert_array_equal(parts[name], values)
+
+    def test_downsample_chart_points(self) -> None:
+        points = [{"time": str(t), "equity": float(v)} for t, v in zip(self.times, self.values, strict=True)]
+
+        reduced = list(downsample_points(points, 30))
+
+        self.assertEqual(len(reduced), 30)
+        self.assertIs(reduced[0], points[0])
+        self.assertIn({"time": str(self.times[4321]), "equity": 5.0}, reduced)
+        np.testing.assert_array_equal(
+            [points.index(point) for point in reduced],
+            lttb_indices(np.arange(len(points), dtype=np.float64), self.values, 30),
+        )
+        # 点の数が分かっていれば、読み進めながら同じ点を選ぶ
+        self.assertEqual(list(downsample_points(iter(points), 30, total=len(points))), reduced)
+
+    def test_points_without_value_are_kept(self) -> None:
+        points = [{"time": str(t), "equity": float(v)} for t, v in zip(self.times, self.values, strict=True)]
+        points[100] = {"time": str(self.times[100]), "equity": None}
+        points[200] = {"time": str(self.times[200]), "close": 1.0}
+
+        self.assertEqual(list(downsample_points(points[:250], 300)), points[:250])
+        reduced = list(downsample_points(iter(points), 30, total=len(points)))
+        self.assertIn(points[100], reduced)
+        self.assertIn(points[200], reduced)
+        self.assertLessEqual(len(reduced), 32)
+        self.assertEqual(reduced, sorted(reduced, key=points.index))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources.models import DataChunk, DataFormat, DataSource
+from app.services.chunk_codec import encode_columns
+from app.services.market_data import fetch_ohlcv_data, parse_csv_payloads, resample_ohlc
+
+
+def tick_csv(rows: list[tuple[str, float]]) -> bytes:
+    return ("time,bid,ask\n" + "".join(f"{t},{bid},{bid + 0.0002}\n" for t, bid in rows)).encode()
+
+
+class TestMarketData(unittest.TestCase):
+    engine: Engine
+    SessionLocal: Any
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+        )
+        cls.SessionLocal = sessionmaker(bind=cls.engine)
+        Base.metadata.create_all(bind=cls.engine)
+
+    def setUp(self) -> None:
+        self.db = self.SessionLocal()
+        self.ds = DataSource(name="test", symbol="EURUSD", timeframe="tick", source_type="custom_upload")
+        self.db.add(self.ds)
+        self.db.flush()
+
+    def tearDown(self) -> None:
+        self.db.rollback()
+        self.db.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        Base.metadata.drop_all(bind=cls.engine)
+        cls.engine.dispose()
+
+    def add_chunk(
+        self, start: datetime, end: datetime, payload: bytes, fmt: DataFormat = DataFormat.tick, codec: str = "csv"
+    ) -> None:
+        self.db.add(
+            DataChunk(
+                data_source_id=self.ds.id,
+                start_time=start,
+                end_time=end,
+                version=1,
+                format=fmt,
+                codec=codec,
+                data=payload,
+            )
+        )
+        self.db.flush()
+
+    def test_fetch_resamples_ticks_and_trims_range(self) -> None:
+        self.add_chunk(
+            datetime(2024, 1, 1, 0),
+            datetime(2024, 1, 1, 1),
+            tick_csv(
+                [
+                    ("2024-01-01T00:00:10Z", 1.1000),
+                    ("2024-01-01T00:00:20Z", 1.1010),
+                    ("2024-01-01T00:00:50Z", 1.0990),
+                    ("2024-01-01T00:01:05Z", 1.1020),
+                    ("2024-01-01T00:59:59Z", 1.1030),
+                ]
+            ),
+        )
+        self.add_chunk(
+            datetime(2024, 1, 1, 1),
+            datetime(2024, 1, 1, 2),
+            tick_csv(
+                [
+                    ("2024-01-01T01:00:01.5000000+00:00", 1.1040),
+                    ("2024-01-01T01:30:00Z", 1.1050),
+                ]
+            ),
+        )
+
+        df = fetch_ohlcv_data(
+            self.ds.id, "1m", datetime(2024, 1, 1, 0, 0, 15), datetime(2024, 1, 1, 1, 0, 5), db=self.db
+        )
+
+        self.assertEqual(
+            list(df.index),
+            [
+                datetime(2024, 1, 1, 0, 0),
+                datetime(2024, 1, 1, 0, 1),
+                datetime(2024, 1, 1, 0, 59),
+                datetime(2024, 1, 1, 1, 0),
+            ],
+        )
+        first = df.iloc[0]
+        self.assertEqual((first.open, first.high, first.low, first.close), (1.1010, 1.1010, 1.0990, 1.0990))
+        self.assertEqual(first.volume, 2)
+        self.assertEqual(df.iloc[-1].close, 1.1040)
+
+    def test_fetch_mixes_binary_and_csv_chunks(self) -> None:
+        columns = parse_csv_payloads([tick_csv([("2024-01-01T00:00:10Z", 1.1), ("2024-01-01T00:30:00Z", 1.2)])])
+        payload, codec = encode_columns(columns, "zlib")
+        self.add_chunk(datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 1), payload, codec=codec)
+        self.add_chunk(datetime(2024, 1, 1, 1), datetime(2024, 1, 1, 2), tick_csv([("2024-01-01T01:10:00Z", 1.3)]))
+
+        df = fetch_ohlcv_data(self.ds.id, "1h", datetime(2024, 1, 1), datetime(2024, 1, 1, 2), db=self.db)
+
+        self.assertEqual(list(df.index), [datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 1)])
+        self.assertEqual((df.iloc[0].open, df.iloc[0].close, df.iloc[0].volume), (1.1, 1.2, 2))
+        self.assertEqual(df.iloc[1].close, 1.3)
+
+    def test_fetch_without_chunks_returns_empty_frame(self) -> None:
+        df = fetch_ohlcv_data(self.ds.id, "1h", datetime(2024, 1, 1), datetime(2024, 1, 2), db=self.db)
+        self.assertTrue(df.empty)
+        self.assertEqual(list(df.columns), ["open", "high", "low", "close", "volume"])
+
+    def test_resample_ohlc_to_higher_timeframe(self) -> None:
+        payload = "time,open,high,low,close,volume\n" + "".join(
+            f"2024-01-01T00:{m:02d}:00Z,{1 + m},{2 + m},{m},{1.5 + m},10\n" for m in range(10)
+        )
+        bars = resample_ohlc(parse_csv_payloads([payload.encode()]), "5m")
+
+        np.testing.assert_array_equal(bars["open"], [1, 6])
+        np.testing.assert_array_equal(bars["high"], [6, 11])
+        np.testing.assert_array_equal(bars["low"], [0, 5])
+        np.testing.assert_array_equal(bars["close"], [5.5, 10.5])
+        np.testing.assert_array_equal(bars["volume"], [50, 50])
+
+
+if __name__ == "__main__":
+    unittest.main()
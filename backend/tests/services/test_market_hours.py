@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from app.services.market_hours import HOUR_NS, expected_slots, is_open, open_ns_between
+
+
+def ns(value: str) -> int:
+    return int(np.datetime64(value, "ns").astype(np.int64))
+
+
+class TestMarketHours(unittest.TestCase):
+    def test_weekly_open_hours(self) -> None:
+        # 2024-01-07 は日曜日
+        week = open_ns_between(np.array([ns("2024-01-07T00:00")]), np.array([ns("2024-01-14T00:00")]))
+        self.assertEqual(week[0], 119 * HOUR_NS)
+
+    def test_is_open_around_weekend(self) -> None:
+        times = np.array(
+            [
+                ns(t)
+                for t in (
+                    "2024-01-05T20:59",
+                    "2024-01-05T21:00",
+                    "2024-01-06T12:00",
+                    "2024-01-07T21:59",
+                    "2024-01-07T22:00",
+                )
+            ]
+        )
+        np.testing.assert_array_equal(is_open(times), [True, False, False, False, True])
+
+    def test_expected_slots_per_chunk(self) -> None:
+        # 金曜・土曜・日曜・月曜の1日チャンクに含まれる1時間足の数
+        starts = np.array([ns(f"2024-01-{d:02d}T00:00") for d in (5, 6, 7, 8)])
+        counts = expected_slots(starts, starts + 24 * HOUR_NS, HOUR_NS)
+        np.testing.assert_array_equal(counts, [21, 0, 2, 24])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.blobs.models import Blob, BlobContent
+from app.services.storage import AsyncLocalBlobStorageClient, BlobStorageException, LocalBlobStorageClient
+
+
+class TestLocalBlobStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.addCleanup(self.db.close)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.base = Path(directory.name)
+        env = mock.patch.dict(os.environ, {"BLOB_STORAGE_PATH": directory.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.client = LocalBlobStorageClient()
+
+    def objects(self) -> list[Path]:
+        return [path for path in (self.base / "objects").rglob("*") if path.is_file()]
+
+    def test_identical_content_is_stored_once(self) -> None:
+        local = self.base / "local.csv"
+        local.write_bytes(b"time,bid\n" * 1000)
+
+        self.client.upload_blob(self.db, "results", "a/chart.json", b"[1,2,3]")
+        self.client.upload_stream(self.db, "results", "b/chart.json", io.BytesIO(b"[1,2,3]"))
+        path, size = self.client.upload_file(self.db, str(local), "datasets", "run1/data.csv")
+        self.client.upload_file(self.db, str(local), "datasets", "run2/data.csv")
+
+        self.assertEqual((path, size), ("/blobs/datasets/run1/data.csv", 9000))
+        self.assertEqual(len(self.objects()), 2)
+        self.assertEqual(list((self.base / "tmp").iterdir()), [])
+        refs = {content.size: content.ref_count for content in self.db.query(BlobContent)}
+        self.assertEqual(refs, {7: 2, 9000: 2})
+        blob = self.db.query(Blob).filter(Blob.blob_name == "b/chart.json").one()
+        self.assertEqual(self.client.read_content(blob.content_hash), b"[1,2,3]")
+
+    def test_garbage_collection_follows_references(self) -> None:
+        self.client.upload_blob(self.db, "results", "a.json", b"shared")
+        self.client.upload_blob(self.db, "results", "b.json", b"shared")
+        # 同じ名前で上書きすると前の内容の参照が外れる
+        self.client.upload_blob(self.db, "results", "b.json", b"replaced")
+        self.assertTrue(self.client.delete_blob(self.db, "results", "a.json"))
+        self.assertFalse(self.client.delete_blob(self.db, "results", "a.json"))
+
+        # 猶予期間中は削除しない
+        self.assertEqual(self.client.collect_garbage(self.db), 0)
+        self.assertEqual(len(self.objects()), 2)
+
+        self.assertEqual(self.client.collect_garbage(self.db, grace_seconds=-1), 1)
+        self.assertEqual(len(self.objects()), 1)
+        [content] = self.db.query(BlobContent).all()
+        self.assertEqual((content.size, content.ref_count), (8, 1))
+
+        # 削除済みの内容を再度アップロードすると保存し直す
+        self.client.upload_blob(self.db, "results", "c.json", b"shared")
+        self.assertEqual(len(self.objects()), 2)
+
+    def test_dedup_hit_is_not_collected_before_blob_is_recorded(self) -> None:
+        self.client.upload_blob(self.db, "results", "a.json", b"shared")
+        self.client.delete_blob(self.db, "results", "a.json")
+        self.db.query(BlobContent).update({BlobContent.released_at: datetime(2000, 1, 1)})
+        self.db.commit()
+
+        # 本体が残っている内容を書き込んだ直後、Blob を記録する前に GC が走っても消されない
+        content_hash, size = self.client.put_content(self.db, io.BytesIO(b"shared"))
+        self.db.commit()
+        self.assertEqual(self.client.collect_garbage(self.db, grace_seconds=-1), 0)
+        self.client._put_blob(self.db, "results", "b.json", content_hash, size, "application/json")
+
+        self.assertEqual(self.client.read_content(content_hash), b"shared")
+        self.assertEqual(self.db.get(BlobContent, content_hash).ref_count, 1)
+
+    def test_async_client_streams_chunks(self) -> None:
+        client = AsyncLocalBlobStorageClient()
+
+        async def chunks():
+            for i in range(3):
+                yield bytes([i]) * 1000
+
+        async def scenario() -> tuple[str, bytes]:
+            path, _ = await client.upload_stream(self.db, "results", "async.bin", chunks())
+            blob = self.db.query(Blob).filter(Blob.blob_name == "async.bin").one()
+            data = b"".join([chunk async for chunk in client.read_content_stream(blob.content_hash)])
+            return path, data
+
+        path, data = asyncio.run(scenario())
+        self.assertEqual(path, "/blobs/results/async.bin")
+        self.assertEqual(data, b"\x00" * 1000 + b"\x01" * 1000 + b"\x02" * 1000)
+        # 同期版で書いた同じ内容とは本体を共有する
+        self.client.upload_blob(self.db, "results", "sync.bin", data)
+        self.assertEqual(len(self.objects()), 1)
+        self.assertEqual(list((self.base / "tmp").iterdir()), [])
+
+    def test_invalid_content_hash(self) -> None:
+        with self.assertRaises(BlobStorageException):
+            self.client.get_content_path("../../etc/passwd")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from app.workers.backtest_executor import write_dataframe
+from app.workers.data_loader import load_columns, load_data
+from app.workers.datasets import link_dataset, prepare_shared_dataset
+
+
+class TestDataLoader(unittest.TestCase):
+    def setUp(self) -> None:
+        index = pd.date_range("2024-01-01", periods=100, freq="1min", name="datetime")
+        self.df = pd.DataFrame(
+            {
+                "open": np.linspace(1.0, 2.0, 100),
+                "high": np.linspace(1.1, 2.1, 100),
+                "low": np.linspace(0.9, 1.9, 100),
+                "close": np.linspace(1.05, 2.05, 100),
+                "volume": np.arange(100, dtype=np.int64),
+            },
+            index=index,
+        )
+        self.work_dir = Path(tempfile.mkdtemp(prefix="bt_test_"))
+
+    def test_npy_round_trip(self) -> None:
+        write_dataframe(self.df, self.work_dir, "npy")
+        self.assertFalse((self.work_dir / "data.csv").exists())
+
+        loaded = load_data(self.work_dir)
+        pd.testing.assert_frame_equal(loaded.copy(), self.df, check_freq=False)
+
+        # 列はmmapのままコピーされない
+        columns = load_columns(self.work_dir)
+        self.assertIsInstance(columns["close"], np.memmap)
+        self.assertFalse(loaded["close"].to_numpy().flags.owndata)
+
+    def test_csv_fallback(self) -> None:
+        write_dataframe(self.df, self.work_dir, "csv")
+        self.assertFalse((self.work_dir / "data").exists())
+
+        loaded = load_data(self.work_dir)
+        pd.testing.assert_frame_equal(loaded, self.df, check_freq=False)
+
+    def test_linked_dataset_window(self) -> None:
+        calls = []
+
+        def load() -> pd.DataFrame:
+            calls.append(1)
+            return self.df
+
+        with mock.patch.dict(os.environ, {"BACKTEST_DATASET_DIR": str(self.work_dir / "datasets")}):
+            dataset_dir = prepare_shared_dataset("opt_test", load)
+            prepare_shared_dataset("opt_test", load)
+        self.assertEqual(len(calls), 1)
+
+        run_dir = self.work_dir / "run"
+        link_dataset(dataset_dir, run_dir, self.df.index[10].to_pydatetime(), self.df.index[19].to_pydatetime())
+        loaded = load_data(run_dir)
+        pd.testing.assert_frame_equal(loaded.copy(), self.df.iloc[10:20], check_freq=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
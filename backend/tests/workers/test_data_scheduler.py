@@ -0,0 +1,166 @@
+import asyncio
+import os
+import tempfile
+import time as time_module
+import unittest
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.datasources import locks
+from app.features.datasources.fetchers import LocalFileFetcher
+from app.features.datasources.jobs import following_run_at, run_data_source_job, utcnow
+from app.features.datasources.models import DataChunk, DataSource, DataSourceJob, DataSourceSchedule
+from app.workers import data_scheduler
+
+
+class TestDataScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        # ジョブは複数のスレッドで並行に動くので、接続を共有しないファイルの DB を使う
+        engine = create_engine(f"sqlite+pysqlite:///{directory.name}/test.db")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        patcher = mock.patch.object(data_scheduler, "SessionLocal", self.SessionLocal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # ローカルファイルの取得元（2024-01-02 の 1 時台は半分だけ）
+        rows = [f"2024-01-02T00:{m:02d}:00Z,1,2,0.5,1.5\n" for m in range(60)]
+        rows += [f"2024-01-02T01:{m:02d}:00Z,1,2,0.5,1.5\n" for m in range(0, 60, 2)]
+        (Path(directory.name) / "EURUSD").mkdir()
+        (Path(directory.name) / "EURUSD" / "bars.csv").write_text("time,open,high,low,close\n" + "".join(rows))
+        env = mock.patch.dict(os.environ, {"DATA_FETCH_DIR": directory.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def add_schedule(self, **values) -> DataSourceSchedule:
+        with self.SessionLocal(expire_on_commit=False) as db:
+            ds = DataSource(name="fetch", symbol="EURUSD", timeframe="1m", source_type="local_file")
+            db.add(ds)
+            db.flush()
+            schedule = DataSourceSchedule(
+                data_source_id=ds.id,
+                interval_type="daily",
+                run_at=time(4, 0),
+                next_run_at=utcnow() - timedelta(minutes=1),
+                **values,
+            )
+            db.add(schedule)
+            db.commit()
+            return schedule
+
+    def run_once(self, concurrency: int = 4) -> int:
+        async def scenario() -> int:
+            scheduler = data_scheduler.DataScheduler(concurrency=concurrency, poll_seconds=0)
+            started = await scheduler.run_once()
+            await scheduler.wait_idle()
+            return started
+
+        return asyncio.run(scenario())
+
+    def test_runs_due_schedule_and_records_job(self) -> None:
+        schedule = self.add_schedule()
+
+        self.assertEqual(self.run_once(), 1)
+
+        with self.SessionLocal() as db:
+            job = db.query(DataSourceJob).one()
+            self.assertEqual(job.status, "success")
+            # 初回の取得 90 行と、不完全な 1 時台のチャンクの再取得 30 行
+            self.assertEqual((job.fetched_rows, job.retried_chunks), (120, 1))
+            self.assertIsNotNone(job.duration_ms)
+            chunks = db.query(DataChunk).filter(DataChunk.is_active.is_(True)).order_by(DataChunk.start_time).all()
+            self.assertEqual([chunk.is_complete for chunk in chunks], [True, False])
+
+            saved = db.get(DataSourceSchedule, schedule.id)
+            self.assertFalse(saved.is_running)
+            self.assertGreater(saved.next_run_at, utcnow())
+            self.assertIsNotNone(saved.last_run_at)
+
+        # 次回の予定までは実行しない
+        self.assertEqual(self.run_once(), 0)
+
+    def test_skips_locked_and_respects_concurrency(self) -> None:
+        self.add_schedule(is_running=True, locked_until=utcnow() + timedelta(minutes=10))
+        for _ in range(3):
+            self.add_schedule()
+
+        self.assertEqual(self.run_once(concurrency=2), 2)
+        self.assertEqual(self.run_once(concurrency=2), 1)
+
+    def test_busy_data_source_is_retried_later(self) -> None:
+        schedule = self.add_schedule()
+        # アップロード・マージがデータソースのロックを持っている
+        with self.SessionLocal() as db:
+            self.assertIsNotNone(locks.acquire_lock(db, schedule.data_source_id))
+
+        self.assertEqual(self.run_once(), 1)
+
+        with self.SessionLocal() as db:
+            self.assertEqual(db.query(DataSourceJob).count(), 0)
+            saved = db.get(DataSourceSchedule, schedule.id)
+            self.assertFalse(saved.is_running)
+            self.assertEqual(saved.next_run_at, schedule.next_run_at)
+
+    def test_long_job_renews_its_locks(self) -> None:
+        schedule = self.add_schedule()
+        seen: list[bool] = []
+
+        def slow_job(db, data_source):
+            time_module.sleep(0.5)
+            # 最初の期限を過ぎても他の処理はロックを取れない
+            with self.SessionLocal() as other:
+                seen.append(locks.acquire_lock(other, data_source.id) is None)
+                seen.append(bool(data_scheduler.claim_schedule(schedule.id)))
+            return None
+
+        with mock.patch.dict(os.environ, {"DATA_SCHEDULER_LOCK_SECONDS": "0.3"}):
+            with mock.patch.object(data_scheduler, "run_data_source_job", slow_job):
+                self.assertEqual(self.run_once(), 1)
+
+        self.assertEqual(seen, [True, False])
+        with self.SessionLocal() as db:
+            self.assertIsNone(db.get(DataSource, schedule.data_source_id).locked_until)
+
+    def test_retry_rotates_through_incomplete_chunks(self) -> None:
+        # 0 時台・2 時台は取得元でも半分しかなく、何度取得し直しても不完全のまま
+        rows = [f"2024-01-02T{h:02d}:{m:02d}:00Z,1,2,0.5,1.5\n" for h in (0, 2) for m in range(0, 60, 2)]
+        (Path(os.environ["DATA_FETCH_DIR"]) / "GBPUSD").mkdir()
+        (Path(os.environ["DATA_FETCH_DIR"]) / "GBPUSD" / "bars.csv").write_text(
+            "time,open,high,low,close\n" + "".join(rows)
+        )
+        retried: list[datetime] = []
+
+        class RecordingFetcher(LocalFileFetcher):
+            def fetch(self, data_source, start, end):
+                if start is not None and end - start == timedelta(hours=1):
+                    retried.append(start)
+                return super().fetch(data_source, start, end)
+
+        with self.SessionLocal() as db:
+            ds = DataSource(name="fetch", symbol="GBPUSD", timeframe="1m", source_type="local_file")
+            db.add(ds)
+            db.commit()
+            with mock.patch.dict(os.environ, {"DATA_SCHEDULE_RETRY_CHUNKS": "1"}):
+                for _ in range(3):
+                    run_data_source_job(db, ds, RecordingFetcher())
+
+        # 前回の続きから再取得し、最後まで進んだら先頭に戻る
+        self.assertEqual(retried, [datetime(2024, 1, 2, 0), datetime(2024, 1, 2, 2), datetime(2024, 1, 2, 0)])
+
+    def test_following_run_skips_missed_intervals(self) -> None:
+        scheduled = datetime(2024, 1, 1, 4)
+        self.assertEqual(following_run_at(scheduled, "daily", datetime(2024, 1, 3, 12)), datetime(2024, 1, 4, 4))
+        self.assertEqual(following_run_at(scheduled, "weekly", datetime(2024, 1, 1, 4)), datetime(2024, 1, 8, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import tempfile
+import threading
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.backtesting.models import BacktestChartPoint, BacktestTrade
+from app.workers import output_ingest
+from app.workers.data_loader import open_output, write_output
+
+
+class TestOutputIngest(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        patcher = mock.patch.object(output_ingest, "SessionLocal", self.SessionLocal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.work_dir = Path(tempfile.mkdtemp(prefix="bt_test_"))
+        self.backtest_id = uuid.uuid4()
+
+    def test_iter_json_array_in_small_chunks(self) -> None:
+        data = [{"pnl": i, "note": "a, ] b"} for i in range(200)] + [12345]
+        path = self.work_dir / "trades.json"
+        path.write_text(json.dumps(data, indent=2))
+        self.assertEqual(list(output_ingest.iter_json_array(path, chunk_size=7)), data)
+
+    def test_follow_json_lines_while_running(self) -> None:
+        ingested = threading.Event()
+        with output_ingest.follow_outputs(self.backtest_id, self.work_dir) as counts:
+            with open_output(self.work_dir, "trades") as output:
+                for i in range(10):
+                    write_output(output, {"pnl": i})
+                # 実行中に取り込まれるまで待つ
+                for _ in range(50):
+                    with self.SessionLocal() as db:
+                        if db.query(BacktestTrade).count() == 10:
+                            ingested.set()
+                            break
+                    threading.Event().wait(0.1)
+                write_output(output, {"pnl": 10})
+        self.assertTrue(ingested.is_set())
+        self.assertEqual(counts, {"trades": 11, "chart_data": 0})
+
+        with self.SessionLocal() as db:
+            rows = db.query(BacktestTrade).order_by(BacktestTrade.seq).all()
+            self.assertEqual([r.data["pnl"] for r in rows], list(range(11)))
+
+    def test_ingest_json_arrays_in_batches(self) -> None:
+        (self.work_dir / "chart_data.json").write_text(json.dumps([{"equity": i} for i in range(25)]))
+        counts = {"trades": 0, "chart_data": 0}
+        with self.SessionLocal() as db, mock.patch.dict("os.environ", {"BACKTEST_OUTPUT_BATCH_SIZE": "10"}):
+            output_ingest.ingest_json_arrays(db, self.backtest_id, self.work_dir, counts)
+            self.assertEqual(counts["chart_data"], 25)
+            self.assertEqual(db.query(BacktestChartPoint).count(), 25)
+
+            output_ingest.clear_outputs(db, self.backtest_id)
+            self.assertEqual(db.query(BacktestChartPoint).count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
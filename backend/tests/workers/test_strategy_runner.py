@@ -0,0 +1,80 @@
+import subprocess
+import tempfile
+import threading
+import unittest
+import warnings
+from pathlib import Path
+
+from app.workers.strategy_runner import PreforkRunnerPool
+
+
+class TestPreforkRunnerPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = PreforkRunnerPool()
+
+    def tearDown(self) -> None:
+        self.pool.close()
+
+    def _write_strategy(self, code: str) -> tuple[Path, Path]:
+        work_dir = Path(tempfile.mkdtemp(prefix="bt_test_"))
+        code_path = work_dir / "strategy.py"
+        code_path.write_text(code, encoding="utf-8")
+        return code_path, work_dir
+
+    def test_run_captures_output_and_input_dir(self) -> None:
+        code_path, work_dir = self._write_strategy(
+            "import sys\n"
+            "from app.workers.data_loader import get_input_dir\n"
+            "print(get_input_dir())\n"
+            "print('warn', file=sys.stderr)\n"
+        )
+        result = self.pool.run(code_path, work_dir, timeout=10)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), str(work_dir))
+        self.assertEqual(result.stderr.strip(), "warn")
+
+    def test_failure_is_isolated_per_run(self) -> None:
+        code_path, work_dir = self._write_strategy("import json\njson.loads = None\nraise RuntimeError('boom')\n")
+        result = self.pool.run(code_path, work_dir, timeout=10)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("RuntimeError: boom", result.stderr)
+
+        # 前回の実行で書き換えたモジュール状態は引き継がれない
+        code_path, work_dir = self._write_strategy("import json\nprint(json.loads('1'))\n")
+        result = self.pool.run(code_path, work_dir, timeout=10)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "1")
+
+    def test_exit_code_is_propagated(self) -> None:
+        code_path, work_dir = self._write_strategy("import sys\nsys.exit(3)\n")
+        result = self.pool.run(code_path, work_dir, timeout=10)
+        self.assertEqual(result.returncode, 3)
+
+    def test_timeout_kills_runner(self) -> None:
+        code_path, work_dir = self._write_strategy("import time\ntime.sleep(30)\n")
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run(code_path, work_dir, timeout=0.5)
+
+        code_path, work_dir = self._write_strategy("print('ok')\n")
+        result = self.pool.run(code_path, work_dir, timeout=10)
+        self.assertEqual(result.stdout.strip(), "ok")
+
+    def test_runs_without_forking_the_threaded_worker(self) -> None:
+        # ワーカーにはハートビート・出力の取り込みのスレッドがあるので、実行時にワーカー自身は fork しない
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                code_path, work_dir = self._write_strategy("print('ok')\n")
+                result = self.pool.run(code_path, work_dir, timeout=10)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(result.stdout.strip(), "ok")
+        self.assertEqual([w for w in caught if "fork" in str(w.message)], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from sqlalchemy import StaticPool, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.features.backtesting.models import BacktestRun, BacktestStatus, BacktestTask, OptimizationRun, TaskStatus
+from app.features.strategies.models import Strategy, StrategyVersion
+from app.workers import backtest_executor, task_queue, worker_process
+
+
+class TestTaskQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        for module in (task_queue, backtest_executor):
+            patcher = mock.patch.object(module, "SessionLocal", self.SessionLocal)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        env = mock.patch.dict(os.environ, {"BACKTEST_TASK_MAX_ATTEMPTS": "2", "BACKTEST_TASK_RETRY_BACKOFF": "0"})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(task_queue.set_task_signal, None)
+
+        with self.SessionLocal() as db:
+            strategy = Strategy(name="Queue Strategy")
+            db.add(strategy)
+            db.flush()
+            version = StrategyVersion(strategy_id=strategy.id, version_number=1, template_json={})
+            db.add(version)
+            db.flush()
+            self.run_ids = []
+            for _ in range(3):
+                run = BacktestRun(
+                    strategy_version_id=version.id,
+                    data_source_id=strategy.id,
+                    timeframe="1h",
+                    start_time=datetime(2024, 1, 1),
+                    end_time=datetime(2024, 2, 1),
+                )
+                db.add(run)
+                db.flush()
+                self.run_ids.append(run.id)
+            db.commit()
+
+    def test_priority_order_and_completion(self) -> None:
+        task_queue.enqueue_backtest(self.run_ids[0], priority=0)
+        task_queue.enqueue_backtest(self.run_ids[1], priority=5)
+
+        first = task_queue.claim_task("w1")
+        second = task_queue.claim_task("w2")
+        self.assertEqual((first.backtest_id, second.backtest_id), (self.run_ids[1], self.run_ids[0]))
+        self.assertIsNone(task_queue.claim_task("w3"))
+
+        task_queue.complete_task(first.id)
+        with self.SessionLocal() as db:
+            self.assertIsNone(db.get(BacktestTask, first.id))
+
+    def test_expired_lease_is_reclaimed_then_given_up(self) -> None:
+        task_queue.enqueue_backtest(self.run_ids[0])
+        with mock.patch.dict(os.environ, {"BACKTEST_TASK_LEASE_SECONDS": "-1"}):
+            self.assertEqual(task_queue.claim_task("w1").attempts, 1)
+            self.assertEqual(task_queue.claim_task("w2").attempts, 2)
+            # 上限を超えたタスクは失敗とし、バックテストも失敗にする
+            self.assertIsNone(task_queue.claim_task("w3"))
+
+        with self.SessionLocal() as db:
+            self.assertEqual(db.query(BacktestTask).one().status, TaskStatus.failed)
+            self.assertEqual(db.get(BacktestRun, self.run_ids[0]).status, BacktestStatus.failed)
+
+    def test_fail_task_retries_with_backoff(self) -> None:
+        task_queue.enqueue_backtest(self.run_ids[0])
+        task = task_queue.claim_task("w1")
+        with mock.patch.dict(os.environ, {"BACKTEST_TASK_RETRY_BACKOFF": "60"}):
+            task_queue.fail_task(task.id, "boom")
+        self.assertIsNone(task_queue.claim_task("w1"))
+
+        with self.SessionLocal() as db:
+            db.get(BacktestTask, task.id).available_at = datetime.now() - timedelta(seconds=1)
+            db.commit()
+        retried = task_queue.claim_task("w1")
+        self.assertEqual(retried.attempts, 2)
+
+        task_queue.fail_task(retried.id, "boom")
+        with self.SessionLocal() as db:
+            self.assertEqual(db.get(BacktestTask, task.id).status, TaskStatus.failed)
+
+    def test_failed_execution_is_retried(self) -> None:
+        with self.SessionLocal() as db:
+            db.get(BacktestRun, self.run_ids[0]).strategy_version.generated_code = "pass"
+            db.commit()
+        task_queue.enqueue_backtest(self.run_ids[0])
+
+        # 1回目はデータの準備が一時的に失敗し、2回目で成功する
+        patches = [
+            mock.patch.object(backtest_executor, "get_db", lambda: iter([self.SessionLocal()])),
+            mock.patch.object(
+                backtest_executor, "prepare_input_data", side_effect=[OSError("data store unavailable"), None]
+            ),
+            mock.patch.object(backtest_executor, "run_template_backtest", return_value=({"final_value": 1.0}, [], [])),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        task = task_queue.claim_task("w1")
+        self.assertFalse(worker_process.run_task(task, "w1"))
+        with self.SessionLocal() as db:
+            queued = db.get(BacktestTask, task.id)
+            self.assertEqual((queued.status, queued.last_error), (TaskStatus.queued, "data store unavailable"))
+            self.assertEqual(db.get(BacktestRun, self.run_ids[0]).status, BacktestStatus.pending)
+
+        retried = task_queue.claim_task("w1")
+        self.assertEqual((retried.id, retried.attempts), (task.id, 2))
+        self.assertTrue(worker_process.run_task(retried, "w1"))
+        with self.SessionLocal() as db:
+            self.assertIsNone(db.get(BacktestTask, task.id))
+            self.assertEqual(db.get(BacktestRun, self.run_ids[0]).status, BacktestStatus.success)
+
+    def test_timeout_fails_without_retry(self) -> None:
+        with self.SessionLocal() as db:
+            db.get(BacktestRun, self.run_ids[0]).strategy_version.generated_code = "pass"
+            db.commit()
+        task_queue.enqueue_backtest(self.run_ids[0])
+
+        # 毎回時間切れになる戦略は再実行しない
+        patches = [
+            mock.patch.object(backtest_executor, "get_db", lambda: iter([self.SessionLocal()])),
+            mock.patch.object(backtest_executor, "prepare_input_data"),
+            mock.patch.object(backtest_executor, "run_template_backtest", return_value=None),
+            mock.patch.object(
+                backtest_executor, "run_strategy", side_effect=subprocess.TimeoutExpired(["strategy.py"], 60)
+            ),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        task = task_queue.claim_task("w1")
+        self.assertTrue(worker_process.run_task(task, "w1"))
+        with self.SessionLocal() as db:
+            self.assertIsNone(db.get(BacktestTask, task.id))
+            run = db.get(BacktestRun, self.run_ids[0])
+            self.assertEqual(run.status, BacktestStatus.failed)
+            self.assertIn("timed out", run.error_message)
+        self.assertIsNone(task_queue.claim_task("w1"))
+
+    def test_shared_dataset_is_removed_when_last_run_finishes(self) -> None:
+        with self.SessionLocal() as db:
+            first = db.get(BacktestRun, self.run_ids[0])
+            first.strategy_version.generated_code = "pass"
+            opt = OptimizationRun(
+                strategy_version_id=first.strategy_version_id,
+                data_source_id=first.data_source_id,
+                timeframe="1h",
+                start_time=datetime(2024, 1, 1),
+                end_time=datetime(2024, 2, 1),
+                parameter_space={},
+                combination_count=2,
+                objective="final_value",
+            )
+            db.add(opt)
+            db.flush()
+            for run_id in self.run_ids[:2]:
+                db.get(BacktestRun, run_id).optimization_id = opt.id
+            db.commit()
+            key = f"opt_{opt.id}"
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        dataset_dir = Path(directory.name) / key
+        dataset_dir.mkdir()
+        patches = [
+            mock.patch.dict(os.environ, {"BACKTEST_DATASET_DIR": directory.name}),
+            mock.patch.object(backtest_executor, "get_db", lambda: iter([self.SessionLocal()])),
+            mock.patch.object(backtest_executor, "prepare_input_data"),
+            mock.patch.object(backtest_executor, "run_template_backtest", return_value=({"final_value": 1.0}, [], [])),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        task_queue.enqueue_backtests(self.run_ids[:2])
+
+        # 状態を取得しなくても、最後の実行が終わった時点で削除する
+        self.assertTrue(worker_process.run_task(task_queue.claim_task("w1"), "w1"))
+        self.assertTrue(dataset_dir.exists())
+        self.assertTrue(worker_process.run_task(task_queue.claim_task("w1"), "w1"))
+        self.assertFalse(dataset_dir.exists())
+
+    def test_recover_pending_runs(self) -> None:
+        task_queue.enqueue_backtest(self.run_ids[0])
+        task_queue.claim_task("dead-worker")
+        with self.SessionLocal() as db:
+            db.get(BacktestRun, self.run_ids[2]).status = BacktestStatus.success
+            db.commit()
+
+        self.assertEqual(task_queue.recover_pending_runs(), 1)
+        claimed = {task_queue.claim_task("w").backtest_id for _ in range(2)}
+        self.assertEqual(claimed, set(self.run_ids[:2]))
+
+    def test_enqueue_wakes_waiting_worker(self) -> None:
+        task_queue.set_task_signal(multiprocessing.Semaphore(0))
+        result = {}
+
+        def wait() -> None:
+            result["task"] = task_queue.dequeue_backtest("w1", timeout=5)
+            result["at"] = time.monotonic()
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.2)
+        enqueued_at = time.monotonic()
+        task_queue.enqueue_backtest(self.run_ids[0])
+        waiter.join()
+
+        # タイムアウトを待たずに通知で起きる
+        self.assertEqual(result["task"].backtest_id, self.run_ids[0])
+        self.assertLess(result["at"] - enqueued_at, 0.5)
+
+    def test_claimed_tasks_consume_their_notifications(self) -> None:
+        signal = multiprocessing.Semaphore(0)
+        task_queue.set_task_signal(signal)
+        task_queue.enqueue_backtests(self.run_ids[:2])
+
+        self.assertIsNotNone(task_queue.dequeue_backtest("w1", timeout=0.1))
+        self.assertIsNotNone(task_queue.dequeue_backtest("w1", timeout=0.1))
+
+        # 取得済みのタスクの通知が残っていると、待機中のワーカーが待たずに空振りする
+        self.assertFalse(signal.acquire(False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from collections.abc import Iterator
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from app.workers.vector_engine import UnsupportedTemplate, run_vector_backtest
+
+
+def sma(name: str, period: str, method: str = "sma") -> dict:
+    return {
+        "name": name,
+        "expression": {
+            "type": "aggregation",
+            "method": {"type": "aggregationType", "value": method},
+            "source": {"type": "price", "source": "close"},
+            "period": {"type": "param", "name": period},
+        },
+    }
+
+
+def cross(direction: str) -> dict:
+    return {
+        "type": "cross",
+        "direction": direction,
+        "left": {"type": "variable", "name": "fast"},
+        "right": {"type": "variable", "name": "slow"},
+    }
+
+
+CROSS_TEMPLATE = {
+    "variables": [sma("fast", "fast"), sma("slow", "slow")],
+    "entry": [
+        {"type": "long", "condition": cross("cross_over")},
+        {"type": "short", "condition": cross("cross_under")},
+    ],
+    "exit": [
+        {"type": "long", "condition": cross("cross_under")},
+        {"type": "short", "condition": cross("cross_over")},
+    ],
+    "riskManagement": {"type": "fixed", "lotSize": 10},
+}
+
+CLOSE = {"type": "scalar_price", "source": "close"}
+EMA = {"type": "variable", "name": "trend"}
+
+TREND_TEMPLATE = {
+    "variables": [sma("trend", "period", "ema")],
+    "entry": [
+        {
+            "type": "long",
+            "condition": {
+                "type": "group",
+                "operator": "and",
+                "conditions": [
+                    {"type": "comparison", "operator": ">", "left": CLOSE, "right": EMA},
+                    {"type": "state", "state": "rising", "operand": {"type": "price", "source": "close"}},
+                ],
+            },
+        }
+    ],
+    "exit": [{"type": "long", "condition": {"type": "comparison", "operator": "<", "left": CLOSE, "right": EMA}}],
+    "riskManagement": {"type": "percentage", "percent": 50},
+}
+
+
+class CrossReference(bt.Strategy):
+    params = (("fast", 5), ("slow", 20))
+
+    def __init__(self) -> None:
+        fast = bt.ind.SMA(self.data.close, period=self.p.fast)
+        slow = bt.ind.SMA(self.data.close, period=self.p.slow)
+        self.cross = bt.ind.CrossOver(fast, slow)
+        self.pnls: list[float] = []
+
+    def next(self) -> None:
+        if not self.position:
+            if self.cross[0] > 0:
+                self.buy(size=10)
+            elif self.cross[0] < 0:
+                self.sell(size=10)
+        elif (self.position.size > 0 and self.cross[0] < 0) or (self.position.size < 0 and self.cross[0] > 0):
+            self.close()
+
+    def notify_trade(self, trade: bt.Trade) -> None:
+        if trade.isclosed:
+            self.pnls.append(trade.pnl)
+
+
+class TrendReference(bt.Strategy):
+    params = (("period", 30),)
+
+    def __init__(self) -> None:
+        self.ema = bt.ind.EMA(self.data.close, period=self.p.period)
+        self.pnls: list[float] = []
+
+    def next(self) -> None:
+        close = self.data.close
+        if not self.position:
+            if close[0] > self.ema[0] and close[0] > close[-1]:
+                self.buy()
+        elif close[0] < self.ema[0]:
+            self.close()
+
+    def notify_trade(self, trade: bt.Trade) -> None:
+        if trade.isclosed:
+            self.pnls.append(trade.pnl)
+
+
+def run_backtrader(df: pd.DataFrame, strategy: type[bt.Strategy], sizer_percent: float | None = None, **params):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df))
+    cerebro.addstrategy(strategy, **params)
+    cerebro.broker.setcash(100000.0)
+    cerebro.broker.set_coc(True)
+    if sizer_percent is not None:
+        cerebro.addsizer(bt.sizers.PercentSizer, percents=sizer_percent)
+    result = cerebro.run()[0]
+    return cerebro.broker.getvalue(), result.pnls
+
+
+class TestVectorEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(42)
+        close = 100 + np.cumsum(rng.normal(0, 0.5, 3000))
+        open_ = np.r_[close[0], close[:-1]]
+        self.df = pd.DataFrame(
+            {
+                "open": open_,
+                "high": np.maximum(open_, close) + 0.1,
+                "low": np.minimum(open_, close) - 0.1,
+                "close": close,
+                "volume": rng.integers(1, 100, 3000).astype(np.float64),
+            },
+            index=pd.date_range("2024-01-01", periods=3000, freq="1min", name="datetime"),
+        )
+
+    def assert_matches(self, summary: dict, trades: Iterator[dict], final_value: float, pnls: list[float]) -> None:
+        self.assertGreater(len(pnls), 10)
+        self.assertEqual(summary["trade_count"], len(pnls))
+        np.testing.assert_allclose([t["pnl"] for t in trades], pnls, rtol=1e-9, atol=1e-6)
+        self.assertAlmostEqual(summary["final_value"], final_value, places=4)
+
+    def test_cross_template_matches_backtrader(self) -> None:
+        params = {"fast": 5, "slow": 20, "initial_cash": 100000}
+        summary, trades, chart = run_vector_backtest(CROSS_TEMPLATE, self.df, params)
+        final_value, pnls = run_backtrader(self.df, CrossReference, fast=5, slow=20)
+        self.assert_matches(summary, trades, final_value, pnls)
+        # 出力は書き込み側が読み進めるジェネレータ
+        chart = list(chart)
+        self.assertEqual(len(chart), len(self.df))
+        self.assertEqual(chart[-1]["time"], "2024-01-03T01:59:00")
+
+    def test_trend_template_with_percentage_sizing_matches_backtrader(self) -> None:
+        params = {"period": 30, "initial_cash": 100000}
+        summary, trades, _ = run_vector_backtest(TREND_TEMPLATE, self.df, params)
+        final_value, pnls = run_backtrader(self.df, TrendReference, sizer_percent=50, period=30)
+        self.assert_matches(summary, trades, final_value, pnls)
+
+    def test_unsupported_template(self) -> None:
+        template = dict(CROSS_TEMPLATE, positionManagement={"stopLoss": {"enabled": True, "limit": 10}})
+        with self.assertRaises(UnsupportedTemplate):
+            run_vector_backtest(template, self.df, {"fast": 5, "slow": 20})
+        with self.assertRaises(UnsupportedTemplate):
+            run_vector_backtest(CROSS_TEMPLATE, self.df, {"fast": 5})
+
+
+if __name__ == "__main__":
+    unittest.main()